@@ -0,0 +1,269 @@
+import os
+import heapq
+import threading
+import yaml
+import mysql.connector
+from datetime import date, datetime, time, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from loggers.custom_logger import get_logger
+
+logger = get_logger(__name__)
+
+BASE_URL = os.path.join(os.path.dirname(__file__), '..')
+CONFIG_PATH = os.path.join(BASE_URL, 'constants', 'config.yaml')
+
+with open(CONFIG_PATH, 'r') as file:
+    config = yaml.safe_load(file)
+    RECEIPTS_TABLE = config['database']['tables']['receipts']
+    STOCK_TABLE = config['database']['tables']['stock']
+    expiry_config = config.get('expiry', {})
+    EXPIRY_LEAD_DAYS = expiry_config.get('lead_days', 2)
+    EXPIRY_HORIZON_DAYS = expiry_config.get('horizon_days', 14)
+    EXPIRY_GRACE_DAYS = expiry_config.get('grace_days', 7)
+
+ExpiryKey = Tuple[str, int]  # (source table, row id)
+
+
+def _as_datetime(value) -> datetime:
+    if isinstance(value, datetime):
+        return value
+    return datetime.combine(value, time.min)
+
+
+class ExpiryIndex:
+    """Absolute expiry timestamps for receipt and stock items, plus an in-memory watcher.
+
+    Receipt rows already carry ``expiration_date``. Stock rows get an
+    ``expires_at`` column (``created_at + shelf_life`` days); rows stored before
+    the column existed are filled by ``scripts/backfill_expires_at.py``. Both are indexed by ``(user_id, expiry)`` for per-user range lookups
+    and by expiry alone for the watcher's cross-user horizon scan.
+
+    The watcher is a min-heap of alert times (expiry minus ``lead_days``) for
+    items expiring within ``horizon_days``. It lives in the process that runs
+    the ``load``/``poll`` jobs (the scheduler leader). Other workers never
+    call ``load`` and keep no heap. ``poll`` pops due entries, drops ones
+    whose row is gone or has changed, and emits one event per item to the
+    subscribers.
+    """
+
+    def __init__(self, db_config: Dict, lead_days: int = EXPIRY_LEAD_DAYS, horizon_days: int = EXPIRY_HORIZON_DAYS):
+        self.db_config = db_config
+        self.lead = timedelta(days=lead_days)
+        self.horizon_days = horizon_days
+        self._lock = threading.Lock()
+        self._heap: List[Tuple[datetime, ExpiryKey]] = []
+        self._alert_at: Dict[ExpiryKey, datetime] = {}
+        self._emitted: Dict[ExpiryKey, datetime] = {}
+        self._subscribers: List[Callable[[Dict], None]] = []
+        self.watching = False
+        self.ensure_schema()
+
+    def _connect(self):
+        return mysql.connector.connect(**self.db_config)
+
+    @staticmethod
+    def _has(cursor, kind: str, table: str, name: str) -> bool:
+        if kind == 'column':
+            cursor.execute("SELECT COUNT(*) FROM information_schema.columns "
+                           "WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s", (table, name))
+        else:
+            cursor.execute("SELECT COUNT(*) FROM information_schema.statistics "
+                           "WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s", (table, name))
+        return cursor.fetchone()[0] > 0
+
+    def ensure_schema(self) -> None:
+        conn = None
+        cursor = None
+        try:
+            conn = self._connect()
+            cursor = conn.cursor()
+            if not self._has(cursor, 'column', STOCK_TABLE, 'expires_at'):
+                cursor.execute(f"ALTER TABLE {STOCK_TABLE} ADD COLUMN expires_at DATETIME NULL")
+                logger.info(f"Added expires_at column to {STOCK_TABLE}")
+            indexes = [
+                (RECEIPTS_TABLE, f'idx_{RECEIPTS_TABLE}_user_expiration', 'user_id, expiration_date'),
+                (RECEIPTS_TABLE, f'idx_{RECEIPTS_TABLE}_expiration', 'expiration_date'),
+                (STOCK_TABLE, f'idx_{STOCK_TABLE}_user_expires', 'user_id, expires_at'),
+                (STOCK_TABLE, f'idx_{STOCK_TABLE}_expires', 'expires_at'),
+            ]
+            for table, index_name, columns in indexes:
+                if not self._has(cursor, 'index', table, index_name):
+                    cursor.execute(f"ALTER TABLE {table} ADD INDEX {index_name} ({columns})")
+                    logger.info(f"Added index {index_name}")
+            conn.commit()
+        except mysql.connector.Error as e:
+            logger.error(f"Error creating expiry schema: {e}")
+            raise RuntimeError(f"Error creating expiry schema: {e}")
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                conn.close()
+
+    def _range_query(self, where_receipts: str, where_stock: str) -> str:
+        return (f"SELECT '{RECEIPTS_TABLE}' AS source, id, user_id, name, quantity, expiration_date AS expires_at "
+                f"FROM {RECEIPTS_TABLE} WHERE {where_receipts} "
+                f"UNION ALL "
+                f"SELECT '{STOCK_TABLE}' AS source, id, user_id, name, quantity, expires_at "
+                f"FROM {STOCK_TABLE} WHERE {where_stock} "
+                f"ORDER BY expires_at")
+
+    def expiring_within(self, user_id: int, days: int = 7, today: Optional[date] = None) -> List[Dict]:
+        """Receipt and stock items of a user expiring before ``today + days`` (index range scans).
+
+        Items that expired more than ``grace_days`` ago are left out.
+        """
+        return self.expiring_for_users([user_id], days, today).get(user_id, [])
+
+    def expiring_for_users(self, user_ids: List[int], days: int = 7, today: Optional[date] = None,
+                           grace_days: int = EXPIRY_GRACE_DAYS) -> Dict[int, List[Dict]]:
+        """``expiring_within`` for many users in one query, keyed by user id."""
+        if not user_ids:
+            return {}
+        today = today or date.today()
+        since = today - timedelta(days=grace_days)
+        cutoff = today + timedelta(days=days)
+        placeholders = ", ".join(["%s"] * len(user_ids))
+        conn = None
+        cursor = None
+        try:
+            conn = self._connect()
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute(
+                self._range_query(f"user_id IN ({placeholders}) AND expiration_date >= %s AND expiration_date < %s",
+                                  f"user_id IN ({placeholders}) AND expires_at >= %s AND expires_at < %s"),
+                (*user_ids, since, cutoff, *user_ids, since, cutoff)
+            )
+            result: Dict[int, List[Dict]] = {}
+            for row in cursor.fetchall():
+                result.setdefault(row['user_id'], []).append({
+                    'name': row['name'],
+                    'quantity': row['quantity'],
+                    'expiration_date': _as_datetime(row['expires_at']).strftime('%Y-%m-%d'),
+                    'source': 'stock' if row['source'] == STOCK_TABLE else 'receipt',
+                })
+            return result
+        except mysql.connector.Error as e:
+            logger.error(f"Error fetching expiring items for users {user_ids[0]}..{user_ids[-1]}: {e}")
+            raise RuntimeError(f"Error fetching expiring items: {e}")
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                conn.close()
+
+    # --- watcher ---------------------------------------------------------------
+
+    def subscribe(self, callback: Callable[[Dict], None]) -> None:
+        """Register ``callback(event)`` for expiry events emitted by ``poll``."""
+        self._subscribers.append(callback)
+
+    def _push(self, key: ExpiryKey, expires_at: datetime) -> None:
+        alert_at = expires_at - self.lead
+        self._alert_at[key] = alert_at
+        heapq.heappush(self._heap, (alert_at, key))
+
+    def load(self, user_id: Optional[int] = None) -> int:
+        """(Re)load upcoming expirations within the horizon, for one user or everyone."""
+        now = datetime.now()
+        until = now + timedelta(days=self.horizon_days)
+        user_filter = " AND user_id = %s" if user_id is not None else ""
+        user_params = (user_id,) if user_id is not None else ()
+        params = (now.date(), until.date(), *user_params, now, until, *user_params)
+        conn = None
+        cursor = None
+        try:
+            conn = self._connect()
+            cursor = conn.cursor()
+            cursor.execute(self._range_query(
+                f"expiration_date >= %s AND expiration_date < %s{user_filter}",
+                f"expires_at >= %s AND expires_at < %s{user_filter}"), params)
+            rows = cursor.fetchall()
+        except mysql.connector.Error as e:
+            logger.error(f"Error loading upcoming expirations: {e}")
+            raise RuntimeError(f"Error loading upcoming expirations: {e}")
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                conn.close()
+
+        with self._lock:
+            if user_id is None:
+                self.watching = True
+                self._heap, self._alert_at = [], {}
+                self._emitted = {key: alert_at for key, alert_at in self._emitted.items() if alert_at + self.lead > now}
+            for source, row_id, _, _, _, expires_at in rows:
+                key = (source, row_id)
+                expires_at = _as_datetime(expires_at)
+                # Do not re-announce an item whose alert already fired for this expiry
+                if self._emitted.get(key) != expires_at - self.lead:
+                    self._push(key, expires_at)
+        logger.debug(f"Expiry watcher loaded {len(rows)} items" + (f" for user {user_id}" if user_id else ""))
+        return len(rows)
+
+    def refresh_user(self, user_id: int) -> None:
+        """Queue a user's new items after an upload; failures are logged, never raised to the request."""
+        if not self.watching:
+            return
+        try:
+            self.load(user_id)
+        except RuntimeError as e:
+            logger.warning(f"Expiry watcher refresh failed for user {user_id}: {e}")
+
+    def _live_rows(self, keys: List[ExpiryKey]) -> Dict[ExpiryKey, Tuple]:
+        """Current rows for popped keys; deleted rows are simply missing."""
+        live = {}
+        conn = None
+        cursor = None
+        try:
+            conn = self._connect()
+            cursor = conn.cursor()
+            for source, column in ((RECEIPTS_TABLE, 'expiration_date'), (STOCK_TABLE, 'expires_at')):
+                ids = [row_id for table, row_id in keys if table == source]
+                if not ids:
+                    continue
+                cursor.execute(f"SELECT id, user_id, name, quantity, {column} FROM {source} "
+                               f"WHERE id IN ({', '.join(['%s'] * len(ids))})", ids)
+                for row_id, user_id, name, quantity, expires_at in cursor.fetchall():
+                    live[(source, row_id)] = (user_id, name, quantity, _as_datetime(expires_at))
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                conn.close()
+        return live
+
+    def poll(self, now: Optional[datetime] = None) -> List[Dict]:
+        """Pop every entry whose alert time has passed and emit one event per live item."""
+        now = now or datetime.now()
+        with self._lock:
+            due = []
+            while self._heap and self._heap[0][0] <= now:
+                alert_at, key = heapq.heappop(self._heap)
+                if self._alert_at.get(key) == alert_at:
+                    del self._alert_at[key]
+                    due.append((key, alert_at))
+        if not due:
+            return []
+
+        live = self._live_rows([key for key, _ in due])
+        events = []
+        for key, alert_at in due:
+            row = live.get(key)
+            if row is None or row[3] - self.lead != alert_at:
+                continue  # deleted or re-dated since it was queued
+            user_id, name, quantity, expires_at = row
+            self._emitted[key] = alert_at
+            events.append({'user_id': user_id, 'name': name, 'quantity': quantity,
+                           'expires_at': expires_at, 'source': 'stock' if key[0] == STOCK_TABLE else 'receipt'})
+        for event in events:
+            for callback in self._subscribers:
+                try:
+                    callback(event)
+                except Exception as e:
+                    logger.error(f"Expiry subscriber failed: {e}", exc_info=True)
+        if events:
+            logger.info(f"Emitted {len(events)} expiry events")
+        return events
@@ -0,0 +1,155 @@
+import os
+import json
+import sqlite3
+import hashlib
+import yaml
+from datetime import datetime
+from typing import Optional, List, Dict, Any
+
+from loggers.custom_logger import get_logger
+from loggers.metrics import CACHE_LOOKUPS
+
+logger = get_logger(__name__)
+
+BASE_URL = os.path.join(os.path.dirname(__file__), '..')
+CONFIG_PATH = os.path.join(BASE_URL, 'constants', 'config.yaml')
+
+with open(CONFIG_PATH, 'r') as file:
+    config = yaml.safe_load(file)
+    cache_config = config.get('extraction_cache', {})
+    CACHE_ENABLED = cache_config.get('enabled', True)
+    CACHE_PATH = os.path.join(BASE_URL, cache_config.get('path', 'database/extraction_cache.db'))
+
+
+def hash_image(image_data: bytes) -> str:
+    """Content hash used as the cache key for an uploaded image."""
+    return hashlib.sha256(image_data).hexdigest()
+
+
+def hash_image_file(image_path: str, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(image_path, "rb") as img_file:
+        for chunk in iter(lambda: img_file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ExtractionCache:
+    """Persistent cache of Gemini extraction results.
+
+    Entries are keyed by (image hash, model name, prompt version) and keep the
+    raw model text alongside the parsed items, so validation can be re-run
+    locally without another API call. Only replies that parsed are stored; an
+    entry that no longer parses is deleted so the next upload asks Gemini again.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, enabled: bool = CACHE_ENABLED):
+        self.path = path
+        self.enabled = enabled
+        if self.enabled:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self.create_cache_table()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def create_cache_table(self):
+        conn = self._connect()
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS extractions (
+                    image_hash TEXT NOT NULL,
+                    model_name TEXT NOT NULL,
+                    prompt_version TEXT NOT NULL,
+                    raw_text TEXT NOT NULL,
+                    parsed_items TEXT,
+                    created_at TEXT NOT NULL,
+                    updated_at TEXT NOT NULL,
+                    PRIMARY KEY (image_hash, model_name, prompt_version)
+                )
+            """)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def get(self, image_hash: str, model_name: str, prompt_version: str) -> Optional[Dict[str, Any]]:
+        """Return the cached entry or None on a miss."""
+        if not self.enabled:
+            return None
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT raw_text, parsed_items FROM extractions "
+                "WHERE image_hash = ? AND model_name = ? AND prompt_version = ?",
+                (image_hash, model_name, prompt_version)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"Extraction cache lookup failed: {e}")
+            return None
+        finally:
+            conn.close()
+        CACHE_LOOKUPS.labels('extraction', 'hit' if row else 'miss').inc()
+        if not row:
+            return None
+        return {
+            "raw_text": row[0],
+            "parsed_items": json.loads(row[1]) if row[1] is not None else None
+        }
+
+    def put(self, image_hash: str, model_name: str, prompt_version: str,
+            raw_text: str, parsed_items: Optional[List[Dict[str, Any]]] = None):
+        """Store (or refresh) a model reply that parsed, with its parsed items."""
+        if not self.enabled:
+            return
+        now = datetime.now().isoformat(timespec='seconds')
+        conn = self._connect()
+        try:
+            conn.execute("""
+                INSERT INTO extractions (image_hash, model_name, prompt_version, raw_text, parsed_items, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (image_hash, model_name, prompt_version)
+                DO UPDATE SET raw_text = excluded.raw_text,
+                              parsed_items = excluded.parsed_items,
+                              updated_at = excluded.updated_at
+            """, (image_hash, model_name, prompt_version, raw_text,
+                  json.dumps(parsed_items) if parsed_items is not None else None, now, now))
+            conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Extraction cache write failed: {e}")
+        finally:
+            conn.close()
+
+    def delete(self, image_hash: str, model_name: str, prompt_version: str):
+        """Evict an entry, e.g. one whose raw text fails to parse."""
+        if not self.enabled:
+            return
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM extractions WHERE image_hash = ? AND model_name = ? AND prompt_version = ?",
+                         (image_hash, model_name, prompt_version))
+            conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Extraction cache delete failed: {e}")
+        finally:
+            conn.close()
+
+    def update_parsed(self, image_hash: str, model_name: str, prompt_version: str,
+                      parsed_items: Optional[List[Dict[str, Any]]]):
+        """Replace the parsed items of an existing entry after local re-validation."""
+        if not self.enabled:
+            return
+        conn = self._connect()
+        try:
+            conn.execute(
+                "UPDATE extractions SET parsed_items = ?, updated_at = ? "
+                "WHERE image_hash = ? AND model_name = ? AND prompt_version = ?",
+                (json.dumps(parsed_items) if parsed_items is not None else None,
+                 datetime.now().isoformat(timespec='seconds'), image_hash, model_name, prompt_version)
+            )
+            conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Extraction cache update failed: {e}")
+        finally:
+            conn.close()
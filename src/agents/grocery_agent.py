@@ -10,7 +10,14 @@ from dotenv import load_dotenv
 from mysql.connector import pooling
 
 
-from loggers.custom_logger import logger
+from loggers.custom_logger import get_logger
+from loggers.tracing import span
+from db_managers.bulk_writer import BulkWriter
+from agents.extraction_cache import ExtractionCache, hash_image
+from agents.product_normalizer import ProductNormalizer
+from agents.inventory_ledger import InventoryLedger
+
+logger = get_logger(__name__)
 
 # Load environment variables and configuration
 load_dotenv()
@@ -35,6 +42,22 @@ DB_CONFIG = {
     "port": PORT
 }
 
+# Bump RECEIPT_PROMPT_VERSION whenever RECEIPT_PROMPT changes so cached extractions are not reused
+RECEIPT_PROMPT_VERSION = "receipt-v1"
+RECEIPT_PROMPT = (
+        "Extract all grocery items from the receipt image and format the information as structured data. "
+        "Each item should include: name, quantity, weight, category, price, purchase_date, expiration_date. "
+        "Details: "
+        "1. name: The name of the grocery item. "
+        "2. quantity: Default to 1 if not provided. "
+        "3. weight: Default to 1.0 if not provided. "
+        "4. category: Categorize (e.g., fruit, vegetable, confectionery, bakery, dairy). "
+        "5. price: Extract as float; default to 0.0 if unknown. "
+        "6. purchase_date: Extract as YYYY-MM-DD string. "
+        "7. expiration_date: Estimate based on purchase_date as YYYY-MM-DD. as string "
+        "Return the data in JSON format."
+    )
+
 # Pydantic Model for Grocery Item
 class GroceryItem(BaseModel):
     name: str = Field(..., description="Name of the grocery item")
@@ -54,6 +77,37 @@ class GroceryItem(BaseModel):
         except ValueError:
             raise ValueError(f"Invalid date format: {value}. Expected format: YYYY-MM-DD.")
 
+
+def parse_receipt_response(raw_data):
+    """Parse and validate the raw Gemini text for a receipt into a list of item dicts."""
+    raw_data = raw_data.strip()
+    if raw_data.startswith("```json") and raw_data.endswith("```"):
+        raw_data = raw_data[7:-3].strip()
+
+    parsed_data = json.loads(raw_data)
+    if not isinstance(parsed_data, list):
+        logger.error("Expected a list of items in the JSON response.")
+        raise ValueError("Expected a list of items in the JSON response.")
+
+    processed_data = []
+    for item in parsed_data:
+        if not all(key in item for key in ["name", "quantity", "weight", "category","price", "purchase_date", "expiration_date"]):
+            logger.error(f"Missing keys in item: {item}")
+            raise ValueError(f"Missing keys in item: {item}")
+
+        mapped_item = GroceryItem(
+            name=item["name"],
+            quantity=int(item.get("quantity", 1)),
+            weight=float(item.get("weight", 1.0)),
+            category=item["category"],
+            price=float(item.get("price",1.0)),
+            purchase_date=item["purchase_date"],
+            expiration_date=item["expiration_date"]
+        )
+        processed_data.append(mapped_item.model_dump())
+        logger.info(f"Processed item: {mapped_item}")
+    return processed_data
+
 #Receipt Processor Agent
 class ReceiptProcessorAgent:
     def __init__(self, api_key):
@@ -61,11 +115,16 @@ class ReceiptProcessorAgent:
         self.model_name = GEMINI_MODEL  # Use config value instead of hardcoding
         genai.configure(api_key=self.api_key)
         self.db_config = DB_CONFIG
+        self.bulk_writer = BulkWriter()
+        self.extraction_cache = ExtractionCache()
         # Initialize database schema on startup
         self.verify_users_table()
         self.create_all_receipts_db()
         self.create_db_schema()
         self.create_image_db()
+        self.product_normalizer = ProductNormalizer(self.db_config)
+        self.product_normalizer.ensure_product_column(RECEIPTS_TABLE)
+        self.inventory_ledger = InventoryLedger(self.db_config)
         
         
 
@@ -151,53 +210,29 @@ class ReceiptProcessorAgent:
                 image_data = img_file.read()
                 logger.info("Receipt image read successfully.")
 
-            prompt = (
-                    "Extract all grocery items from the receipt image and format the information as structured data. "
-                    "Each item should include: name, quantity, weight, category, price, purchase_date, expiration_date. "
-                    "Details: "
-                    "1. name: The name of the grocery item. "
-                    "2. quantity: Default to 1 if not provided. "
-                    "3. weight: Default to 1.0 if not provided. "
-                    "4. category: Categorize (e.g., fruit, vegetable, confectionery, bakery, dairy). "
-                    "5. price: Extract as float; default to 0.0 if unknown. "
-                    "6. purchase_date: Extract as YYYY-MM-DD string. "
-                    "7. expiration_date: Estimate based on purchase_date as YYYY-MM-DD. as string "
-                    "Return the data in JSON format."
-                )
+            image_hash = hash_image(image_data)
+            cached = self.extraction_cache.get(image_hash, self.model_name, RECEIPT_PROMPT_VERSION)
+            processed_data = None
+            if cached:
+                logger.info(f"Extraction cache hit for receipt image {image_hash[:12]}")
+                try:
+                    processed_data = parse_receipt_response(cached["raw_text"])
+                except (ValueError, KeyError, TypeError) as e:
+                    logger.warning(f"Evicting unparseable cached extraction {image_hash[:12]}: {e}")
+                    self.extraction_cache.delete(image_hash, self.model_name, RECEIPT_PROMPT_VERSION)
+                    cached = None
 
-            
-            model = genai.GenerativeModel(self.model_name)
-            mime_type = "image/png" if image_path.endswith(".png") else "image/jpeg"
-            response = model.generate_content([{"mime_type": mime_type, "data": image_data},prompt])
-
-           
-            raw_data = response.text.strip()
-            print(raw_data)
-            if raw_data.startswith("```json") and raw_data.endswith("```"):
-                raw_data = raw_data[7:-3].strip()
-
-            parsed_data = json.loads(raw_data)
-            if not isinstance(parsed_data, list):
-                logger.error("Expected a list of items in the JSON response.")
-                raise ValueError("Expected a list of items in the JSON response.")
-
-            processed_data = []
-            for item in parsed_data:
-                if not all(key in item for key in ["name", "quantity", "weight", "category","price", "purchase_date", "expiration_date"]):
-                    logger.error(f"Missing keys in item: {item}")
-                    raise ValueError(f"Missing keys in item: {item}")
-
-                mapped_item = GroceryItem(
-                    name=item["name"],
-                    quantity=int(item.get("quantity", 1)),
-                    weight=float(item.get("weight", 1.0)),
-                    category=item["category"],
-                    price=float(item.get("price",1.0)),
-                    purchase_date=item["purchase_date"],
-                    expiration_date=item["expiration_date"]
-                )
-                processed_data.append(mapped_item.model_dump())
-                logger.info(f"Processed item: {mapped_item}")
+            if cached is None:
+                model = genai.GenerativeModel(self.model_name)
+                mime_type = "image/png" if image_path.endswith(".png") else "image/jpeg"
+                with span('gemini', kind='external'):
+                    response = model.generate_content([{"mime_type": mime_type, "data": image_data}, RECEIPT_PROMPT])
+                raw_data = response.text.strip()
+                # Parse before caching so a malformed reply is retried on the next upload
+                processed_data = parse_receipt_response(raw_data)
+                self.extraction_cache.put(image_hash, self.model_name, RECEIPT_PROMPT_VERSION, raw_data, processed_data)
+            elif cached["parsed_items"] != processed_data:
+                self.extraction_cache.update_parsed(image_hash, self.model_name, RECEIPT_PROMPT_VERSION, processed_data)
             return processed_data
 
         except FileNotFoundError as e:
@@ -228,17 +263,19 @@ class ReceiptProcessorAgent:
                 VALUES (%s, %s, %s)""",
                 (total_amount, total_items, user_id))
             all_receipts_id = cursor.lastrowid
+            product_ids = self.product_normalizer.resolve(data)
             items_data_to_insert = [
                 (item["name"], item["quantity"], item["weight"], item["category"], item["price"],
-                item["purchase_date"], item["expiration_date"], user_id, all_receipts_id)
-                for item in data
+                item["purchase_date"], item["expiration_date"], user_id, all_receipts_id, product_id)
+                for item, product_id in zip(data, product_ids)
             ]
-            cursor.executemany(f"""
-                INSERT INTO {RECEIPTS_TABLE} (name, quantity, weight, category, price, purchase_date, expiration_date, user_id, receipt_id)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)""",
+            item_ids = self.bulk_writer.insert_rows(
+                cursor, RECEIPTS_TABLE,
+                ("name", "quantity", "weight", "category", "price", "purchase_date", "expiration_date", "user_id", "receipt_id", "product_id"),
                 items_data_to_insert)
+            self.inventory_ledger.record(cursor, RECEIPTS_TABLE, user_id, data, product_ids)
             conn.commit()
-            logger.info(f"Saved {len(data)} items to {RECEIPTS_TABLE} linked to receipt ID: {all_receipts_id}")
+            logger.info(f"Saved {len(item_ids)} items to {RECEIPTS_TABLE} linked to receipt ID: {all_receipts_id}")
             return all_receipts_id
         except mysql.connector.Error as e:
             logger.error(f"Error saving data: {e}")
@@ -257,7 +294,7 @@ class ReceiptProcessorAgent:
         try:
             conn = mysql.connector.connect(**self.db_config)
             cursor = conn.cursor()
-            query = f"""SELECT id, name, quantity, weight, category, price, purchase_date, expiration_date
+            query = f"""SELECT id, name, quantity, weight, category, price, purchase_date, expiration_date, product_id
                         FROM {RECEIPTS_TABLE}
                         WHERE user_id = %s """
             cursor.execute(query, (user_id,))
@@ -270,7 +307,8 @@ class ReceiptProcessorAgent:
                     "category": row[4],
                     "price": row[5],
                     "purchase_date": row[6].strftime("%Y-%m-%d") if row[6] else None,
-                    "expiration_date": row[7].strftime("%Y-%m-%d") if row[7] else None
+                    "expiration_date": row[7].strftime("%Y-%m-%d") if row[7] else None,
+                    "product_id": row[8]
                 }
                 for row in cursor.fetchall()
             ]
@@ -286,6 +324,7 @@ class ReceiptProcessorAgent:
         try:
             conn = mysql.connector.connect(**self.db_config)
             cursor = conn.cursor()
+            self.inventory_ledger.remove(cursor, RECEIPTS_TABLE, "user_id = %s", (user_id,))
             cursor.execute(f"DELETE FROM {RECEIPTS_TABLE} WHERE user_id = %s", (user_id,))
             logger.info(f"All receipt items deleted for user_id {user_id}.")
             cursor.execute("DELETE FROM receiptimages WHERE user_id = %s", (user_id,))
@@ -366,7 +405,7 @@ class ReceiptProcessorAgent:
             query = "SELECT image_path FROM receiptimages WHERE user_id = %s AND receipt_id = %s"
             cursor.execute(query, (user_id, last_receipt_id))
             result = cursor.fetchone()
-            logger.debug(f"Latest filename: {result[0] if result else None}")
+            logger.debug("Latest filename: %s", result[0] if result else None)
             return result[0] if result else None
         except mysql.connector.Error as e:
             logger.error(f"Error fetching latest filename: {e}")
@@ -378,7 +417,27 @@ class ReceiptProcessorAgent:
                 conn.close()
         
 
-                
+    def get_image_paths(self, user_id, receipt_id=None):
+        """Return the stored image filenames for a user, optionally limited to one receipt."""
+        try:
+            conn = mysql.connector.connect(**self.db_config)
+            cursor = conn.cursor()
+            query = "SELECT image_path FROM receiptimages WHERE user_id = %s"
+            params = [user_id]
+            if receipt_id is not None:
+                query += " AND receipt_id = %s"
+                params.append(receipt_id)
+            cursor.execute(query, params)
+            return [row[0] for row in cursor.fetchall()]
+        except mysql.connector.Error as e:
+            logger.error(f"Error fetching image paths for user_id {user_id}: {e}")
+            raise RuntimeError(f"Error fetching image paths: {e}")
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                conn.close()
+
     def get_all_receipts(self,user_id):
         """Fetch all receipts."""
         try:
@@ -405,6 +464,7 @@ class ReceiptProcessorAgent:
         try:
             conn = mysql.connector.connect(**self.db_config)
             cursor = conn.cursor()
+            self.inventory_ledger.remove(cursor, RECEIPTS_TABLE, "receipt_id = %s AND user_id = %s", (receipt_id, user_id))
             cursor.execute(f"DELETE FROM {RECEIPTS_TABLE} WHERE receipt_id = %s AND user_id = %s", (receipt_id, user_id))
             items_deleted = cursor.rowcount
             cursor.execute("DELETE FROM receiptimages WHERE receipt_id = %s AND user_id = %s", (receipt_id, user_id))
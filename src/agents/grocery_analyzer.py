@@ -1,20 +1,29 @@
 import numpy as np
-import faiss
 import yaml
 import os
 import arrow
 from sentence_transformers import SentenceTransformer
 from functools import lru_cache
 from dotenv import load_dotenv
-from loggers.custom_logger import logger
+from loggers.custom_logger import get_logger
+from loggers.tracing import span, traced
+from loggers.metrics import EMBEDDING_BATCH, count_retry
 import requests
 from flask import Flask, session, request, render_template, redirect, url_for, flash
 from wtforms import Form, StringField, validators
 from threading import Lock
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
-from typing import List, Dict, Any, Optional, Union
+from typing import List, Dict, Any, Optional, Union, Tuple
+from datetime import date
 import markdown
 from bs4 import BeautifulSoup
+from agents.prompt_builder import PromptBuilder
+from agents.knowledge_compactor import compact_knowledge
+from agents.index_factory import IndexFactory
+from agents.product_catalog import ProductCatalog, CATALOG_ENABLED
+from agents.hybrid_retriever import BM25Index, reciprocal_rank_fusion, filter_items, infer_filters, pinned_items
+
+logger = get_logger(__name__)
 
 
 
@@ -32,6 +41,11 @@ try:
         DEEPSEEK_API_URL = config['deepseek']['api_url']
         DEEPSEEK_MODEL = config['deepseek']['model']
         DEEPSEEK_API_KEY = os.getenv('DEEPSEEK_API_KEY')
+        RETRIEVAL_CANDIDATES = config['deepseek'].get('prompt', {}).get('retrieval_candidates', 12)
+        retrieval_config = config['deepseek'].get('retrieval', {})
+        RETRIEVAL_POOL = retrieval_config.get('candidate_pool', 50)
+        RRF_K = retrieval_config.get('rrf_k', 60)
+        COMPACT_KNOWLEDGE = retrieval_config.get('compact_knowledge', True)
     if not DEEPSEEK_API_KEY:
         logger.error("DEEPSEEK_API_KEY not set in environment variables")
         raise ValueError("DEEPSEEK_API_KEY is required")
@@ -69,6 +83,15 @@ class GroceryAnalyzer:
             self.embedder = SentenceTransformer('all-MiniLM-L6-v2', device='cpu')
             self.embedding_dim = self.embedder.get_sentence_embedding_dimension()
             self.user_caches: Dict[int, Dict[str, Any]] = {}
+            self.index_factory = IndexFactory(self.embedding_dim)
+            self.catalog = ProductCatalog(
+                encode=lambda names: self.embedder.encode(names, batch_size=64, show_progress_bar=False),
+                dim=self.embedding_dim
+            ) if CATALOG_ENABLED and self.index_factory.metric == 'cosine' else None
+            tokenizer = self.embedder.tokenizer
+            self.prompt_builder = PromptBuilder(
+                count_tokens=lambda text: len(tokenizer.encode(text, add_special_tokens=False))
+            )
             logger.info("GroceryAnalyzer initialized")
         except Exception as e:
             logger.error(f"GroceryAnalyzer init failed: {e}", exc_info=True)
@@ -77,99 +100,231 @@ class GroceryAnalyzer:
     def _initialize_user_cache(self, user_id: int):
         if user_id not in self.user_caches:
             self.user_caches[user_id] = {
-                'index': faiss.IndexFlatL2(self.embedding_dim),
-                'knowledge': []
+                'index': self.index_factory.create('flat', 0),
+                'knowledge': [],
+                'meta': [],
+                'bm25': None,
+                'catalog_ids': None,
+                'own_vectors': None,
+                'index_lock': Lock()
             }
-            logger.debug(f"Initialized cache for user {user_id}")
+            logger.debug("Initialized cache for user %s", user_id)
 
     def _safe_fetch_stock(self, user_id: int) -> List[Dict]:
-        logger.debug(f"Fetching stock for user {user_id}")
+        logger.debug("Fetching stock for user %s", user_id)
         try:
             items = self.stock_agent.fetch_all_stockitems(user_id) or []
-            logger.debug(f"Raw stock items: {items}")
+            logger.debug("Raw stock items: %s", items)
             return [item for item in items if self._validate_stock_item(item)]
         except Exception as e:
             logger.error(f"Stock fetch failed: {e}", exc_info=True)
             return []
 
     def _safe_fetch_receipts(self, user_id: int) -> List[Dict]:
-        logger.debug(f"Fetching receipts for user {user_id}")
+        logger.debug("Fetching receipts for user %s", user_id)
         try:
             items = self.receipt_agent.fetch_all_receipts_items(user_id) or []
-            logger.debug(f"Raw receipt items: {items}")
+            logger.debug("Raw receipt items: %s", items)
             return items
         except Exception as e:
             logger.error(f"Receipt fetch failed: {e}", exc_info=True)
             return []
 
     def _safe_fetch_user_info(self, user_id: int) -> List[Dict]:
-        logger.debug(f"Fetching user info for user {user_id}")
+        logger.debug("Fetching user info for user %s", user_id)
         try:
             info = self.db_manager.fetch_user_relevant_info(user_id) or []
-            logger.debug(f"Raw user info: {info}")
+            logger.debug("Raw user info: %s", info)
             return info
         except Exception as e:
             logger.error(f"User info fetch failed: {e}", exc_info=True)
             return []
 
+    def _safe_fetch_on_hand(self, user_id: int) -> Dict[int, float]:
+        try:
+            return self.receipt_agent.inventory_ledger.on_hand(user_id)
+        except Exception as e:
+            logger.error(f"Inventory fetch failed: {e}", exc_info=True)
+            return {}
+
     def _validate_stock_item(self, item: Dict) -> bool:
         required = ['name', 'quantity', 'category']
         return all(key in item for key in required) and isinstance(item['quantity'], (int, float))
 
-    def _build_knowledge_items(self, stock_items, receipt_items, user_details) -> List[str]:
-        knowledge = []
+    def _build_knowledge_items(self, stock_items, receipt_items, user_details,
+                               on_hand: Optional[Dict[int, float]] = None) -> Tuple[List[str], List[Dict]]:
+        """Return knowledge strings plus parallel metadata taken from the rows, used for structured filters.
+
+        With ``compact_knowledge`` on, receipt lines and stock rows are folded
+        into one item per product plus one per category instead of one per row.
+        """
+        if COMPACT_KNOWLEDGE:
+            knowledge, meta = compact_knowledge(stock_items, receipt_items, on_hand)
+        else:
+            knowledge, meta = self._row_knowledge_items(stock_items, receipt_items)
+        for info in user_details:
+            knowledge.append(f"User: {info.get('first_name', 'Unknown')}, Allergies: {info.get('allergies', 'None')}")
+            meta.append({'kind': 'user'})
+        logger.debug("Built %s knowledge items from %s stock and %s receipt rows", len(knowledge), len(stock_items), len(receipt_items))
+        return knowledge, meta
+
+    def _row_knowledge_items(self, stock_items, receipt_items) -> Tuple[List[str], List[Dict]]:
+        knowledge, meta = [], []
         for item in stock_items:
             knowledge.append(f"Stock: {item['name']}, Quantity: {item['quantity']}, Category: {item['category']}")
+            meta.append({'kind': 'stock', 'name': item['name'], 'category': item['category']})
         for item in receipt_items:
-            knowledge.append(f"Receipt: {item['name']}, Purchased: {item['purchase_date']}")
-        for info in user_details:
-            knowledge.append(f"User: {info.get('first_name', 'Unknown')}, Allergies: {info.get('allergies', 'None')}")
-        return knowledge
+            text = f"Receipt: {item['name']}, Purchased: {item['purchase_date']}"
+            if item.get('expiration_date'):
+                text += f", Expires: {item['expiration_date']}"
+            knowledge.append(text)
+            meta.append({'kind': 'receipt', 'name': item['name'], 'category': item.get('category'),
+                         'date': item['purchase_date'], 'expiration_date': item.get('expiration_date')})
+        return knowledge, meta
+
+    @traced('embed')
+    def _embed_items(self, knowledge: List[str], meta: List[Dict]) -> Tuple[np.ndarray, np.ndarray]:
+        """Catalog id per item (-1 when not a product) and embeddings for the non-product items.
 
-    def _update_index(self, user_id: int, knowledge: List[str]) -> None:
-        logger.debug(f"Updating FAISS index for user {user_id}")
+        Product items take the catalog embedding of their name, shared by every
+        user; only per-user lines (category summaries, user details) are encoded here.
+        """
+        named = [i for i, item in enumerate(meta) if self.catalog and item.get('name')]
+        catalog_ids = np.full(len(knowledge), -1, dtype=np.int64)
+        if named:
+            catalog_ids[named] = self.catalog.ids_for([meta[i]['name'] for i in named])
+        own_texts = [knowledge[i] for i in np.flatnonzero(catalog_ids < 0)]
+        if own_texts:
+            EMBEDDING_BATCH.labels('knowledge').observe(len(own_texts))
+        own_vectors = (self.index_factory.prepare(self.embedder.encode(own_texts, batch_size=8, show_progress_bar=False))
+                       if own_texts else np.empty((0, self.embedding_dim), dtype=np.float32))
+        logger.debug("Embedded %s items, %s taken from the product catalog", len(own_texts), len(named))
+        return catalog_ids, own_vectors
+
+    @traced('index_build')
+    def _update_index(self, user_id: int, knowledge: List[str], meta: List[Dict]) -> None:
+        logger.debug("Updating FAISS index for user %s", user_id)
         try:
-            logger.debug("Encoding knowledge items")
-            embeddings = self.embedder.encode(knowledge, batch_size=8, show_progress_bar=False)
-            logger.debug(f"Encoded {len(embeddings)} embeddings")
-            embeddings = np.array(embeddings, dtype=np.float32)
-            self.user_caches[user_id]['index'] = faiss.IndexFlatL2(self.embedding_dim)
-            self.user_caches[user_id]['index'].add(embeddings)
-            self.user_caches[user_id]['knowledge'] = knowledge
-            logger.debug(f"Updated FAISS index with {len(knowledge)} items")
+            catalog_ids, own_vectors = self._embed_items(knowledge, meta)
+            cache = self.user_caches[user_id]
+            cache['knowledge'] = knowledge
+            cache['meta'] = meta
+            cache['bm25'] = BM25Index(knowledge)
+
+            # Small cosine corpora keep only catalog ids and search the shared matrix directly
+            if self.catalog and self.index_factory.choose(len(knowledge)) == 'flat':
+                cache['index'] = None
+                cache['catalog_ids'] = catalog_ids
+                cache['own_vectors'] = own_vectors
+                logger.debug("Referenced %s catalog vectors for user %s", int((catalog_ids >= 0).sum()), user_id)
+                return
+
+            embeddings = np.empty((len(knowledge), self.embedding_dim), dtype=np.float32)
+            linked = catalog_ids >= 0
+            if linked.any():
+                embeddings[linked] = self.catalog.vectors(catalog_ids[linked])
+            embeddings[~linked] = own_vectors
+            embeddings = self.index_factory.prepare(embeddings)
+
+            def swap_in(trained_index):
+                # Only replace the index if the knowledge base was not rebuilt meanwhile
+                with cache['index_lock']:
+                    if self.user_caches.get(user_id) is cache and cache['knowledge'] is knowledge:
+                        cache['index'] = trained_index
+
+            # knowledge/meta are assigned above, before training starts, so swap_in's check can pass;
+            # the lock stops a fast background build from being overwritten by the interim index
+            with cache['index_lock']:
+                cache['index'] = self.index_factory.build_async(embeddings, swap_in)
+            cache['catalog_ids'] = None
+            cache['own_vectors'] = None
+            logger.debug("Updated FAISS and BM25 indexes with %s items", len(knowledge))
         except Exception as e:
             logger.error(f"Index update failed for user {user_id}: {e}", exc_info=True)
             raise
 
+    @traced('faiss_search')
+    def _dense_search(self, cache: Dict[str, Any], query_vector: np.ndarray, k: int) -> List[int]:
+        if cache['index'] is not None:
+            _, indices = cache['index'].search(query_vector, k=k)
+            return [int(i) for i in indices[0] if i >= 0]
+        catalog_ids = cache['catalog_ids']
+        linked = catalog_ids >= 0
+        scores = np.empty(len(catalog_ids), dtype=np.float32)
+        scores[linked] = self.catalog.vectors(catalog_ids[linked]) @ query_vector[0]
+        scores[~linked] = cache['own_vectors'] @ query_vector[0]
+        return [int(i) for i in np.argsort(-scores, kind='stable')[:k]]
+
+    def index_stats(self) -> Dict[str, int]:
+        """Per-user indexes held by this process and the vectors in them (catalog-backed users count their items)."""
+        vectors = 0
+        for cache in list(self.user_caches.values()):
+            index = cache['index']
+            vectors += index.ntotal if index is not None else len(cache['knowledge'])
+        return {'users': len(self.user_caches), 'vectors': vectors}
+
     @lru_cache(maxsize=100)
+    @traced('kb_build')
     def fetch_knowledge_base(self, user_id: int) -> tuple:
-        logger.debug(f"Building knowledge base for user {user_id}")
+        logger.debug("Building knowledge base for user %s", user_id)
         try:
             self._initialize_user_cache(user_id)
             stock_items = self._safe_fetch_stock(user_id)
             receipt_items = self._safe_fetch_receipts(user_id)
             user_details = self._safe_fetch_user_info(user_id)
-            knowledge = self._build_knowledge_items(stock_items, receipt_items, user_details)
+            on_hand = self._safe_fetch_on_hand(user_id)
+            knowledge, meta = self._build_knowledge_items(stock_items, receipt_items, user_details, on_hand)
             if not knowledge:
                 logger.warning(f"No knowledge items for user {user_id}")
                 return tuple()
-            self._update_index(user_id, knowledge)
+            self._update_index(user_id, knowledge, meta)
             return tuple(knowledge)
         except Exception as e:
             logger.error(f"Failed to build knowledge base: {e}", exc_info=True)
             raise
 
-    def retrieve_context(self, user_id: int, query: str) -> List[str]:
-        logger.debug(f"Retrieving context for user {user_id}, query: {query}")
+    def retrieve_context(self, user_id: int, query: str, k: int = RETRIEVAL_CANDIDATES,
+                         category: Optional[str] = None, date_from: Optional[date] = None,
+                         date_to: Optional[date] = None, expiring_within_days: Optional[int] = None) -> List[str]:
+        """Return up to ``k`` knowledge items, most relevant first; the prompt builder trims them to budget.
+
+        Dense (FAISS) and lexical (BM25) rankings are fused with reciprocal rank
+        fusion. Explicit filters restrict both rankings; without them, filters
+        inferred from the query are applied only if they leave something to rank.
+        The user's own details are always included, first.
+        """
+        logger.debug("Retrieving context for user %s, query: %s", user_id, query)
         try:
-            if user_id not in self.user_caches or not self.user_caches[user_id]['knowledge']:
+            cache = self.user_caches.get(user_id)
+            if not cache or not cache['knowledge']:
                 logger.debug("No knowledge base for user")
                 return []
-            query_embedding = self.embedder.encode([query], batch_size=1, show_progress_bar=False)[0]
-            query_embedding = np.array([query_embedding], dtype=np.float32)
-            distances, indices = self.user_caches[user_id]['index'].search(query_embedding, k=3)
-            context = [self.user_caches[user_id]['knowledge'][i] for i in indices[0] if i >= 0]
-            logger.debug(f"Context: {context}")
+            knowledge, meta = cache['knowledge'], cache['meta']
+            pinned = pinned_items(meta)
+
+            allowed = filter_items(meta, category=category, date_from=date_from, date_to=date_to,
+                                   expiring_within_days=expiring_within_days)
+            if allowed is None:
+                inferred = infer_filters(query, meta)
+                allowed = filter_items(meta, **inferred) if inferred else None
+                if allowed is not None and not allowed.difference(pinned):
+                    allowed = None
+                elif allowed is not None:
+                    logger.debug("Inferred filters %s keep %s items", inferred, len(allowed))
+            if allowed is not None and not allowed:
+                return []
+
+            # With a filter, rank every item so each allowed one can surface in the dense list
+            pool = len(knowledge) if allowed is not None else min(len(knowledge), max(k, RETRIEVAL_POOL))
+            with span('embed_query'):
+                query_embedding = self.embedder.encode([query], batch_size=1, show_progress_bar=False)
+                query_embedding = self.index_factory.prepare(query_embedding)
+            dense = [i for i in self._dense_search(cache, query_embedding, pool) if allowed is None or i in allowed]
+            lexical = [doc_id for doc_id, _ in cache['bm25'].search(query, pool, allowed)]
+
+            fused = [i for i in reciprocal_rank_fusion([dense, lexical], k=RRF_K) if i not in pinned]
+            context = [knowledge[i] for i in (pinned + fused)[:max(k, len(pinned))]]
+            logger.debug("Context (%s dense, %s lexical candidates): %s", len(dense), len(lexical), context)
             return context
         except Exception as e:
             logger.error(f"Context retrieval failed: {e}", exc_info=True)
@@ -178,10 +333,12 @@ class GroceryAnalyzer:
     @retry(
         stop=stop_after_attempt(3),
         wait=wait_exponential(multiplier=1, min=1, max=10),
-        retry=retry_if_exception_type((requests.exceptions.RequestException, requests.exceptions.HTTPError))
+        retry=retry_if_exception_type((requests.exceptions.RequestException, requests.exceptions.HTTPError)),
+        before_sleep=count_retry('deepseek')
     )
+    @traced('deepseek', kind='external')
     def _call_llm_api(self, prompt: str) -> Dict:
-        logger.debug(f"Sending LLM request with prompt: {prompt[:50]}...")
+        logger.debug("Sending LLM request with prompt: %s...", prompt[:50])
         try:
             response = requests.post(
                 DEEPSEEK_API_URL,
@@ -190,8 +347,9 @@ class GroceryAnalyzer:
                 timeout=30
             )
             response.raise_for_status()
-            logger.debug(f"LLM response: {response.json()}")
-            return response.json()
+            payload = response.json()
+            logger.debug("LLM response: %s", payload)
+            return payload
         except requests.exceptions.RequestException as e:
             logger.error(f"LLM API request failed: {e}, status_code={getattr(e.response, 'status_code', 'N/A')}")
             raise
@@ -200,8 +358,9 @@ class GroceryAnalyzer:
             raise
 
     
+    @traced('postprocess')
     def _process_llm_response(self, response: Dict) -> str:
-        logger.debug(f"Processing LLM response: {response}")
+        logger.debug("Processing LLM response: %s", response)
         try:
             if 'choices' in response and response['choices']:
                 raw_content = response['choices'][0]['message']['content'].strip()
@@ -247,30 +406,14 @@ class GroceryAnalyzer:
             
             
 
-    def _build_prompt(self, query: str, context: List[str]) -> str:
-        prompt = (
-            "You are a smart grocery assistant helping reduce food waste and manage groceries. "
-            f"Answer the query based ONLY on the facts provided {context} and user details. "
-            "Do NOT guess or assume information, especially about expiration dates or shelf life, "
-            "unless explicitly stated in the context. Consider these factors in EVERY response:\n"
-            "1. User allergies (e.g., avoid peanuts, rice)\n"
-            "2. Dietary preferences (e.g., vegetarian, vegan, gluten-free)\n"
-            "3. Health conditions (e.g., diabetes requires low-sugar recipes)\n"
-            "4. Current stock levels, categories, and shelf life from context\n"
-            "5. Recent purchases from receipts\n"
-            "Provide practical, specific advice in a friendly tone with simple markdown formatting. "
-            "Use bullet points, avoid ### headers, and avoid **bold** markers. "
-            "Include emojis for options (🥧), tips (📝), and closers (😊).\n\n"
-        )
-        if context:
-            prompt += "Context:\n" + "\n".join(context) + "\n\n"
-        prompt += f"Query: {query}\nAnswer:"
-        return prompt
+    @traced('prompt')
+    def _build_prompt(self, query: str, context: List[str], memory: str = '') -> str:
+        return self.prompt_builder.build(query, context, memory)
     
-    def generate_response(self, user_id: int, query: str, context: List[str]) -> str:
-        logger.debug(f"Generating response for user {user_id}, query: {query}")
+    def generate_response(self, user_id: int, query: str, context: List[str], memory: str = '') -> str:
+        logger.debug("Generating response for user %s, query: %s", user_id, query)
         try:
-            prompt = self._build_prompt(query, context)
+            prompt = self._build_prompt(query, context, memory)
             response = self._call_llm_api(prompt)
             return self._process_llm_response(response)
         except Exception as e:
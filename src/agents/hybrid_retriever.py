@@ -0,0 +1,124 @@
+import re
+import math
+from collections import Counter, defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Any
+
+TOKEN_RE = re.compile(r"\d{4}-\d{2}-\d{2}|[a-z0-9]+")
+EXPIRY_WORDS = ('expir', 'spoil', 'go off', 'going off', 'use up', 'use first')
+DEFAULT_EXPIRY_WINDOW_DAYS = 7
+# Knowledge kinds that filters never remove: the user's diet, allergies and health notes
+PINNED_KINDS = ('user',)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens; ISO dates are kept whole so exact dates can match."""
+    return TOKEN_RE.findall(text.lower())
+
+
+class BM25Index:
+    """In-memory Okapi BM25 over a list of short documents (knowledge items)."""
+
+    def __init__(self, documents: List[str], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self.doc_lengths: List[int] = []
+        for doc_id, text in enumerate(documents):
+            terms = Counter(tokenize(text))
+            self.doc_lengths.append(sum(terms.values()))
+            for term, tf in terms.items():
+                self.postings[term].append((doc_id, tf))
+        self.doc_count = len(documents)
+        self.avg_length = (sum(self.doc_lengths) / self.doc_count) if self.doc_count else 0.0
+        self.idf = {
+            term: math.log(1 + (self.doc_count - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in self.postings.items()
+        }
+
+    def search(self, query: str, k: int, allowed: Optional[Set[int]] = None) -> List[Tuple[int, float]]:
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for doc_id, tf in self.postings[term]:
+                if allowed is not None and doc_id not in allowed:
+                    continue
+                norm = 1 - self.b + self.b * self.doc_lengths[doc_id] / (self.avg_length or 1)
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + self.k1 * norm)
+        return sorted(scores.items(), key=lambda kv: kv[1], reverse=True)[:k]
+
+
+def reciprocal_rank_fusion(rankings: Iterable[List[int]], k: int = 60) -> List[int]:
+    """Fuse ranked id lists: score(d) = sum over lists of 1 / (k + rank)."""
+    scores: Dict[int, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] += 1.0 / (k + rank)
+    return [doc_id for doc_id, _ in sorted(scores.items(), key=lambda kv: kv[1], reverse=True)]
+
+
+def _as_date(value: Any) -> Optional[date]:
+    if value is None or value == '':
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    try:
+        return datetime.strptime(str(value)[:10], '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+
+def filter_items(meta: List[Dict[str, Any]], category: Optional[str] = None,
+                 date_from: Optional[date] = None, date_to: Optional[date] = None,
+                 expiring_within_days: Optional[int] = None, today: Optional[date] = None) -> Optional[Set[int]]:
+    """Apply structured pre-filters to knowledge metadata (built from DB rows, not item text).
+
+    Returns the set of allowed item ids, or None when no filter was requested.
+    Filters apply to product and receipt items; ``PINNED_KINDS`` items are always allowed.
+    """
+    if category is None and date_from is None and date_to is None and expiring_within_days is None:
+        return None
+    today = today or date.today()
+    expiry_cutoff = today + timedelta(days=expiring_within_days) if expiring_within_days is not None else None
+    allowed = set()
+    for item_id, item in enumerate(meta):
+        if item.get('kind') in PINNED_KINDS:
+            allowed.add(item_id)
+            continue
+        if category is not None and (item.get('category') or '').lower() != category.lower():
+            continue
+        item_date = _as_date(item.get('date'))
+        if date_from is not None and (item_date is None or item_date < date_from):
+            continue
+        if date_to is not None and (item_date is None or item_date > date_to):
+            continue
+        if expiry_cutoff is not None:
+            expires = _as_date(item.get('expiration_date'))
+            if expires is None or expires > expiry_cutoff:
+                continue
+        allowed.add(item_id)
+    return allowed
+
+
+def pinned_items(meta: List[Dict[str, Any]]) -> List[int]:
+    """Ids of the items every retrieval keeps (see ``PINNED_KINDS``)."""
+    return [item_id for item_id, item in enumerate(meta) if item.get('kind') in PINNED_KINDS]
+
+
+def infer_filters(query: str, meta: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Derive soft filters from the query: a known category named in it, or an expiry question."""
+    lowered = query.lower()
+    query_terms = set(tokenize(lowered))
+    filters: Dict[str, Any] = {}
+    categories = {(item.get('category') or '').lower() for item in meta if item.get('category')}
+    for category in sorted(categories, key=len, reverse=True):
+        if category in query_terms or category.rstrip('s') in query_terms or f"{category}s" in query_terms:
+            filters['category'] = category
+            break
+    if any(word in lowered for word in EXPIRY_WORDS):
+        filters['expiring_within_days'] = DEFAULT_EXPIRY_WINDOW_DAYS
+    return filters
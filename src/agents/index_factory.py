@@ -0,0 +1,200 @@
+import os
+import math
+import threading
+import yaml
+import numpy as np
+import faiss
+from typing import Callable, Optional
+
+from loggers.custom_logger import get_logger
+
+logger = get_logger(__name__)
+
+BASE_URL = os.path.join(os.path.dirname(__file__), '..')
+CONFIG_PATH = os.path.join(BASE_URL, 'constants', 'config.yaml')
+
+with open(CONFIG_PATH, 'r') as file:
+    config = yaml.safe_load(file)
+    index_config = config['deepseek'].get('index', {})
+    INDEX_TYPE = index_config.get('type', 'auto')
+    INDEX_METRIC = index_config.get('metric', 'cosine')
+    FLAT_MAX_ITEMS = index_config.get('flat_max_items', 10000)
+    HNSW_MAX_ITEMS = index_config.get('hnsw_max_items', 200000)
+    MEMORY_BUDGET_MB = index_config.get('memory_budget_mb', 256)
+    HNSW_M = index_config.get('hnsw_m', 32)
+    HNSW_EF_SEARCH = index_config.get('hnsw_ef_search', 64)
+    IVF_NPROBE = index_config.get('ivf_nprobe', 16)
+    PQ_SUBQUANTIZERS = index_config.get('pq_subquantizers', 48)
+    INDEX_PRECISION = index_config.get('precision', 'float32')
+
+INDEX_TYPES = ('flat', 'ivf', 'hnsw', 'pq')
+PRECISIONS = ('float32', 'float16', 'int8', 'pq')
+# faiss warns below ~39 training points per centroid
+MIN_POINTS_PER_CENTROID = 39
+# 8-bit PQ codebooks have 256 centroids per sub-quantizer
+MIN_PQ_TRAINING_POINTS = 256
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """Return a float32 copy with unit L2 rows so inner product equals cosine similarity."""
+    vectors = np.array(vectors, dtype=np.float32, copy=True)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def scalar_quantizer_type(precision: str) -> Optional[int]:
+    return {'float16': faiss.ScalarQuantizer.QT_fp16, 'int8': faiss.ScalarQuantizer.QT_8bit}.get(precision)
+
+
+def index_bytes(index: faiss.Index) -> int:
+    """Serialized size of an index, a close proxy for its in-memory footprint."""
+    return int(faiss.serialize_index(index).nbytes)
+
+
+def ivf_nlist(n: int) -> int:
+    return max(1, min(int(4 * math.sqrt(n)), n // MIN_POINTS_PER_CENTROID))
+
+
+class IndexFactory:
+    """Picks and builds a FAISS index for a corpus of embeddings.
+
+    ``choose`` uses exact Flat search for small corpora. Above ``flat_max_items``
+    it uses HNSW, or IVF once HNSW's graph would be too large. When even the
+    raw float32 vectors exceed ``memory_budget_mb`` it uses IVF-PQ. With
+    ``metric: cosine`` vectors are L2-normalised and searched by inner
+    product; callers must pass query vectors through ``prepare`` as well.
+
+    ``precision`` sets how stored vectors are encoded: float32 (exact),
+    float16 or int8 scalar quantization (2x/4x smaller), or pq (product
+    quantization, 8x smaller with the default 48 sub-quantizers). The IVF-PQ
+    type always uses PQ codes.
+    """
+
+    def __init__(self, dim: int, index_type: str = INDEX_TYPE, metric: str = INDEX_METRIC,
+                 flat_max_items: int = FLAT_MAX_ITEMS, hnsw_max_items: int = HNSW_MAX_ITEMS,
+                 memory_budget_mb: float = MEMORY_BUDGET_MB, precision: str = INDEX_PRECISION):
+        if index_type != 'auto' and index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type: {index_type}")
+        if metric not in ('cosine', 'l2'):
+            raise ValueError(f"Unknown index metric: {metric}")
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown index precision: {precision}")
+        self.dim = dim
+        self.index_type = index_type
+        self.metric = metric
+        self.precision = precision
+        self.flat_max_items = flat_max_items
+        self.hnsw_max_items = hnsw_max_items
+        self.memory_budget_bytes = memory_budget_mb * 1024 * 1024
+
+    @property
+    def faiss_metric(self) -> int:
+        return faiss.METRIC_INNER_PRODUCT if self.metric == 'cosine' else faiss.METRIC_L2
+
+    def prepare(self, vectors: np.ndarray) -> np.ndarray:
+        if self.metric == 'cosine':
+            return normalize(vectors)
+        return np.ascontiguousarray(vectors, dtype=np.float32)
+
+    def choose(self, n: int) -> str:
+        if self.index_type != 'auto':
+            return self.index_type
+        if n <= self.flat_max_items:
+            return 'flat'
+        if n * self.bytes_per_vector() > self.memory_budget_bytes:
+            return 'pq'
+        if n <= self.hnsw_max_items:
+            return 'hnsw'
+        return 'ivf'
+
+    def bytes_per_vector(self, precision: Optional[str] = None) -> float:
+        precision = precision or self.precision
+        return {'float32': 4 * self.dim, 'float16': 2 * self.dim, 'int8': self.dim, 'pq': PQ_SUBQUANTIZERS}[precision]
+
+    def effective_precision(self, n: int) -> str:
+        """PQ codebooks need enough vectors to train; small corpora fall back to int8."""
+        if self.precision == 'pq' and n < MIN_PQ_TRAINING_POINTS:
+            return 'int8'
+        return self.precision
+
+    def needs_training(self, kind: str, n: Optional[int] = None) -> bool:
+        """Whether ``kind`` needs k-means training (slow enough to run in the background).
+
+        With ``n`` given, a Flat or HNSW index whose vectors are PQ-encoded counts too.
+        """
+        if kind in ('ivf', 'pq'):
+            return True
+        return n is not None and self.effective_precision(n) == 'pq'
+
+    def trainable(self, kind: str, n: int) -> bool:
+        minimum = MIN_PQ_TRAINING_POINTS if kind == 'pq' else MIN_POINTS_PER_CENTROID * 2
+        return n >= minimum
+
+    def create(self, kind: str, n: int, precision: Optional[str] = None) -> faiss.Index:
+        """An empty index of ``kind`` sized for ``n`` vectors; check ``is_trained`` before adding."""
+        precision = precision or self.effective_precision(n)
+        sq_type = scalar_quantizer_type(precision)
+        if kind == 'flat':
+            if precision == 'pq':
+                return faiss.IndexPQ(self.dim, PQ_SUBQUANTIZERS, 8, self.faiss_metric)
+            if sq_type is not None:
+                return faiss.IndexScalarQuantizer(self.dim, sq_type, self.faiss_metric)
+            return faiss.IndexFlatIP(self.dim) if self.metric == 'cosine' else faiss.IndexFlatL2(self.dim)
+        if kind == 'hnsw':
+            if precision == 'pq':
+                index = faiss.IndexHNSWPQ(self.dim, PQ_SUBQUANTIZERS, HNSW_M, 8, self.faiss_metric)
+            elif sq_type is not None:
+                index = faiss.IndexHNSWSQ(self.dim, sq_type, HNSW_M, self.faiss_metric)
+            else:
+                index = faiss.IndexHNSWFlat(self.dim, HNSW_M, self.faiss_metric)
+            index.hnsw.efSearch = HNSW_EF_SEARCH
+            return index
+        quantizer = faiss.IndexFlatIP(self.dim) if self.metric == 'cosine' else faiss.IndexFlatL2(self.dim)
+        nlist = ivf_nlist(n)
+        if kind == 'ivf' and sq_type is not None:
+            index = faiss.IndexIVFScalarQuantizer(quantizer, self.dim, nlist, sq_type, self.faiss_metric)
+        elif kind == 'ivf' and precision != 'pq':
+            index = faiss.IndexIVFFlat(quantizer, self.dim, nlist, self.faiss_metric)
+        else:
+            index = faiss.IndexIVFPQ(quantizer, self.dim, nlist, PQ_SUBQUANTIZERS, 8, self.faiss_metric)
+        index.nprobe = min(IVF_NPROBE, nlist)
+        return index
+
+    def build(self, vectors: np.ndarray, kind: Optional[str] = None, precision: Optional[str] = None) -> faiss.Index:
+        """Build and fill an index synchronously; ``vectors`` must already be prepared."""
+        n = len(vectors)
+        kind = kind or self.choose(n)
+        if self.needs_training(kind) and not self.trainable(kind, n):
+            kind = 'flat'
+        precision = precision or self.effective_precision(n)
+        index = self.create(kind, n, precision)
+        if not index.is_trained:
+            index.train(vectors)
+        index.add(vectors)
+        logger.debug("Built %s index over %s vectors (%s, %s)", kind, n, self.metric, precision)
+        return index
+
+    def build_async(self, vectors: np.ndarray, on_ready: Callable[[faiss.Index], None]) -> faiss.Index:
+        """Return a searchable index now; train the target index in the background if it needs it.
+
+        When the chosen index needs training (IVF lists or PQ codes), a plain
+        float32 Flat index is returned immediately, whatever ``precision`` is,
+        so no k-means runs on the caller's thread. ``on_ready`` is called with
+        the trained index once it is filled, so the caller can swap it in.
+        """
+        n = len(vectors)
+        kind = self.choose(n)
+        if self.needs_training(kind) and not self.trainable(kind, n):
+            kind = 'flat'
+        if not self.needs_training(kind, n):
+            return self.build(vectors, kind)
+
+        def train():
+            try:
+                on_ready(self.build(vectors, kind))
+                logger.info(f"Background {kind} index ready over {len(vectors)} vectors")
+            except Exception as e:
+                logger.error(f"Background {kind} index training failed: {e}", exc_info=True)
+
+        threading.Thread(target=train, name=f'faiss-{kind}-train', daemon=True).start()
+        return self.build(vectors, 'flat', precision='float32')
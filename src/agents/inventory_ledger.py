@@ -0,0 +1,300 @@
+import os
+import time
+import yaml
+import mysql.connector
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from loggers.custom_logger import get_logger
+
+logger = get_logger(__name__)
+
+BASE_URL = os.path.join(os.path.dirname(__file__), '..')
+CONFIG_PATH = os.path.join(BASE_URL, 'constants', 'config.yaml')
+
+with open(CONFIG_PATH, 'r') as file:
+    config = yaml.safe_load(file)
+    tables = config['database']['tables']
+    RECEIPTS_TABLE = tables['receipts']
+    STOCK_TABLE = tables['stock']
+    PRODUCTS_TABLE = tables.get('products', 'products')
+    LEDGER_TABLE = tables.get('inventory_ledger', 'inventory_ledger')
+    inventory_config = config.get('inventory', {})
+    LOW_STOCK_THRESHOLD = inventory_config.get('low_stock_threshold', 2)
+    RECONCILE_BATCH_USERS = inventory_config.get('reconcile_batch_users', 200)
+
+class InventoryLedger:
+    """Running per-user, per-product inventory kept in step with receipts and stock.
+
+    A stock upload is a count of what is on the shelf, so it replaces rather
+    than adds: each ledger row keeps the latest upload that contains the
+    product (``snapshot_qty``, taken on ``snapshot_on``) and the purchases dated
+    after that day (``purchased_qty``). ``on_hand`` is a stored generated column,
+    snapshot plus later purchases, and with no snapshot simply what was bought.
+    Writes to ``receipts`` and ``stock`` update the row inside the same
+    transaction. Deletions rebuild the affected rows from the remaining source
+    rows, because removing the latest upload brings back the one before it.
+    ``reconcile`` rebuilds every row to repair any drift.
+    """
+
+    def __init__(self, db_config: Dict, low_stock_threshold: float = LOW_STOCK_THRESHOLD):
+        self.db_config = db_config
+        self.low_stock_threshold = low_stock_threshold
+        if self.create_table():
+            self.reconcile()
+
+    def create_table(self) -> bool:
+        """Create the ledger table; True when it was (re)created from an older layout and needs rebuilding."""
+        conn = None
+        cursor = None
+        try:
+            conn = mysql.connector.connect(**self.db_config)
+            cursor = conn.cursor()
+            cursor.execute("SELECT COUNT(*) FROM information_schema.columns "
+                           "WHERE table_schema = DATABASE() AND table_name = %s AND column_name = 'stock_qty'",
+                           (LEDGER_TABLE,))
+            outdated = cursor.fetchone()[0] > 0
+            if outdated:
+                # Derived data only: drop the summed-uploads layout and rebuild from the source tables
+                cursor.execute(f"DROP TABLE {LEDGER_TABLE}")
+                logger.info(f"Dropped outdated {LEDGER_TABLE} table for rebuild")
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS {LEDGER_TABLE} (
+                    user_id INT NOT NULL,
+                    product_id INT NOT NULL,
+                    snapshot_qty DOUBLE NOT NULL DEFAULT 0,
+                    snapshot_id INT NULL,
+                    snapshot_on DATE NULL,
+                    purchased_qty DOUBLE NOT NULL DEFAULT 0,
+                    last_purchase_on DATE NULL,
+                    on_hand DOUBLE AS (GREATEST(snapshot_qty + purchased_qty, 0)) STORED,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                    PRIMARY KEY (user_id, product_id),
+                    INDEX idx_ledger_user_on_hand (user_id, on_hand)
+                )
+            """)
+            conn.commit()
+            return outdated
+        except mysql.connector.Error as e:
+            logger.error(f"Error creating {LEDGER_TABLE} table: {e}")
+            raise RuntimeError(f"Error creating {LEDGER_TABLE} table: {e}")
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                conn.close()
+
+    def record(self, cursor, source: str, user_id: int, items: List[Dict], product_ids: List[int],
+               snapshot_id: Optional[int] = None) -> None:
+        """Apply newly inserted ``source`` rows to the ledger on the caller's cursor (no commit).
+
+        Stock rows must pass the ``snapshot_id`` (``stock_id``) of their upload.
+        """
+        if source == STOCK_TABLE:
+            self._record_snapshot(cursor, user_id, items, product_ids, snapshot_id)
+        else:
+            self._record_purchases(cursor, user_id, items, product_ids)
+
+    def _record_purchases(self, cursor, user_id: int, items: List[Dict], product_ids: List[int]) -> None:
+        deltas: Dict[Tuple[int, str], float] = defaultdict(float)
+        for item, product_id in zip(items, product_ids):
+            deltas[(product_id, item.get('purchase_date'))] += float(item.get('quantity') or 0)
+        if not deltas:
+            return
+        placeholders = ", ".join(["(%s, %s, %s, %s)"] * len(deltas))
+        params = [value for (product_id, purchased_on), qty in deltas.items()
+                  for value in (user_id, product_id, qty, purchased_on)]
+        # Purchases on or before the snapshot day are already in that count
+        cursor.execute(
+            f"INSERT INTO {LEDGER_TABLE} (user_id, product_id, purchased_qty, last_purchase_on) VALUES {placeholders} "
+            f"ON DUPLICATE KEY UPDATE "
+            f"purchased_qty = purchased_qty + IF(snapshot_on IS NULL OR VALUES(last_purchase_on) > snapshot_on, "
+            f"VALUES(purchased_qty), 0), "
+            f"last_purchase_on = GREATEST(COALESCE(last_purchase_on, VALUES(last_purchase_on)), VALUES(last_purchase_on))",
+            params
+        )
+
+    def _record_snapshot(self, cursor, user_id: int, items: List[Dict], product_ids: List[int],
+                         snapshot_id: Optional[int]) -> None:
+        counts: Dict[int, float] = defaultdict(float)
+        for item, product_id in zip(items, product_ids):
+            counts[product_id] += float(item.get('quantity') or 0)
+        if not counts:
+            return
+        placeholders = ", ".join(["(%s, %s, %s, %s, CURDATE())"] * len(counts))
+        params = [value for product_id, qty in counts.items() for value in (user_id, product_id, qty, snapshot_id)]
+        cursor.execute(
+            f"INSERT INTO {LEDGER_TABLE} (user_id, product_id, snapshot_qty, snapshot_id, snapshot_on) "
+            f"VALUES {placeholders} "
+            f"ON DUPLICATE KEY UPDATE snapshot_qty = VALUES(snapshot_qty), snapshot_id = VALUES(snapshot_id), "
+            f"snapshot_on = VALUES(snapshot_on)",
+            params
+        )
+        # The new count already includes everything bought up to today
+        product_placeholders = ", ".join(["%s"] * len(counts))
+        cursor.execute(
+            f"UPDATE {LEDGER_TABLE} l SET purchased_qty = ("
+            f"SELECT COALESCE(SUM(r.quantity), 0) FROM {RECEIPTS_TABLE} r "
+            f"WHERE r.user_id = l.user_id AND r.product_id = l.product_id AND r.purchase_date > l.snapshot_on) "
+            f"WHERE l.user_id = %s AND l.product_id IN ({product_placeholders})",
+            (user_id, *counts)
+        )
+
+    def remove(self, cursor, source: str, where: str, params: Tuple) -> None:
+        """Take ``source`` rows matching ``where`` out of the ledger; call before deleting them.
+
+        The affected products are rebuilt from the source rows that remain.
+        """
+        cursor.execute(f"SELECT DISTINCT user_id, product_id FROM {source} WHERE {where} AND product_id IS NOT NULL",
+                       params)
+        products: Dict[int, List[int]] = defaultdict(list)
+        for user_id, product_id in cursor.fetchall():
+            products[user_id].append(product_id)
+        for user_id, product_ids in products.items():
+            for start in range(0, len(product_ids), 500):
+                chunk = product_ids[start:start + 500]
+                self._rebuild(cursor, f"user_id = %s AND product_id IN ({', '.join(['%s'] * len(chunk))})",
+                              (user_id, *chunk), exclude=(source, where, tuple(params)))
+
+    def _snapshots(self, cursor, where: str, params: Tuple) -> Dict[Tuple[int, int], Tuple]:
+        # Per product, the newest upload that contains it: (snapshot_id, quantity, day)
+        cursor.execute(
+            f"SELECT user_id, product_id, stock_id, SUM(quantity), DATE(MIN(created_at)) FROM {STOCK_TABLE} "
+            f"WHERE {where} AND product_id IS NOT NULL GROUP BY user_id, product_id, stock_id",
+            params
+        )
+        latest: Dict[Tuple[int, int], Tuple] = {}
+        for user_id, product_id, stock_id, qty, taken_on in cursor.fetchall():
+            current = latest.get((user_id, product_id))
+            if current is None or stock_id > current[0]:
+                latest[(user_id, product_id)] = (stock_id, float(qty), taken_on)
+        return latest
+
+    def _purchases(self, cursor, where: str, params: Tuple) -> Dict[Tuple[int, int], List[Tuple]]:
+        cursor.execute(
+            f"SELECT user_id, product_id, purchase_date, SUM(quantity) FROM {RECEIPTS_TABLE} "
+            f"WHERE {where} AND product_id IS NOT NULL GROUP BY user_id, product_id, purchase_date",
+            params
+        )
+        purchases: Dict[Tuple[int, int], List[Tuple]] = defaultdict(list)
+        for user_id, product_id, purchased_on, qty in cursor.fetchall():
+            purchases[(user_id, product_id)].append((purchased_on, float(qty)))
+        return purchases
+
+    def _rebuild(self, cursor, where: str, params: Tuple, exclude: Optional[Tuple[str, str, Tuple]] = None) -> int:
+        """Recompute the ledger rows matching ``where``; ``exclude`` leaves out ``(source, where, params)`` rows."""
+        filters = {}
+        for source in (STOCK_TABLE, RECEIPTS_TABLE):
+            if exclude is not None and exclude[0] == source:
+                filters[source] = (f"{where} AND NOT ({exclude[1]})", (*params, *exclude[2]))
+            else:
+                filters[source] = (where, params)
+        snapshots = self._snapshots(cursor, *filters[STOCK_TABLE])
+        purchases = self._purchases(cursor, *filters[RECEIPTS_TABLE])
+
+        rows = []
+        for key in snapshots.keys() | purchases.keys():
+            snapshot_id, snapshot_qty, snapshot_on = snapshots.get(key, (None, 0.0, None))
+            bought = purchases.get(key, [])
+            purchased = sum(qty for purchased_on, qty in bought if snapshot_on is None or purchased_on > snapshot_on)
+            last_purchase_on = max((purchased_on for purchased_on, _ in bought), default=None)
+            rows.append((*key, snapshot_qty, snapshot_id, snapshot_on, purchased, last_purchase_on))
+
+        cursor.execute(f"DELETE FROM {LEDGER_TABLE} WHERE {where}", params)
+        for start in range(0, len(rows), 500):
+            chunk = rows[start:start + 500]
+            cursor.execute(
+                f"INSERT INTO {LEDGER_TABLE} (user_id, product_id, snapshot_qty, snapshot_id, snapshot_on, "
+                f"purchased_qty, last_purchase_on) VALUES " + ", ".join(["(%s, %s, %s, %s, %s, %s, %s)"] * len(chunk)),
+                [value for row in chunk for value in row]
+            )
+        return len(rows)
+
+    def _reconcile_batch(self, cursor, user_ids: List[int]) -> int:
+        return self._rebuild(cursor, f"user_id IN ({', '.join(['%s'] * len(user_ids))})", tuple(user_ids))
+
+    def reconcile(self, user_ids: Optional[Iterable[int]] = None) -> Dict:
+        """Rebuild ledger rows from receipts and stock for ``user_ids`` (default: every user)."""
+        started = time.perf_counter()
+        conn = None
+        cursor = None
+        stats = {'users': 0, 'rows': 0}
+        try:
+            conn = mysql.connector.connect(**self.db_config)
+            cursor = conn.cursor()
+            if user_ids is None:
+                cursor.execute("SELECT id FROM users ORDER BY id")
+                user_ids = [row[0] for row in cursor.fetchall()]
+            user_ids = list(user_ids)
+            for start in range(0, len(user_ids), RECONCILE_BATCH_USERS):
+                batch = user_ids[start:start + RECONCILE_BATCH_USERS]
+                stats['rows'] += self._reconcile_batch(cursor, batch)
+                stats['users'] += len(batch)
+                conn.commit()
+        except mysql.connector.Error as e:
+            logger.error(f"Inventory reconciliation failed: {e}")
+            if conn:
+                conn.rollback()
+            raise RuntimeError(f"Inventory reconciliation failed: {e}")
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                conn.close()
+        stats['duration_s'] = round(time.perf_counter() - started, 2)
+        logger.info(f"Reconciled inventory for {stats['users']} users ({stats['rows']} ledger rows) in {stats['duration_s']}s")
+        return stats
+
+    def on_hand(self, user_id: int) -> Dict[int, float]:
+        """Current on-hand quantity per product id for a user."""
+        conn = None
+        cursor = None
+        try:
+            conn = mysql.connector.connect(**self.db_config)
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT product_id, on_hand FROM {LEDGER_TABLE} WHERE user_id = %s", (user_id,))
+            return {row[0]: float(row[1]) for row in cursor.fetchall()}
+        except mysql.connector.Error as e:
+            logger.error(f"Error reading inventory for user {user_id}: {e}")
+            raise RuntimeError(f"Error reading inventory for user {user_id}: {e}")
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                conn.close()
+
+    def low_stock(self, user_id: int, threshold: Optional[float] = None) -> List[Dict]:
+        """Products at or below ``threshold`` on hand, lowest first."""
+        return self.low_stock_for_users([user_id], threshold).get(user_id, [])
+
+    def low_stock_for_users(self, user_ids: List[int], threshold: Optional[float] = None) -> Dict[int, List[Dict]]:
+        """``low_stock`` for many users in one query, keyed by user id."""
+        threshold = self.low_stock_threshold if threshold is None else threshold
+        if not user_ids:
+            return {}
+        placeholders = ", ".join(["%s"] * len(user_ids))
+        conn = None
+        cursor = None
+        try:
+            conn = mysql.connector.connect(**self.db_config)
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute(f"""
+                SELECT l.user_id, p.display_name AS name, l.on_hand AS quantity, l.product_id
+                FROM {LEDGER_TABLE} l
+                JOIN {PRODUCTS_TABLE} p ON p.id = l.product_id
+                WHERE l.user_id IN ({placeholders}) AND l.on_hand <= %s AND (l.snapshot_id IS NOT NULL OR l.purchased_qty > 0)
+                ORDER BY l.user_id, l.on_hand, p.display_name
+            """, (*user_ids, threshold))
+            result: Dict[int, List[Dict]] = defaultdict(list)
+            for row in cursor.fetchall():
+                result[row['user_id']].append(
+                    {'name': row['name'], 'quantity': float(row['quantity']), 'product_id': row['product_id']})
+            return dict(result)
+        except mysql.connector.Error as e:
+            logger.error(f"Error reading low stock for users {user_ids[0]}..{user_ids[-1]}: {e}")
+            raise RuntimeError(f"Error reading low stock: {e}")
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                conn.close()
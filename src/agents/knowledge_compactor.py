@@ -0,0 +1,135 @@
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+MAX_CATEGORY_EXAMPLES = 8
+
+
+def product_key(name: str) -> str:
+    return ' '.join(str(name).lower().split())
+
+
+def _as_date(value: Any) -> Optional[date]:
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    try:
+        return datetime.strptime(str(value)[:10], '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+
+def _number(value: Any) -> float:
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def aggregate_products(stock_items: List[Dict], receipt_items: List[Dict],
+                       on_hand: Optional[Dict[int, float]] = None) -> Dict[Any, Dict[str, Any]]:
+    """Fold receipt lines and stock rows into one aggregate per product (canonical id, else name).
+
+    Each aggregate has: name, category, purchase_count, last_purchase,
+    avg_interval_days, total_spend, last_expiration, stock_quantity and
+    on_hand (from the inventory ledger, keyed by product id, when given).
+    """
+    products: Dict[Any, Dict[str, Any]] = {}
+
+    def entry(item: Dict) -> Dict[str, Any]:
+        name, category = item['name'], item.get('category')
+        # Group on the canonical product id when ingest assigned one
+        key = item.get('product_id') or product_key(name)
+        if key not in products:
+            products[key] = {'name': name, 'category': category, 'purchase_dates': [],
+                             'total_spend': 0.0, 'last_expiration': None, 'stock_quantity': None}
+        elif category and not products[key]['category']:
+            products[key]['category'] = category
+        return products[key]
+
+    for item in receipt_items:
+        product = entry(item)
+        purchased = _as_date(item.get('purchase_date'))
+        if purchased:
+            # Expiry of the most recent batch is the one that matters for "what is expiring"
+            if not product['purchase_dates'] or purchased >= max(product['purchase_dates']):
+                product['last_expiration'] = _as_date(item.get('expiration_date')) or product['last_expiration']
+            product['purchase_dates'].append(purchased)
+        product['total_spend'] += _number(item.get('price'))
+
+    for item in stock_items:
+        product = entry(item)
+        product['stock_quantity'] = (product['stock_quantity'] or 0) + _number(item.get('quantity'))
+        stock_expiry = _as_date(item.get('expires_at'))
+        if stock_expiry and (product['last_expiration'] is None or stock_expiry < product['last_expiration']):
+            product['last_expiration'] = stock_expiry
+
+    on_hand = on_hand or {}
+    for key, product in products.items():
+        product['on_hand'] = on_hand.get(key)
+        dates = sorted(product.pop('purchase_dates'))
+        product['purchase_count'] = len(dates)
+        product['last_purchase'] = dates[-1] if dates else None
+        product['avg_interval_days'] = (
+            round((dates[-1] - dates[0]).days / (len(dates) - 1), 1) if len(dates) > 1 else None
+        )
+        product['total_spend'] = round(product['total_spend'], 2)
+    return products
+
+
+def _product_text(product: Dict[str, Any]) -> str:
+    parts = [f"Product: {product['name']}"]
+    if product['category']:
+        parts.append(f"Category: {product['category']}")
+    if product['on_hand'] is not None:
+        parts.append(f"On hand: {product['on_hand']:g}")
+    elif product['stock_quantity'] is not None:
+        parts.append(f"In stock: {product['stock_quantity']:g}")
+    if product['purchase_count']:
+        parts.append(f"Bought {product['purchase_count']}x, last {product['last_purchase'].isoformat()}")
+    if product['avg_interval_days'] is not None:
+        parts.append(f"every ~{product['avg_interval_days']:g} days")
+    if product['total_spend']:
+        parts.append(f"Spent: {product['total_spend']:.2f}")
+    if product['last_expiration']:
+        parts.append(f"Expires: {product['last_expiration'].isoformat()}")
+    return ', '.join(parts)
+
+
+def summarize_categories(products: Dict[Any, Dict[str, Any]],
+                         max_examples: int = MAX_CATEGORY_EXAMPLES) -> List[Tuple[str, Dict[str, Any]]]:
+    """One summary line per category: product count, purchases, spend and what is in stock."""
+    by_category: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    for product in products.values():
+        by_category[product['category'] or 'Uncategorized'].append(product)
+
+    summaries = []
+    for category, members in sorted(by_category.items()):
+        members.sort(key=lambda p: p['purchase_count'], reverse=True)
+        in_stock = [p for p in members if p['on_hand'] or p['stock_quantity']]
+        examples = ', '.join(p['name'] for p in members[:max_examples])
+        text = (f"Category: {category}, Products: {len(members)} ({examples}), "
+                f"Purchases: {sum(p['purchase_count'] for p in members)}, "
+                f"Spent: {sum(p['total_spend'] for p in members):.2f}, In stock: {len(in_stock)} products")
+        summaries.append((text, {'kind': 'category', 'category': category}))
+    return summaries
+
+
+def compact_knowledge(stock_items: List[Dict], receipt_items: List[Dict],
+                      on_hand: Optional[Dict[int, float]] = None) -> Tuple[List[str], List[Dict]]:
+    """Knowledge strings and parallel metadata: one per product plus one per category."""
+    products = aggregate_products(stock_items, receipt_items, on_hand)
+    knowledge, meta = [], []
+    for product in sorted(products.values(), key=lambda p: product_key(p['name'])):
+        knowledge.append(_product_text(product))
+        meta.append({
+            'kind': 'product', 'name': product['name'], 'category': product['category'],
+            'date': product['last_purchase'], 'expiration_date': product['last_expiration'],
+        })
+    for text, item_meta in summarize_categories(products):
+        knowledge.append(text)
+        meta.append(item_meta)
+    return knowledge, meta
@@ -0,0 +1,115 @@
+import os
+import sqlite3
+import yaml
+import numpy as np
+from filelock import FileLock
+from typing import Callable, Dict, Iterable, List
+
+from loggers.custom_logger import get_logger
+from loggers.metrics import CACHE_LOOKUPS, EMBEDDING_BATCH
+from agents.knowledge_compactor import product_key
+
+logger = get_logger(__name__)
+
+BASE_URL = os.path.join(os.path.dirname(__file__), '..')
+CONFIG_PATH = os.path.join(BASE_URL, 'constants', 'config.yaml')
+
+with open(CONFIG_PATH, 'r') as file:
+    config = yaml.safe_load(file)
+    catalog_config = config['deepseek'].get('catalog', {})
+    CATALOG_ENABLED = catalog_config.get('enabled', True)
+    CATALOG_DIR = os.path.join(BASE_URL, catalog_config.get('directory', 'database/product_catalog'))
+
+
+class ProductCatalog:
+    """Global, deduplicated product-name table with one embedding per canonical name.
+
+    Names live in SQLite (``catalog.db``) and the unit-normalised float32
+    embeddings in an append-only matrix file (``embeddings.f32``), where row
+    ``i`` belongs to catalog id ``i``. Every worker memory-maps the same file, so
+    the vectors sit in the OS page cache once rather than once per process per
+    user. New names are embedded and appended under a file lock. The matrix is
+    written before the SQLite rows, so a reader never sees an id without its
+    vector.
+    """
+
+    def __init__(self, encode: Callable[[List[str]], np.ndarray], dim: int, directory: str = CATALOG_DIR):
+        os.makedirs(directory, exist_ok=True)
+        self.encode = encode
+        self.dim = dim
+        self.db_path = os.path.join(directory, 'catalog.db')
+        self.matrix_path = os.path.join(directory, 'embeddings.f32')
+        self.lock = FileLock(os.path.join(directory, 'catalog.lock'))
+        self.row_bytes = dim * np.dtype(np.float32).itemsize
+        self._ids: Dict[str, int] = {}
+        self._matrix = None
+        self._rows = 0
+        with self.lock:
+            with self._connect() as conn:
+                conn.execute("CREATE TABLE IF NOT EXISTS products (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE)")
+            if not os.path.exists(self.matrix_path):
+                open(self.matrix_path, 'wb').close()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def __len__(self) -> int:
+        return os.path.getsize(self.matrix_path) // self.row_bytes
+
+    def _load_ids(self, keys: List[str]) -> None:
+        conn = self._connect()
+        try:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ', '.join(['?'] * len(chunk))
+                for catalog_id, name in conn.execute(
+                        f"SELECT id, name FROM products WHERE name IN ({placeholders})", chunk):
+                    self._ids[name] = catalog_id
+        finally:
+            conn.close()
+
+    def _add(self, keys: List[str]) -> None:
+        with self.lock:
+            # Another worker may have added some of these while we waited
+            self._load_ids(keys)
+            keys = [key for key in keys if key not in self._ids]
+            if not keys:
+                return
+            EMBEDDING_BATCH.labels('catalog').observe(len(keys))
+            vectors = np.array(self.encode(keys), dtype=np.float32)
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+            # Ids are row numbers. Drop any partial row an interrupted append left at the end,
+            # otherwise every later vector would be shifted onto the wrong id.
+            first_id = len(self)
+            with open(self.matrix_path, 'ab') as matrix_file:
+                matrix_file.truncate(first_id * self.row_bytes)
+                matrix_file.write(vectors.tobytes())
+                matrix_file.flush()
+                os.fsync(matrix_file.fileno())
+            rows = [(first_id + offset, key) for offset, key in enumerate(keys)]
+            with self._connect() as conn:
+                conn.executemany("INSERT INTO products (id, name) VALUES (?, ?)", rows)
+            self._ids.update({key: catalog_id for catalog_id, key in rows})
+            logger.info(f"Product catalog: embedded {len(keys)} new names ({first_id + len(keys)} total)")
+
+    def ids_for(self, names: Iterable[str]) -> List[int]:
+        """Catalog ids for ``names``, embedding any canonical name not seen before."""
+        keys = [product_key(name) for name in names]
+        missing = sorted({key for key in keys if key not in self._ids})
+        CACHE_LOOKUPS.labels('product_catalog', 'hit').inc(len(set(keys)) - len(missing))
+        CACHE_LOOKUPS.labels('product_catalog', 'miss').inc(len(missing))
+        if missing:
+            self._load_ids(missing)
+            missing = [key for key in missing if key not in self._ids]
+            if missing:
+                self._add(missing)
+        return [self._ids[key] for key in keys]
+
+    def vectors(self, ids: np.ndarray) -> np.ndarray:
+        """Embeddings for catalog ``ids`` (gathered from the shared memory map)."""
+        if len(ids) and int(np.max(ids)) >= self._rows:
+            self._rows = len(self)
+            self._matrix = np.memmap(self.matrix_path, dtype=np.float32, mode='r', shape=(self._rows, self.dim))
+        return np.asarray(self._matrix[ids]) if len(ids) else np.empty((0, self.dim), dtype=np.float32)
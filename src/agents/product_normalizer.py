@@ -0,0 +1,271 @@
+import os
+import re
+import threading
+import yaml
+import numpy as np
+import mysql.connector
+from collections import Counter
+from typing import Dict, List, Optional, Set
+
+from loggers.custom_logger import get_logger
+
+logger = get_logger(__name__)
+
+BASE_URL = os.path.join(os.path.dirname(__file__), '..')
+CONFIG_PATH = os.path.join(BASE_URL, 'constants', 'config.yaml')
+
+with open(CONFIG_PATH, 'r') as file:
+    config = yaml.safe_load(file)
+    PRODUCTS_TABLE = config['database']['tables'].get('products', 'products')
+    normalizer_config = config.get('products', {}).get('normalizer', {})
+    MAX_EDIT_DISTANCE = normalizer_config.get('max_edit_distance', 2)
+    MIN_TRIGRAM_SIMILARITY = normalizer_config.get('min_trigram_similarity', 0.5)
+    EMBEDDING_MATCH = normalizer_config.get('embedding_match', False)
+    MIN_EMBEDDING_SIMILARITY = normalizer_config.get('min_embedding_similarity', 0.85)
+
+# Sizes, counts and packaging words carry no product identity: "BANANAS LOOSE 1kg" -> "banana"
+UNIT_RE = re.compile(r"^\d+([.,]\d+)?(kg|g|gr|mg|l|ltr|ml|cl|oz|lb|lbs|pk|pcs|ct|x)?$")
+NOISE_WORDS = {'loose', 'pack', 'packet', 'pk', 'pcs', 'each', 'ea', 'bag', 'bunch', 'approx', 'per',
+               'kg', 'g', 'l', 'ml', 'x', 'ct', 'tin', 'can', 'bottle', 'btl', 'jar', 'box', 'the', 'of'}
+
+
+def _singular(token: str) -> str:
+    if len(token) <= 3 or token.endswith('ss'):
+        return token
+    if token.endswith('ies'):
+        return token[:-3] + 'y'
+    if token.endswith('oes'):
+        return token[:-2]
+    if token.endswith('s'):
+        return token[:-1]
+    return token
+
+
+def canonical_name(name: str) -> str:
+    """Token rules: lowercase, strip punctuation, sizes and packaging words, singularise."""
+    tokens = re.findall(r"[a-z0-9.,]+", str(name).lower())
+    kept = [_singular(token.strip('.,')) for token in tokens
+            if token.strip('.,') and not UNIT_RE.match(token) and token.strip('.,') not in NOISE_WORDS]
+    return ' '.join(kept) or ' '.join(str(name).lower().split())
+
+
+def trigrams(text: str) -> Set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def bounded_edit_distance(a: str, b: str, limit: int) -> Optional[int]:
+    """Levenshtein distance, or None as soon as it must exceed ``limit`` (banded DP)."""
+    if abs(len(a) - len(b)) > limit:
+        return None
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, start=1):
+        current = [i] + [0] * len(b)
+        row_min = i
+        for j, char_b in enumerate(b, start=1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b))
+            row_min = min(row_min, current[j])
+        if row_min > limit:
+            return None
+        previous = current
+    return previous[-1] if previous[-1] <= limit else None
+
+
+class ProductNormalizer:
+    """Maps free-text item names to canonical product ids at ingest time.
+
+    Matching runs in order: exact canonical name, then a trigram index filtered
+    by a bounded edit distance, then (optionally) embedding nearest neighbour
+    through the shared product catalog. Names that match nothing become new
+    ``products`` rows. The name-to-id cache is loaded once per worker and
+    filled as names are resolved.
+    """
+
+    def __init__(self, db_config: Dict, max_edit_distance: int = MAX_EDIT_DISTANCE,
+                 min_trigram_similarity: float = MIN_TRIGRAM_SIMILARITY):
+        self.db_config = db_config
+        self.max_edit_distance = max_edit_distance
+        self.min_trigram_similarity = min_trigram_similarity
+        self.catalog = None
+        self._lock = threading.Lock()
+        self._by_name: Dict[str, int] = {}
+        self._names: Dict[int, str] = {}
+        self._trigram_index: Dict[str, Set[int]] = {}
+        self._resolved: Dict[str, int] = {}
+        self._embedding_matrix = None
+        self.create_schema()
+        self._load()
+
+    def use_catalog(self, catalog) -> None:
+        """Enable embedding nearest-neighbour matching through a ``ProductCatalog``."""
+        if EMBEDDING_MATCH:
+            self.catalog = catalog
+
+    def create_schema(self) -> None:
+        """Create the products table."""
+        conn = None
+        cursor = None
+        try:
+            conn = mysql.connector.connect(**self.db_config)
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS {PRODUCTS_TABLE} (
+                    id INT NOT NULL AUTO_INCREMENT,
+                    canonical_name VARCHAR(255) NOT NULL,
+                    display_name VARCHAR(255) NOT NULL,
+                    category VARCHAR(64),
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (id),
+                    UNIQUE KEY uq_products_canonical (canonical_name)
+                )
+            """)
+            conn.commit()
+        except mysql.connector.Error as e:
+            logger.error(f"Error creating products schema: {e}")
+            raise RuntimeError(f"Error creating products schema: {e}")
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                conn.close()
+
+    def ensure_product_column(self, table: str) -> None:
+        """Add an indexed ``product_id`` column to an item table that predates it."""
+        conn = None
+        cursor = None
+        try:
+            conn = mysql.connector.connect(**self.db_config)
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT COUNT(*) FROM information_schema.columns "
+                "WHERE table_schema = DATABASE() AND table_name = %s AND column_name = 'product_id'",
+                (table,)
+            )
+            if cursor.fetchone()[0] == 0:
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN product_id INT NULL, "
+                               f"ADD INDEX idx_{table}_user_product (user_id, product_id)")
+                conn.commit()
+                logger.info(f"Added product_id column to {table}")
+        except mysql.connector.Error as e:
+            logger.error(f"Error adding product_id to {table}: {e}")
+            raise RuntimeError(f"Error adding product_id to {table}: {e}")
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                conn.close()
+
+    def _remember(self, product_id: int, name: str) -> None:
+        self._by_name[name] = product_id
+        self._names[product_id] = name
+        for gram in trigrams(name):
+            self._trigram_index.setdefault(gram, set()).add(product_id)
+
+    def _load(self) -> None:
+        conn = None
+        cursor = None
+        try:
+            conn = mysql.connector.connect(**self.db_config)
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT id, canonical_name FROM {PRODUCTS_TABLE}")
+            for product_id, name in cursor.fetchall():
+                self._remember(product_id, name)
+            logger.info(f"Loaded {len(self._by_name)} canonical products")
+        except mysql.connector.Error as e:
+            logger.error(f"Error loading products: {e}")
+            raise RuntimeError(f"Error loading products: {e}")
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                conn.close()
+
+    def _fuzzy_match(self, name: str) -> Optional[int]:
+        grams = trigrams(name)
+        overlap = Counter()
+        for gram in grams:
+            for product_id in self._trigram_index.get(gram, ()):
+                overlap[product_id] += 1
+        best_id, best_distance = None, None
+        for product_id, shared in overlap.most_common(20):
+            candidate = self._names[product_id]
+            similarity = shared / len(grams | trigrams(candidate))
+            if similarity < self.min_trigram_similarity:
+                continue
+            # Short names get a tighter bound so "pear" never matches "bear"
+            limit = min(self.max_edit_distance, max(len(name), len(candidate)) // 5)
+            distance = bounded_edit_distance(name, candidate, limit)
+            if distance is not None and (best_distance is None or distance < best_distance):
+                best_id, best_distance = product_id, distance
+        return best_id
+
+    def _embedding_match(self, name: str) -> Optional[int]:
+        if self.catalog is None or not self._names:
+            return None
+        if self._embedding_matrix is None or len(self._embedding_matrix[0]) != len(self._names):
+            product_ids = list(self._names)
+            catalog_ids = self.catalog.ids_for([self._names[i] for i in product_ids])
+            self._embedding_matrix = (product_ids, self.catalog.vectors(np.array(catalog_ids)))
+        product_ids, vectors = self._embedding_matrix
+        query = self.catalog.vectors(np.array(self.catalog.ids_for([name])))[0]
+        scores = vectors @ query
+        best = int(np.argmax(scores))
+        return product_ids[best] if scores[best] >= MIN_EMBEDDING_SIMILARITY else None
+
+    def match(self, name: str) -> Optional[int]:
+        """Canonical product id for ``name`` without creating one, or None."""
+        canonical = canonical_name(name)
+        if canonical in self._by_name:
+            return self._by_name[canonical]
+        return self._fuzzy_match(canonical) or self._embedding_match(canonical)
+
+    def _create(self, items: List[Dict]) -> Dict[str, int]:
+        """Insert new canonical products on a separate, immediately committed connection.
+
+        Committing them independently of the caller keeps the in-memory cache
+        valid even if the caller's transaction rolls back (the product just
+        stays unused).
+        """
+        conn = None
+        cursor = None
+        created = {}
+        try:
+            conn = mysql.connector.connect(**self.db_config)
+            cursor = conn.cursor()
+            for item in items:
+                canonical = canonical_name(item['name'])
+                cursor.execute(
+                    f"INSERT INTO {PRODUCTS_TABLE} (canonical_name, display_name, category) VALUES (%s, %s, %s) "
+                    f"ON DUPLICATE KEY UPDATE id = LAST_INSERT_ID(id)",
+                    (canonical, str(item['name']).strip()[:255], item.get('category'))
+                )
+                created[canonical] = cursor.lastrowid
+            conn.commit()
+            return created
+        except mysql.connector.Error as e:
+            logger.error(f"Error creating products: {e}")
+            raise RuntimeError(f"Error creating products: {e}")
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                conn.close()
+
+    def resolve(self, items: List[Dict]) -> List[int]:
+        """Product id for each item (``name``/``category`` dicts), creating products as needed."""
+        with self._lock:
+            unmatched = {}
+            for item in items:
+                canonical = canonical_name(item['name'])
+                if canonical not in self._resolved:
+                    product_id = self.match(item['name'])
+                    if product_id is None:
+                        unmatched.setdefault(canonical, item)
+                    else:
+                        self._resolved[canonical] = product_id
+            if unmatched:
+                for canonical, product_id in self._create(list(unmatched.values())).items():
+                    self._remember(product_id, canonical)
+                    self._resolved[canonical] = product_id
+                logger.info(f"Created {len(unmatched)} canonical products")
+            return [self._resolved[canonical_name(item['name'])] for item in items]
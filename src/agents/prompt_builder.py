@@ -0,0 +1,120 @@
+import os
+import yaml
+from functools import lru_cache
+from typing import Callable, List, Optional, Tuple
+
+from loggers.custom_logger import get_logger
+
+logger = get_logger(__name__)
+
+BASE_URL = os.path.join(os.path.dirname(__file__), '..')
+CONFIG_PATH = os.path.join(BASE_URL, 'constants', 'config.yaml')
+
+with open(CONFIG_PATH, 'r') as file:
+    config = yaml.safe_load(file)
+    prompt_config = config['deepseek'].get('prompt', {})
+    CONTEXT_TOKEN_BUDGET = prompt_config.get('context_token_budget', 800)
+    MEMORY_TOKEN_BUDGET = prompt_config.get('memory_token_budget', 400)
+    PRICE_PER_MILLION_INPUT_TOKENS = prompt_config.get('price_per_million_input_tokens', 0.27)
+
+SYSTEM_PREAMBLE = (
+    "You are a smart grocery assistant helping reduce food waste and manage groceries. "
+    "Answer the query based ONLY on the facts in the Context section and user details. "
+    "Do NOT guess or assume information, especially about expiration dates or shelf life, "
+    "unless explicitly stated in the context. Consider these factors in EVERY response:\n"
+    "1. User allergies (e.g., avoid peanuts, rice)\n"
+    "2. Dietary preferences (e.g., vegetarian, vegan, gluten-free)\n"
+    "3. Health conditions (e.g., diabetes requires low-sugar recipes)\n"
+    "4. Current stock levels, categories, and shelf life from context\n"
+    "5. Recent purchases from receipts\n"
+    "Provide practical, specific advice in a friendly tone with simple markdown formatting. "
+    "Use bullet points, avoid ### headers, and avoid **bold** markers. "
+    "Include emojis for options (🥧), tips (📝), and closers (😊).\n\n"
+)
+
+
+def approximate_token_count(text: str) -> int:
+    """Fallback counter (~4 characters per token) when no tokenizer is available."""
+    return max(1, (len(text) + 3) // 4)
+
+
+@lru_cache(maxsize=4096)
+def _cached_token_count(count: Callable[[str], int], text: str) -> int:
+    # Keyed on the counter function, not the builder, so the cache never keeps a builder alive
+    return count(text)
+
+
+class PromptBuilder:
+    """Assembles chat prompts within a token budget.
+
+    Context items arrive ordered by relevance; they are deduplicated and packed
+    greedily until ``context_token_budget`` is used. The static preamble is
+    tokenized once and reused.
+    """
+
+    def __init__(self, count_tokens: Optional[Callable[[str], int]] = None,
+                 context_token_budget: int = CONTEXT_TOKEN_BUDGET,
+                 memory_token_budget: int = MEMORY_TOKEN_BUDGET,
+                 price_per_million_tokens: float = PRICE_PER_MILLION_INPUT_TOKENS):
+        self._count = count_tokens or approximate_token_count
+        self.context_token_budget = context_token_budget
+        self.memory_token_budget = memory_token_budget
+        self.price_per_million_tokens = price_per_million_tokens
+        self.preamble_tokens = self._count(SYSTEM_PREAMBLE)
+
+    def count_tokens(self, text: str) -> int:
+        return _cached_token_count(self._count, text)
+
+    @staticmethod
+    def dedupe(items: List[str]) -> List[str]:
+        seen = set()
+        unique = []
+        for item in items:
+            key = ' '.join(item.lower().split())
+            if key and key not in seen:
+                seen.add(key)
+                unique.append(item)
+        return unique
+
+    def pack(self, items: List[str], budget: int) -> Tuple[List[str], int]:
+        """Keep items in order while they fit in ``budget`` tokens; returns (items, tokens_used)."""
+        packed, used = [], 0
+        for item in items:
+            cost = self.count_tokens(item) + 1  # + newline separator
+            if used + cost > budget:
+                continue
+            packed.append(item)
+            used += cost
+        return packed, used
+
+    def _trim_memory(self, memory: str) -> str:
+        """Keep the most recent lines of the conversation memory within its budget."""
+        lines = memory.splitlines()
+        kept, used = [], 0
+        for line in reversed(lines):
+            cost = self.count_tokens(line) + 1
+            if used + cost > self.memory_token_budget:
+                break
+            kept.append(line)
+            used += cost
+        return '\n'.join(reversed(kept))
+
+    def build(self, query: str, context: List[str], memory: str = '') -> str:
+        context_items, context_tokens = self.pack(self.dedupe(context), self.context_token_budget)
+        memory = self._trim_memory(memory) if memory else ''
+
+        prompt = SYSTEM_PREAMBLE
+        if context_items:
+            prompt += "Context:\n" + "\n".join(context_items) + "\n\n"
+        if memory:
+            prompt += "Conversation so far:\n" + memory + "\n\n"
+        prompt += f"Query: {query}\nAnswer:"
+
+        total_tokens = (self.preamble_tokens + context_tokens + self.count_tokens(memory or ' ')
+                        + self.count_tokens(query) + 4)
+        cost = total_tokens * self.price_per_million_tokens / 1_000_000
+        logger.info(
+            f"Prompt built: ~{total_tokens} tokens (preamble {self.preamble_tokens}, "
+            f"context {context_tokens} from {len(context_items)}/{len(context)} items), est. input cost ${cost:.6f}"
+        )
+        return prompt
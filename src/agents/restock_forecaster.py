@@ -0,0 +1,226 @@
+import os
+import time
+import yaml
+import numpy as np
+import pandas as pd
+import mysql.connector
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+
+from loggers.custom_logger import get_logger
+from db_managers.bulk_writer import BulkWriter
+
+logger = get_logger(__name__)
+
+BASE_URL = os.path.join(os.path.dirname(__file__), '..')
+CONFIG_PATH = os.path.join(BASE_URL, 'constants', 'config.yaml')
+
+with open(CONFIG_PATH, 'r') as file:
+    config = yaml.safe_load(file)
+    tables = config['database']['tables']
+    RECEIPTS_TABLE = tables['receipts']
+    PRODUCTS_TABLE = tables.get('products', 'products')
+    FORECASTS_TABLE = tables.get('restock_forecasts', 'restock_forecasts')
+    forecast_config = config.get('forecast', {})
+    SMOOTHING_ALPHA = forecast_config.get('smoothing_alpha', 0.4)
+    MIN_PURCHASES = forecast_config.get('min_purchases', 3)
+    OUTLIER_IQR_FACTOR = forecast_config.get('outlier_iqr_factor', 1.5)
+    HISTORY_DAYS = forecast_config.get('history_days', 365)
+    RESTOCK_WINDOW_DAYS = forecast_config.get('restock_window_days', 7)
+    FETCH_CHUNK_ROWS = forecast_config.get('fetch_chunk_rows', 50000)
+
+FORECAST_COLUMNS = ("user_id", "product_id", "purchases", "avg_interval_days", "rate_per_day",
+                    "last_purchase", "predicted_run_out")
+
+
+def forecast_frame(purchases: pd.DataFrame, alpha: float = SMOOTHING_ALPHA, min_purchases: int = MIN_PURCHASES,
+                   iqr_factor: float = OUTLIER_IQR_FACTOR) -> pd.DataFrame:
+    """Per (user_id, product_id) consumption forecasts from purchase history, vectorised across all groups.
+
+    ``purchases`` has columns user_id, product_id, purchase_date, quantity.
+    Same-day lines are summed. Inter-purchase intervals are clipped to each
+    group's Tukey fences (Q1/Q3 ± ``iqr_factor`` × IQR) and smoothed with an
+    exponentially weighted mean. The same is done for purchase quantities.
+    The consumption rate is smoothed quantity / smoothed interval. The last
+    purchase is predicted to run out after last_quantity / rate days.
+    """
+    keys = ['user_id', 'product_id']
+    daily = (purchases.assign(purchase_date=pd.to_datetime(purchases['purchase_date']))
+             .groupby(keys + ['purchase_date'], as_index=False)['quantity'].sum()
+             .sort_values(keys + ['purchase_date']))
+    counts = daily.groupby(keys)['purchase_date'].transform('size')
+    daily = daily[counts >= min_purchases].copy()
+    if daily.empty:
+        return pd.DataFrame(columns=FORECAST_COLUMNS)
+
+    grouped = daily.groupby(keys, sort=False)
+    daily['interval'] = grouped['purchase_date'].diff().dt.days
+    intervals = daily.dropna(subset=['interval'])
+    fences = intervals.groupby(keys)['interval'].quantile([0.25, 0.75]).unstack()
+    fences.columns = ['q1', 'q3']
+    iqr = fences['q3'] - fences['q1']
+    fences['low'] = (fences['q1'] - iqr_factor * iqr).clip(lower=1)
+    fences['high'] = fences['q3'] + iqr_factor * iqr
+    intervals = intervals.join(fences[['low', 'high']], on=keys)
+    intervals['interval'] = intervals['interval'].clip(intervals['low'], intervals['high'])
+
+    smoothed_interval = (intervals.groupby(keys)['interval'].ewm(alpha=alpha, adjust=False).mean()
+                         .groupby(level=[0, 1]).last())
+    smoothed_quantity = (daily.groupby(keys)['quantity'].ewm(alpha=alpha, adjust=False).mean()
+                         .groupby(level=[0, 1]).last())
+    last = grouped.tail(1).set_index(keys)
+
+    result = pd.DataFrame({
+        'purchases': grouped.size(),
+        'avg_interval_days': smoothed_interval,
+        'rate_per_day': smoothed_quantity / smoothed_interval.clip(lower=1),
+        'last_purchase': last['purchase_date'],
+        'last_quantity': last['quantity'],
+    })
+    days_left = np.ceil(result['last_quantity'] / result['rate_per_day'].replace(0, np.nan)).fillna(result['avg_interval_days'])
+    result['predicted_run_out'] = result['last_purchase'] + pd.to_timedelta(days_left, unit='D')
+    result = result.reset_index()
+    result['avg_interval_days'] = result['avg_interval_days'].round(1)
+    result['rate_per_day'] = result['rate_per_day'].round(3)
+    return result[list(FORECAST_COLUMNS)]
+
+
+class RestockForecaster:
+    """Nightly batch job that forecasts when each user's regularly bought products run out.
+
+    Purchase history for all users is read in one pass (streamed in chunks)
+    and forecast with a single vectorised ``forecast_frame`` call. The results
+    replace the ``restock_forecasts`` table. Requests only read that table.
+    """
+
+    def __init__(self, db_config: Dict):
+        self.db_config = db_config
+        self.bulk_writer = BulkWriter()
+        self.create_table()
+
+    def create_table(self) -> None:
+        conn = None
+        cursor = None
+        try:
+            conn = mysql.connector.connect(**self.db_config)
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS {FORECASTS_TABLE} (
+                    user_id INT NOT NULL,
+                    product_id INT NOT NULL,
+                    purchases INT NOT NULL,
+                    avg_interval_days DOUBLE NOT NULL,
+                    rate_per_day DOUBLE NOT NULL,
+                    last_purchase DATE NOT NULL,
+                    predicted_run_out DATE NOT NULL,
+                    computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (user_id, product_id),
+                    INDEX idx_forecasts_user_run_out (user_id, predicted_run_out)
+                )
+            """)
+            conn.commit()
+        except mysql.connector.Error as e:
+            logger.error(f"Error creating {FORECASTS_TABLE} table: {e}")
+            raise RuntimeError(f"Error creating {FORECASTS_TABLE} table: {e}")
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                conn.close()
+
+    def _load_history(self, cursor, since: date) -> pd.DataFrame:
+        cursor.execute(
+            f"SELECT user_id, product_id, purchase_date, quantity FROM {RECEIPTS_TABLE} "
+            f"WHERE product_id IS NOT NULL AND purchase_date >= %s",
+            (since,)
+        )
+        frames = []
+        while True:
+            rows = cursor.fetchmany(FETCH_CHUNK_ROWS)
+            if not rows:
+                break
+            frames.append(pd.DataFrame(rows, columns=['user_id', 'product_id', 'purchase_date', 'quantity']))
+        if not frames:
+            return pd.DataFrame(columns=['user_id', 'product_id', 'purchase_date', 'quantity'])
+        history = pd.concat(frames, ignore_index=True)
+        history['quantity'] = history['quantity'].astype(float)
+        return history
+
+    def run(self, history_days: int = HISTORY_DAYS) -> Dict:
+        """Recompute forecasts for every user and replace the forecasts table."""
+        started = time.perf_counter()
+        conn = None
+        cursor = None
+        try:
+            conn = mysql.connector.connect(**self.db_config)
+            cursor = conn.cursor()
+            history = self._load_history(cursor, date.today() - timedelta(days=history_days))
+            forecasts = forecast_frame(history)
+            rows = [
+                (int(r.user_id), int(r.product_id), int(r.purchases), float(r.avg_interval_days),
+                 float(r.rate_per_day), r.last_purchase.date(), r.predicted_run_out.date())
+                for r in forecasts.itertuples(index=False)
+            ]
+            cursor.execute(f"DELETE FROM {FORECASTS_TABLE}")
+            self.bulk_writer.insert_rows(cursor, FORECASTS_TABLE, FORECAST_COLUMNS, rows)
+            conn.commit()
+        except mysql.connector.Error as e:
+            logger.error(f"Restock forecast failed: {e}")
+            if conn:
+                conn.rollback()
+            raise RuntimeError(f"Restock forecast failed: {e}")
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                conn.close()
+        stats = {'purchase_rows': len(history), 'forecasts': len(rows),
+                 'duration_s': round(time.perf_counter() - started, 2)}
+        logger.info(f"Restock forecast: {stats['forecasts']} product forecasts from "
+                    f"{stats['purchase_rows']} purchase rows in {stats['duration_s']}s")
+        return stats
+
+    def restock_soon(self, user_id: int, days: int = RESTOCK_WINDOW_DAYS, today: Optional[date] = None) -> List[Dict]:
+        """Products predicted to run out within ``days``, soonest first.
+
+        Forecasts that ran out more than ``days`` ago are skipped: the user has
+        most likely stopped buying that product.
+        """
+        return self.restock_soon_for_users([user_id], days, today).get(user_id, [])
+
+    def restock_soon_for_users(self, user_ids: List[int], days: int = RESTOCK_WINDOW_DAYS,
+                               today: Optional[date] = None) -> Dict[int, List[Dict]]:
+        """``restock_soon`` for many users in one query, keyed by user id."""
+        if not user_ids:
+            return {}
+        today = today or date.today()
+        placeholders = ", ".join(["%s"] * len(user_ids))
+        conn = None
+        cursor = None
+        try:
+            conn = mysql.connector.connect(**self.db_config)
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute(f"""
+                SELECT f.user_id, p.display_name AS name, f.predicted_run_out, f.avg_interval_days, f.rate_per_day
+                FROM {FORECASTS_TABLE} f
+                JOIN {PRODUCTS_TABLE} p ON p.id = f.product_id
+                WHERE f.user_id IN ({placeholders}) AND f.predicted_run_out BETWEEN %s AND %s
+                ORDER BY f.user_id, f.predicted_run_out
+            """, (*user_ids, today - timedelta(days=days), today + timedelta(days=days)))
+            result: Dict[int, List[Dict]] = {}
+            for row in cursor.fetchall():
+                result.setdefault(row['user_id'], []).append({
+                    'name': row['name'],
+                    'run_out_date': row['predicted_run_out'].strftime('%Y-%m-%d'),
+                    'every_days': row['avg_interval_days'],
+                    'rate_per_day': row['rate_per_day'],
+                })
+            return result
+        except mysql.connector.Error as e:
+            logger.error(f"Error reading restock forecasts for users {user_ids[0]}..{user_ids[-1]}: {e}")
+            raise RuntimeError(f"Error reading restock forecasts: {e}")
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                conn.close()
@@ -2,13 +2,20 @@ import google.generativeai as genai
 import json
 import mysql.connector
 from pydantic import BaseModel, Field, validator
-from datetime import datetime
+from datetime import datetime, timedelta
 import yaml
 import os
 from dotenv import load_dotenv
 from mysql.connector import pooling
 
-from loggers.custom_logger import logger
+from loggers.custom_logger import get_logger
+from loggers.tracing import span
+from db_managers.bulk_writer import BulkWriter
+from agents.extraction_cache import ExtractionCache, hash_image
+from agents.product_normalizer import ProductNormalizer
+from agents.inventory_ledger import InventoryLedger
+
+logger = get_logger(__name__)
 
 # Load environment variables and configuration
 load_dotenv()
@@ -37,6 +44,20 @@ db_config = {
     "port": PORT
 }
 
+# Bump STOCK_PROMPT_VERSION whenever STOCK_PROMPT changes so cached extractions are not reused
+STOCK_PROMPT_VERSION = "stock-v1"
+STOCK_PROMPT = (
+    "Extract all grocery items from the image and format the information as structured data. "
+    "Each item should include the following fields: name, quantity, weight, category, shelf_life. "
+    "Details about each field are as follows: "
+    "1. name: The name of the grocery item. "
+    "2. quantity: If no quantity is provided, default to 1. "
+    "3. weight: If no weight is provided, default to 1.0. Extract number only "
+    "4. category: Categorize each item (e.g., fruit, vegetable, dairy, bakery, etc.). "
+    "5. shelf_life: Estimate the shelf_life of the item in days as an integer. "
+    "Return the extracted data in a well-structured JSON format."
+)
+
 # Pydantic model for stock data validation
 class StockData(BaseModel):
     name: str = Field(..., description="Name of the grocery item")
@@ -45,6 +66,31 @@ class StockData(BaseModel):
     category: str = Field(..., description="Category of the item")
     shelf_life: int = Field(..., description="Shelf life of the item in days")
 
+
+def parse_stock_response(raw_data):
+    """Parse and validate the raw Gemini text for a stock image into a list of item dicts."""
+    raw_data = raw_data.strip()
+    if raw_data.startswith('```json') and raw_data.endswith('```'):
+        raw_data = raw_data[7:-3].strip()
+    parsed_data = json.loads(raw_data)
+    logger.info("Parsed data successfully.")
+    processed_data = []
+    for item in parsed_data:
+        mapped_item = {
+            "name": item.get("name"),
+            "quantity": int(item.get("quantity", 1)),
+            "weight": float(item.get("weight", 1.0)),
+            "category": item.get("category"),
+            "shelf_life": int(item.get("shelf_life")),
+        }
+        try:
+            validated_item = StockData(**mapped_item).model_dump()
+            processed_data.append(validated_item)
+            logger.info(f"Processed item: {validated_item}")
+        except Exception as e:
+            logger.error(f"Validation error for item {item}: {e}")
+    return processed_data
+
 # StockProcessorAgent class
 class StockProcessorAgent:
     def __init__(self, api_key):
@@ -52,11 +98,16 @@ class StockProcessorAgent:
         self.model_name = GEMINI_MODEL
         genai.configure(api_key=self.api_key)
         self.db_config = db_config
+        self.bulk_writer = BulkWriter()
+        self.extraction_cache = ExtractionCache()
         # Create the table schema on initialization
         self.verify_users_table()
         self.create_all_stock_db()
         self.create_stock_images_table()
         self.create_stock_table()
+        self.product_normalizer = ProductNormalizer(self.db_config)
+        self.product_normalizer.ensure_product_column(STOCK_TABLE)
+        self.inventory_ledger = InventoryLedger(self.db_config)
         
         logger.info("Stock database schema initialized.")
        
@@ -113,6 +164,7 @@ class StockProcessorAgent:
                     shelf_life INTEGER NOT NULL,
                     user_id INTEGER NOT NULL,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    expires_at DATETIME NULL,
                     stock_id INTEGER NOT NULL,
                     FOREIGN KEY (user_id) REFERENCES users(id),
                     FOREIGN KEY (stock_id) REFERENCES all_stock(id)
@@ -157,41 +209,29 @@ class StockProcessorAgent:
             with open(image_path, "rb") as img_file:
                 image_data = img_file.read()
                 logger.info("Image read successfully.")
-            prompt = (
-                "Extract all grocery items from the image and format the information as structured data. "
-                "Each item should include the following fields: name, quantity, weight, category, shelf_life. "
-                "Details about each field are as follows: "
-                "1. name: The name of the grocery item. "
-                "2. quantity: If no quantity is provided, default to 1. "
-                "3. weight: If no weight is provided, default to 1.0. Extract number only "
-                "4. category: Categorize each item (e.g., fruit, vegetable, dairy, bakery, etc.). "
-                "5. shelf_life: Estimate the shelf_life of the item in days as an integer. "
-                "Return the extracted data in a well-structured JSON format."
-            )
-            model = genai.GenerativeModel(self.model_name)
-            mime_type = "image/png" if image_path.endswith(".png") else "image/jpeg"
-            response = model.generate_content([{"mime_type": mime_type, "data": image_data}, prompt])
-            raw_data = response.text.strip()
-            logger.info("Raw data received from generative model.")
-            if raw_data.startswith('```json') and raw_data.endswith('```'):
-                raw_data = raw_data[7:-3].strip()
-            parsed_data = json.loads(raw_data)
-            logger.info("Parsed data successfully.")
-            processed_data = []
-            for item in parsed_data:
-                mapped_item = {
-                    "name": item.get("name"),
-                    "quantity": int(item.get("quantity", 1)),
-                    "weight": float(item.get("weight", 1.0)),
-                    "category": item.get("category"),
-                    "shelf_life": int(item.get("shelf_life")),
-                }
+            image_hash = hash_image(image_data)
+            cached = self.extraction_cache.get(image_hash, self.model_name, STOCK_PROMPT_VERSION)
+            processed_data = None
+            if cached:
+                logger.info(f"Extraction cache hit for stock image {image_hash[:12]}")
                 try:
-                    validated_item = StockData(**mapped_item).model_dump()
-                    processed_data.append(validated_item)
-                    logger.info(f"Processed item: {validated_item}")
-                except Exception as e:
-                    logger.error(f"Validation error for item {item}: {e}")
+                    processed_data = parse_stock_response(cached["raw_text"])
+                except (ValueError, KeyError, TypeError) as e:
+                    logger.warning(f"Evicting unparseable cached extraction {image_hash[:12]}: {e}")
+                    self.extraction_cache.delete(image_hash, self.model_name, STOCK_PROMPT_VERSION)
+                    cached = None
+            if cached is None:
+                model = genai.GenerativeModel(self.model_name)
+                mime_type = "image/png" if image_path.endswith(".png") else "image/jpeg"
+                with span('gemini', kind='external'):
+                    response = model.generate_content([{"mime_type": mime_type, "data": image_data}, STOCK_PROMPT])
+                raw_data = response.text.strip()
+                logger.info("Raw data received from generative model.")
+                # Parse before caching so a malformed reply is retried on the next upload
+                processed_data = parse_stock_response(raw_data)
+                self.extraction_cache.put(image_hash, self.model_name, STOCK_PROMPT_VERSION, raw_data, processed_data)
+            elif cached["parsed_items"] != processed_data:
+                self.extraction_cache.update_parsed(image_hash, self.model_name, STOCK_PROMPT_VERSION, processed_data)
             return processed_data
         except FileNotFoundError:
             logger.error(f"Image file not found: {image_path}")
@@ -227,9 +267,18 @@ class StockProcessorAgent:
             
             logger.info(f"Saved {len(data)} stock items for user_id {user_id}.")
             
-            for item in data:
-                query = f"INSERT INTO {STOCK_TABLE} (name, quantity, weight, category, shelf_life, user_id, stock_id) VALUES (%s, %s, %s, %s, %s, %s, %s)"
-                cursor.execute(query, (item['name'], item['quantity'], item['weight'], item['category'], item['shelf_life'], user_id, stock_id))
+            product_ids = self.product_normalizer.resolve(data)
+            now = datetime.now().replace(microsecond=0)
+            rows = [
+                (item['name'], item['quantity'], item['weight'], item['category'], item['shelf_life'], user_id, stock_id,
+                 product_id, now + timedelta(days=item['shelf_life']))
+                for item, product_id in zip(data, product_ids)
+            ]
+            self.bulk_writer.insert_rows(
+                cursor, STOCK_TABLE,
+                ("name", "quantity", "weight", "category", "shelf_life", "user_id", "stock_id", "product_id", "expires_at"),
+                rows)
+            self.inventory_ledger.record(cursor, STOCK_TABLE, user_id, data, product_ids, snapshot_id=stock_id)
             conn.commit()
             logger.info(f"Saved {len(data)} stock items for user_id {user_id} with stock_id {stock_id}.")
             return stock_id
@@ -249,7 +298,7 @@ class StockProcessorAgent:
             try:
                 conn = mysql.connector.connect(**self.db_config)
                 cursor = conn.cursor()
-                query = f"SELECT id, name, quantity, weight, category, shelf_life FROM {STOCK_TABLE} WHERE user_id = %s"
+                query = f"SELECT id, name, quantity, weight, category, shelf_life, product_id, expires_at FROM {STOCK_TABLE} WHERE user_id = %s"
                 cursor.execute(query, (user_id,))
                 result = [
                     {
@@ -258,7 +307,9 @@ class StockProcessorAgent:
                         "quantity": row[2],
                         "weight": row[3],
                         "category": row[4],
-                        "shelf_life": row[5]
+                        "shelf_life": row[5],
+                        "product_id": row[6],
+                        "expires_at": row[7].strftime("%Y-%m-%d") if row[7] else None
                     }
                     for row in cursor.fetchall()
                 ]
@@ -313,6 +364,19 @@ class StockProcessorAgent:
             logger.error(f"Error fetching latest filename for user {user_id}: {e}")
             raise RuntimeError(f"Error fetching latest filename for user {user_id}: {e}")
 
+    def get_image_paths(self, user_id):
+        """Return every stored stock image filename for a user."""
+        try:
+            conn = mysql.connector.connect(**self.db_config)
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT image_path FROM {STOCK_IMAGES_TABLE} WHERE user_id = %s", (user_id,))
+            result = [row[0] for row in cursor.fetchall()]
+            cursor.close()
+            conn.close()
+            return result
+        except mysql.connector.Error as e:
+            logger.error(f"Error fetching image paths for user {user_id}: {e}")
+            raise RuntimeError(f"Error fetching image paths for user {user_id}: {e}")
 
     def delete_stock(self, user_id, item_id):
         """Delete a specific stock item and clean up related records if necessary."""
@@ -326,6 +390,7 @@ class StockProcessorAgent:
                 return
 
             stock_id = result[0]
+            self.inventory_ledger.remove(cursor, STOCK_TABLE, "id = %s AND user_id = %s", (item_id, user_id))
             cursor.execute(f"DELETE FROM {STOCK_TABLE} WHERE id = %s AND user_id = %s", (item_id, user_id))
             items_deleted = cursor.rowcount
 
@@ -369,6 +434,7 @@ class StockProcessorAgent:
             stock_deleted = cursor.rowcount
             
             # Delete stock table (may have foreign key to stockimages)
+            self.inventory_ledger.remove(cursor, STOCK_TABLE, "user_id = %s", (user_id,))
             cursor.execute(f"DELETE FROM {STOCK_TABLE} WHERE user_id = %s", (user_id,))
             items_deleted = cursor.rowcount
             
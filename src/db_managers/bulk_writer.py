@@ -0,0 +1,69 @@
+import os
+import time
+import yaml
+import mysql.connector
+from typing import List, Sequence, Tuple, Any
+
+from loggers.custom_logger import get_logger
+
+logger = get_logger(__name__)
+
+BASE_URL = os.path.join(os.path.dirname(__file__), '..')
+CONFIG_PATH = os.path.join(BASE_URL, 'constants', 'config.yaml')
+
+with open(CONFIG_PATH, 'r') as file:
+    config = yaml.safe_load(file)
+    BULK_CHUNK_SIZE = config['database'].get('bulk_insert', {}).get('chunk_size', 500)
+
+
+class BulkWriter:
+    """Multi-row INSERT writer shared by the receipt and stock agents.
+
+    Rows are written as ``INSERT ... VALUES (...),(...)`` batches of
+    ``chunk_size`` rows on the caller's cursor, so they take part in the
+    caller's transaction: nothing is committed here.
+    """
+
+    def __init__(self, chunk_size: int = BULK_CHUNK_SIZE):
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be at least 1")
+        self.chunk_size = chunk_size
+
+    def _build_query(self, table: str, columns: Sequence[str], row_count: int) -> str:
+        placeholders = "(" + ", ".join(["%s"] * len(columns)) + ")"
+        values = ", ".join([placeholders] * row_count)
+        return f"INSERT INTO {table} ({', '.join(columns)}) VALUES {values}"
+
+    def insert_rows(self, cursor, table: str, columns: Sequence[str], rows: List[Tuple[Any, ...]]) -> List[int]:
+        """Insert ``rows`` into ``table`` and return the generated ids in row order.
+
+        A multi-row INSERT is a "simple insert" for InnoDB, so the auto-increment
+        ids of one statement are consecutive starting at ``lastrowid``.
+        """
+        if not rows:
+            return []
+        for row in rows:
+            if len(row) != len(columns):
+                raise ValueError(f"Row {row} does not match columns {list(columns)}")
+
+        ids = []
+        started = time.perf_counter()
+        try:
+            for start in range(0, len(rows), self.chunk_size):
+                chunk = rows[start:start + self.chunk_size]
+                query = self._build_query(table, columns, len(chunk))
+                params = [value for row in chunk for value in row]
+                cursor.execute(query, params)
+                first_id = cursor.lastrowid
+                ids.extend(range(first_id, first_id + len(chunk)))
+        except mysql.connector.Error as e:
+            logger.error(f"Bulk insert into {table} failed after {len(ids)} rows: {e}")
+            raise
+
+        elapsed = time.perf_counter() - started
+        rate = len(rows) / elapsed if elapsed > 0 else float(len(rows))
+        logger.info(
+            f"Bulk inserted {len(rows)} rows into {table} in "
+            f"{-(-len(rows) // self.chunk_size)} statement(s), {elapsed * 1000:.1f} ms ({rate:.0f} rows/sec)"
+        )
+        return ids
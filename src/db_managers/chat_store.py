@@ -0,0 +1,400 @@
+import os
+import re
+import time
+import queue
+import uuid
+import yaml
+import arrow
+import threading
+import mysql.connector
+from datetime import datetime
+from typing import Dict, List, Optional, Any, Tuple
+
+from loggers.custom_logger import get_logger
+from db_managers.bulk_writer import BulkWriter
+
+logger = get_logger(__name__)
+
+BASE_URL = os.path.join(os.path.dirname(__file__), '..')
+CONFIG_PATH = os.path.join(BASE_URL, 'constants', 'config.yaml')
+
+with open(CONFIG_PATH, 'r') as file:
+    config = yaml.safe_load(file)
+    chat_config = config.get('chat', {})
+    CHAT_FLUSH_INTERVAL = chat_config.get('flush_interval_seconds', 0.5)
+    CHAT_FLUSH_BATCH = chat_config.get('flush_batch_size', 200)
+    CHAT_COMPACT_AFTER = chat_config.get('compact_after_messages', 20)
+    CHAT_KEEP_RECENT = chat_config.get('keep_recent_messages', 6)
+    CHAT_MEMORY_MAX_CHARS = chat_config.get('memory_max_chars', 1500)
+    CHAT_WRITE_ATTEMPTS = chat_config.get('write_attempts', 5)
+    CHAT_RETRY_BACKOFF = chat_config.get('retry_backoff_seconds', 1.0)
+
+CHAT_MESSAGES_TABLE = 'chat_messages'
+CHAT_MEMORY_TABLE = 'chat_memory'
+MESSAGE_COLUMNS = ("user_id", "conversation_id", "seq", "is_user", "text", "status", "created_at")
+# Upper bound on uncompacted turns read for the prompt; the prompt builder trims them to its token budget
+MEMORY_TURN_LIMIT = 200
+DUPLICATE_KEY_ERRNO = 1062
+
+_TAG_RE = re.compile(r'<[^>]+>')
+_SENTENCE_RE = re.compile(r'(?<=[.!?])\s')
+
+
+def _snippet(text: str, limit: int = 120) -> str:
+    plain = ' '.join(_TAG_RE.sub(' ', text or '').split())
+    first = _SENTENCE_RE.split(plain, 1)[0]
+    return first if len(first) <= limit else first[:limit - 1].rstrip() + '…'
+
+
+def summarize_turns(previous: str, messages: List[Dict[str, Any]], max_chars: int = CHAT_MEMORY_MAX_CHARS) -> str:
+    """Fold ``messages`` into the running memory string, keeping the newest facts within ``max_chars``."""
+    notes = [f"{'User asked' if m['is_user'] else 'Assistant said'}: {_snippet(m['text'])}" for m in messages]
+    memory = '\n'.join(part for part in [previous] + notes if part)
+    if len(memory) > max_chars:
+        memory = memory[-max_chars:]
+        memory = memory[memory.find('\n') + 1:] if '\n' in memory else memory
+    return memory
+
+
+class ChatStore:
+    """Durable, append-only chat history with windowed retrieval.
+
+    Messages get a per-process monotonic ``seq`` (microsecond clock) when they
+    are appended and are written by a background thread in multi-row batches,
+    so requests never wait on the INSERT. Reads use keyset pagination on
+    ``(user_id, conversation_id, seq)`` and include messages still waiting to
+    be flushed. Older turns are periodically folded into a compact memory
+    string kept in ``chat_memory``.
+
+    Each conversation in a batch is committed on its own, so one failing row
+    only holds back its own conversation. Messages leave the pending list
+    only once committed. A failed write is requeued, with backoff, up to
+    ``write_attempts`` times.
+    """
+
+    def __init__(self, db_config: Dict, flush_interval: float = CHAT_FLUSH_INTERVAL,
+                 batch_size: int = CHAT_FLUSH_BATCH, summarizer=summarize_turns):
+        self.db_config = db_config
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.summarizer = summarizer
+        self.bulk_writer = BulkWriter()
+        self._queue: "queue.Queue[Tuple[str, Any]]" = queue.Queue()
+        self._pending: List[Dict[str, Any]] = []
+        self._pending_lock = threading.Lock()
+        self._seq_lock = threading.Lock()
+        self._last_seq = 0
+        self._unflushed_since_compact: Dict[Tuple[int, str], int] = {}
+        self.create_chat_tables()
+        self._writer = threading.Thread(target=self._writer_loop, name="chat-store-writer", daemon=True)
+        self._writer.start()
+
+    def create_chat_tables(self):
+        try:
+            conn = mysql.connector.connect(**self.db_config)
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS {CHAT_MESSAGES_TABLE} (
+                    id BIGINT NOT NULL AUTO_INCREMENT,
+                    user_id INT NOT NULL,
+                    conversation_id CHAR(32) NOT NULL,
+                    seq BIGINT NOT NULL,
+                    is_user BOOLEAN NOT NULL,
+                    text MEDIUMTEXT NOT NULL,
+                    status VARCHAR(16) NOT NULL DEFAULT 'delivered',
+                    created_at DATETIME(3) NOT NULL,
+                    PRIMARY KEY (id),
+                    UNIQUE KEY uq_chat_messages_seq (user_id, conversation_id, seq),
+                    FOREIGN KEY (user_id) REFERENCES users(id)
+                )
+            """)
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS {CHAT_MEMORY_TABLE} (
+                    user_id INT NOT NULL,
+                    conversation_id CHAR(32) NOT NULL,
+                    summary TEXT NOT NULL,
+                    compacted_upto_seq BIGINT NOT NULL,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                    PRIMARY KEY (user_id, conversation_id),
+                    FOREIGN KEY (user_id) REFERENCES users(id)
+                )
+            """)
+            conn.commit()
+            cursor.close()
+            conn.close()
+            logger.info(f"{CHAT_MESSAGES_TABLE} and {CHAT_MEMORY_TABLE} table schemas created successfully.")
+        except mysql.connector.Error as e:
+            logger.error(f"Error creating chat schema: {e}")
+            raise RuntimeError(f"Error creating chat schema: {e}")
+
+    @staticmethod
+    def new_conversation_id() -> str:
+        return uuid.uuid4().hex
+
+    def _next_seq(self) -> int:
+        with self._seq_lock:
+            self._last_seq = max(self._last_seq + 1, time.time_ns() // 1000)
+            return self._last_seq
+
+    # ---- writes -------------------------------------------------------
+
+    def append(self, user_id: int, conversation_id: str, text: str, is_user: bool,
+               status: str = 'delivered') -> Dict[str, Any]:
+        """Queue a message for writing and return it in the shape the chat templates expect."""
+        created_at = datetime.now()
+        message = {
+            'user_id': user_id,
+            'conversation_id': conversation_id,
+            'seq': self._next_seq(),
+            'is_user': is_user,
+            'text': text,
+            'status': status,
+            'created_at': created_at,
+        }
+        with self._pending_lock:
+            self._pending.append(message)
+        self._queue.put(('message', message))
+        return self._to_view(message)
+
+    def set_status(self, user_id: int, conversation_id: str, seq: int, status: str) -> None:
+        with self._pending_lock:
+            for message in self._pending:
+                if message['seq'] == seq and message['user_id'] == user_id:
+                    message['status'] = status
+        self._queue.put(('status', (user_id, conversation_id, seq, status)))
+
+    def _writer_loop(self):
+        while True:
+            batch, statuses = [], []
+            failed = False
+            try:
+                kind, payload = self._queue.get()
+                deadline = time.monotonic() + self.flush_interval
+                while True:
+                    (batch if kind == 'message' else statuses).append(payload)
+                    if len(batch) >= self.batch_size:
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        kind, payload = self._queue.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                failed = not self._write_batch(batch, statuses)
+            except Exception as e:
+                logger.error(f"Chat store writer failed: {e}", exc_info=True)
+                failed = True
+            finally:
+                for _ in range(len(batch) + len(statuses)):
+                    self._queue.task_done()
+            if failed:
+                # Requeued messages are retried after a pause instead of hammering a struggling database
+                time.sleep(CHAT_RETRY_BACKOFF)
+
+    def _write_batch(self, batch: List[Dict[str, Any]], statuses: List[Tuple]) -> bool:
+        """Write queued messages (one transaction per conversation) and status changes; False if anything failed."""
+        conversations: Dict[Tuple[int, str], List[Dict[str, Any]]] = {}
+        for message in batch:
+            conversations.setdefault((message['user_id'], message['conversation_id']), []).append(message)
+
+        written: List[Dict[str, Any]] = []
+        handled = set()
+        ok = True
+        conn = None
+        cursor = None
+        try:
+            conn = mysql.connector.connect(**self.db_config)
+            cursor = conn.cursor()
+            for key, messages in conversations.items():
+                handled.add(key)
+                try:
+                    self.bulk_writer.insert_rows(cursor, CHAT_MESSAGES_TABLE, MESSAGE_COLUMNS,
+                                                 [tuple(m[c] for c in MESSAGE_COLUMNS) for m in messages])
+                    conn.commit()
+                    written.extend(messages)
+                except mysql.connector.Error as e:
+                    ok = False
+                    self._requeue(key, messages, e)
+                    conn.rollback()
+            if statuses:
+                try:
+                    for user_id, conversation_id, seq, status in statuses:
+                        cursor.execute(
+                            f"UPDATE {CHAT_MESSAGES_TABLE} SET status = %s "
+                            "WHERE user_id = %s AND conversation_id = %s AND seq = %s",
+                            (status, user_id, conversation_id, seq))
+                    conn.commit()
+                except mysql.connector.Error as e:
+                    conn.rollback()
+                    ok = False
+                    logger.error(f"Error updating {len(statuses)} chat message statuses: {e}")
+        except mysql.connector.Error as e:
+            logger.error(f"Error connecting to write {len(batch)} chat messages: {e}")
+            ok = False
+            for key, messages in conversations.items():
+                if key not in handled:
+                    self._requeue(key, messages, e)
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                conn.close()
+            with self._pending_lock:
+                done = {id(m) for m in written}
+                self._pending = [m for m in self._pending if id(m) not in done]
+
+        for message in written:
+            key = (message['user_id'], message['conversation_id'])
+            self._unflushed_since_compact[key] = self._unflushed_since_compact.get(key, 0) + 1
+            if self._unflushed_since_compact[key] >= CHAT_COMPACT_AFTER:
+                self._unflushed_since_compact[key] = 0
+                try:
+                    self.compact(*key)
+                except Exception as e:
+                    logger.error(f"Chat compaction failed for {key}: {e}")
+        return ok
+
+    def _requeue(self, key: Tuple[int, str], messages: List[Dict[str, Any]], error: Exception) -> None:
+        """Put a conversation's failed messages back on the queue, or give up on them after the last attempt."""
+        if getattr(error, 'errno', None) == DUPLICATE_KEY_ERRNO:
+            # Another worker took these seqs in the same microsecond; re-sequence and retry
+            for message in messages:
+                message['seq'] = self._next_seq()
+        retry, lost = [], []
+        for message in messages:
+            message['attempts'] = message.get('attempts', 0) + 1
+            (retry if message['attempts'] < CHAT_WRITE_ATTEMPTS else lost).append(message)
+        logger.error(f"Error writing {len(messages)} chat messages for user {key[0]}: {error} "
+                     f"({len(retry)} requeued, {len(lost)} dropped)")
+        if lost:
+            with self._pending_lock:
+                dropped = {id(m) for m in lost}
+                self._pending = [m for m in self._pending if id(m) not in dropped]
+        for message in retry:
+            self._queue.put(('message', message))
+
+    def flush(self) -> None:
+        """Block until every queued message has been written."""
+        self._queue.join()
+
+    # ---- reads --------------------------------------------------------
+
+    @staticmethod
+    def _to_view(message: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            'seq': message['seq'],
+            'text': message['text'],
+            'is_user': bool(message['is_user']),
+            'status': message['status'],
+            'timestamp': arrow.get(message['created_at']).format('MMM D, HH:mm'),
+        }
+
+    def fetch_messages(self, user_id: int, conversation_id: str, before_seq: Optional[int] = None,
+                       limit: int = 20, after_seq: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Return up to ``limit`` messages older than ``before_seq`` (newest window if None), oldest first.
+
+        ``after_seq`` additionally restricts the window to messages newer than it.
+        """
+        query = (f"SELECT seq, is_user, text, status, created_at FROM {CHAT_MESSAGES_TABLE} "
+                 "WHERE user_id = %s AND conversation_id = %s")
+        params: List[Any] = [user_id, conversation_id]
+        if before_seq is not None:
+            query += " AND seq < %s"
+            params.append(before_seq)
+        if after_seq is not None:
+            query += " AND seq > %s"
+            params.append(after_seq)
+        query += " ORDER BY seq DESC LIMIT %s"
+        params.append(limit)
+        try:
+            conn = mysql.connector.connect(**self.db_config)
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
+            cursor.close()
+            conn.close()
+        except mysql.connector.Error as e:
+            logger.error(f"Error fetching chat messages for user {user_id}: {e}")
+            raise RuntimeError(f"Error fetching chat messages: {e}")
+
+        with self._pending_lock:
+            pending = [m for m in self._pending
+                       if m['user_id'] == user_id and m['conversation_id'] == conversation_id
+                       and (before_seq is None or m['seq'] < before_seq)
+                       and (after_seq is None or m['seq'] > after_seq)]
+        by_seq = {row['seq']: row for row in rows}
+        by_seq.update({m['seq']: m for m in pending})
+        newest = sorted(by_seq)[-limit:]
+        return [self._to_view(by_seq[seq]) for seq in newest]
+
+    def latest_conversation(self, user_id: int) -> Optional[str]:
+        try:
+            conn = mysql.connector.connect(**self.db_config)
+            cursor = conn.cursor()
+            cursor.execute(
+                f"SELECT conversation_id FROM {CHAT_MESSAGES_TABLE} WHERE user_id = %s ORDER BY seq DESC LIMIT 1",
+                (user_id,))
+            row = cursor.fetchone()
+            cursor.close()
+            conn.close()
+            return row[0] if row else None
+        except mysql.connector.Error as e:
+            logger.error(f"Error fetching latest conversation for user {user_id}: {e}")
+            return None
+
+    def get_memory(self, user_id: int, conversation_id: str) -> Tuple[str, int]:
+        """Return ``(summary, compacted_upto_seq)`` for a conversation."""
+        conn = mysql.connector.connect(**self.db_config)
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                f"SELECT summary, compacted_upto_seq FROM {CHAT_MEMORY_TABLE} WHERE user_id = %s AND conversation_id = %s",
+                (user_id, conversation_id))
+            row = cursor.fetchone()
+            return (row[0], row[1]) if row else ('', 0)
+        finally:
+            cursor.close()
+            conn.close()
+
+    def build_memory(self, user_id: int, conversation_id: str) -> str:
+        """Compact memory plus every turn it does not cover yet; the prompt builder trims it to budget."""
+        try:
+            summary, upto_seq = self.get_memory(user_id, conversation_id)
+            turns = self.fetch_messages(user_id, conversation_id, limit=MEMORY_TURN_LIMIT, after_seq=upto_seq)
+        except Exception as e:
+            logger.error(f"Failed to build chat memory for user {user_id}: {e}")
+            return ''
+        lines = [summary] if summary else []
+        lines.extend(f"{'User' if m['is_user'] else 'Assistant'}: {_snippet(m['text'], 300)}" for m in turns)
+        return '\n'.join(lines)
+
+    def compact(self, user_id: int, conversation_id: str, keep_recent: int = CHAT_KEEP_RECENT) -> None:
+        """Fold every turn except the newest ``keep_recent`` into the conversation's memory string."""
+        summary, upto_seq = self.get_memory(user_id, conversation_id)
+        conn = mysql.connector.connect(**self.db_config)
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute(
+                f"SELECT seq FROM {CHAT_MESSAGES_TABLE} WHERE user_id = %s AND conversation_id = %s "
+                "ORDER BY seq DESC LIMIT 1 OFFSET %s",
+                (user_id, conversation_id, keep_recent))
+            boundary = cursor.fetchone()
+            if not boundary or boundary['seq'] <= upto_seq:
+                return
+            cursor.execute(
+                f"SELECT seq, is_user, text FROM {CHAT_MESSAGES_TABLE} "
+                "WHERE user_id = %s AND conversation_id = %s AND seq > %s AND seq <= %s ORDER BY seq",
+                (user_id, conversation_id, upto_seq, boundary['seq']))
+            old_turns = cursor.fetchall()
+            memory = self.summarizer(summary, old_turns)
+            cursor.execute(
+                f"""INSERT INTO {CHAT_MEMORY_TABLE} (user_id, conversation_id, summary, compacted_upto_seq)
+                    VALUES (%s, %s, %s, %s)
+                    ON DUPLICATE KEY UPDATE summary = VALUES(summary), compacted_upto_seq = VALUES(compacted_upto_seq)""",
+                (user_id, conversation_id, memory, boundary['seq']))
+            conn.commit()
+            logger.info(f"Compacted {len(old_turns)} chat turns for user {user_id} into {len(memory)} chars of memory")
+        finally:
+            cursor.close()
+            conn.close()
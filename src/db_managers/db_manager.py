@@ -2,9 +2,12 @@ import os
 import yaml
 import mysql.connector
 from werkzeug.security import check_password_hash,generate_password_hash
-from loggers.custom_logger import logger
+from loggers.custom_logger import get_logger
+from db_managers.email_outbox import EmailOutbox
 from dotenv import load_dotenv
 
+logger = get_logger(__name__)
+
 
 load_dotenv()
 
@@ -32,6 +35,7 @@ class DBManager:
          
         self.conn = mysql.connector.connect(**DB_CONFIG) 
         self.initialize_users_table()
+        self.outbox = EmailOutbox(DB_CONFIG)
 
     def initialize_users_table(self):
         conn = mysql.connector.connect(**DB_CONFIG)
@@ -63,7 +67,8 @@ class DBManager:
         finally:
             conn.close()
 
-    def create_user(self, username, password, email, age=None, first_name=None, last_name=None, vegetarian=False, vegan=False, gluten_free=False, allergies=None,extra_info = None):
+    def create_user(self, username, password, email, age=None, first_name=None, last_name=None, vegetarian=False, vegan=False, gluten_free=False, allergies=None,extra_info = None, welcome_email=None):
+        """Insert a user; ``welcome_email`` (subject, html body) is queued in the outbox in the same transaction."""
 
         password = generate_password_hash(password)
         if self.check_if_email_already_exists(email):
@@ -78,8 +83,10 @@ class DBManager:
             """
             values = (username, password, email, age, first_name, last_name, vegetarian, vegan, gluten_free, allergies,extra_info)
             cursor.execute(sql_insert, values)
-            conn.commit()
             user_id = cursor.lastrowid
+            if welcome_email:
+                self.outbox.enqueue(cursor, email, *welcome_email, html=True)
+            conn.commit()
             cursor.close()
             logger.info(f"User '{username}' created with ID: {user_id}")
             return user_id
@@ -0,0 +1,197 @@
+import os
+import time
+import yaml
+import mysql.connector
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+from loggers.custom_logger import get_logger
+from db_managers.email_sender import EmailSender
+
+logger = get_logger(__name__)
+
+BASE_URL = os.path.join(os.path.dirname(__file__), '..')
+CONFIG_PATH = os.path.join(BASE_URL, 'constants', 'config.yaml')
+TEMPLATES_DIR = os.path.join(BASE_URL, 'templates')
+
+with open(CONFIG_PATH, 'r') as file:
+    config = yaml.safe_load(file)
+    tables = config['database']['tables']
+    USERS_TABLE = tables['users']
+    CHECKPOINTS_TABLE = tables.get('job_checkpoints', 'job_checkpoints')
+    digest_config = config.get('digest', {})
+    DIGEST_BATCH_USERS = digest_config.get('batch_users', 500)
+    DIGEST_WORKERS = digest_config.get('workers', 4)
+    DIGEST_SKIP_EMPTY = digest_config.get('skip_empty', True)
+    EXPIRING_DAYS = config.get('expiry', {}).get('dashboard_days', 7)
+
+JOB_ID = 'daily_digest'
+
+
+class DigestPipeline:
+    """Daily summary email for every user, sent by one scheduled job.
+
+    Users are streamed in id order in batches of ``batch_users`` (keyset
+    pagination). For each batch, low stock, expiring items and restock
+    forecasts are read with one ``IN (...)`` query per source. The emails are
+    rendered from ``templates/emails/daily_digest.html`` and sent by
+    ``workers`` threads over the shared SMTP connection pool.
+
+    Progress is saved to ``job_checkpoints`` after every batch. A run that
+    crashes resumes after the last finished batch, so at most one batch can
+    be sent twice. A run that already finished today is not repeated.
+    """
+
+    def __init__(self, db_config: Dict, inventory_ledger, expiry_index, restock_forecaster,
+                 batch_users: int = DIGEST_BATCH_USERS, workers: int = DIGEST_WORKERS,
+                 skip_empty: bool = DIGEST_SKIP_EMPTY):
+        self.db_config = db_config
+        self.inventory_ledger = inventory_ledger
+        self.expiry_index = expiry_index
+        self.restock_forecaster = restock_forecaster
+        self.batch_users = batch_users
+        self.workers = workers
+        self.skip_empty = skip_empty
+        self.templates = Environment(loader=FileSystemLoader(TEMPLATES_DIR),
+                                     autoescape=select_autoescape(['html']))
+        self.sender = EmailSender()
+        self.create_table()
+
+    def _connect(self):
+        return mysql.connector.connect(**self.db_config)
+
+    def create_table(self) -> None:
+        conn = None
+        cursor = None
+        try:
+            conn = self._connect()
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS {CHECKPOINTS_TABLE} (
+                    job_id VARCHAR(64) PRIMARY KEY,
+                    run_date DATE NOT NULL,
+                    last_user_id INT NOT NULL DEFAULT 0,
+                    sent INT NOT NULL DEFAULT 0,
+                    skipped INT NOT NULL DEFAULT 0,
+                    failed INT NOT NULL DEFAULT 0,
+                    completed_at DATETIME NULL,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+                )
+            """)
+            conn.commit()
+        except mysql.connector.Error as e:
+            logger.error(f"Error creating {CHECKPOINTS_TABLE} table: {e}")
+            raise RuntimeError(f"Error creating {CHECKPOINTS_TABLE} table: {e}")
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                conn.close()
+
+    # --- checkpoints -------------------------------------------------------------
+
+    def _load_checkpoint(self, cursor, today: date) -> Optional[Dict]:
+        """Today's checkpoint, starting a fresh one if the last run was on another day."""
+        cursor.execute(f"SELECT run_date, last_user_id, sent, skipped, failed, completed_at "
+                       f"FROM {CHECKPOINTS_TABLE} WHERE job_id = %s", (JOB_ID,))
+        row = cursor.fetchone()
+        if row and row['run_date'] == today:
+            return row
+        cursor.execute(
+            f"INSERT INTO {CHECKPOINTS_TABLE} (job_id, run_date) VALUES (%s, %s) "
+            f"ON DUPLICATE KEY UPDATE run_date = VALUES(run_date), last_user_id = 0, "
+            f"sent = 0, skipped = 0, failed = 0, completed_at = NULL",
+            (JOB_ID, today)
+        )
+        return {'run_date': today, 'last_user_id': 0, 'sent': 0, 'skipped': 0, 'failed': 0, 'completed_at': None}
+
+    def _save_checkpoint(self, cursor, state: Dict, completed: bool = False) -> None:
+        cursor.execute(
+            f"UPDATE {CHECKPOINTS_TABLE} SET last_user_id = %s, sent = %s, skipped = %s, failed = %s, "
+            f"completed_at = {'NOW()' if completed else 'NULL'} WHERE job_id = %s",
+            (state['last_user_id'], state['sent'], state['skipped'], state['failed'], JOB_ID)
+        )
+
+    # --- rendering and sending ---------------------------------------------------
+
+    def render(self, user: Dict, today: date, low_stock: List[Dict], expiring_soon: List[Dict],
+               restock_soon: List[Dict]) -> Tuple[str, str]:
+        """Subject and HTML body of one user's digest."""
+        body = self.templates.get_template('emails/daily_digest.html').render(
+            user=user, today=today.strftime('%Y-%m-%d'), low_stock=low_stock,
+            expiring_soon=expiring_soon, restock_soon=restock_soon)
+        return f"Your Daily Smart Grocery Summary - {today.strftime('%Y-%m-%d')}", body
+
+    def _send(self, message: Tuple[str, str, str]) -> bool:
+        recipient, subject, body = message
+        return self.sender.send_email(recipient, subject, body, html=True)
+
+    def _batch_messages(self, users: List[Dict], today: date) -> Tuple[List[Tuple[str, str, str]], int]:
+        user_ids = [user['id'] for user in users]
+        low_stock = self.inventory_ledger.low_stock_for_users(user_ids)
+        expiring = self.expiry_index.expiring_for_users(user_ids, days=EXPIRING_DAYS, today=today)
+        restock = self.restock_forecaster.restock_soon_for_users(user_ids, today=today)
+        messages, skipped = [], 0
+        for user in users:
+            sections = (low_stock.get(user['id'], []), expiring.get(user['id'], []), restock.get(user['id'], []))
+            if self.skip_empty and not any(sections):
+                skipped += 1
+                continue
+            subject, body = self.render(user, today, *sections)
+            messages.append((user['email'], subject, body))
+        return messages, skipped
+
+    def run(self, today: Optional[date] = None) -> Dict:
+        """Send today's digest to every user, resuming from the last checkpoint."""
+        today = today or date.today()
+        started = time.perf_counter()
+        conn = None
+        cursor = None
+        try:
+            conn = self._connect()
+            cursor = conn.cursor(dictionary=True)
+            state = self._load_checkpoint(cursor, today)
+            conn.commit()
+            if state['completed_at']:
+                logger.info(f"Daily digest for {today} already completed; skipping")
+                return state
+            if state['last_user_id']:
+                logger.info(f"Resuming daily digest for {today} after user {state['last_user_id']}")
+
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='digest') as pool:
+                while True:
+                    cursor.execute(
+                        f"SELECT id, email, username, first_name FROM {USERS_TABLE} "
+                        f"WHERE id > %s ORDER BY id LIMIT %s",
+                        (state['last_user_id'], self.batch_users)
+                    )
+                    users = cursor.fetchall()
+                    if not users:
+                        break
+                    messages, skipped = self._batch_messages(users, today)
+                    results = list(pool.map(self._send, messages))
+                    state['sent'] += sum(results)
+                    state['failed'] += len(results) - sum(results)
+                    state['skipped'] += skipped
+                    state['last_user_id'] = users[-1]['id']
+                    self._save_checkpoint(cursor, state)
+                    conn.commit()
+            self._save_checkpoint(cursor, state, completed=True)
+            conn.commit()
+        except (mysql.connector.Error, RuntimeError) as e:
+            logger.error(f"Daily digest failed: {e}")
+            if conn:
+                conn.rollback()
+            raise RuntimeError(f"Daily digest failed: {e}")
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                conn.close()
+        state['duration_s'] = round(time.perf_counter() - started, 2)
+        logger.info(f"Daily digest for {today}: {state['sent']} sent, {state['failed']} failed, "
+                    f"{state['skipped']} skipped in {state['duration_s']}s")
+        return state
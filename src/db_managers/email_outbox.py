@@ -0,0 +1,322 @@
+import os
+import time
+import uuid
+import random
+import smtplib
+import threading
+import yaml
+import mysql.connector
+from typing import Callable, Dict, List, Optional, Tuple
+
+from loggers.custom_logger import get_logger
+from loggers.metrics import EMAILS
+from db_managers.smtp_pool import SMTP_ACQUIRE_TIMEOUT, SMTP_TIMEOUT
+
+logger = get_logger(__name__)
+
+BASE_URL = os.path.join(os.path.dirname(__file__), '..')
+CONFIG_PATH = os.path.join(BASE_URL, 'constants', 'config.yaml')
+
+with open(CONFIG_PATH, 'r') as file:
+    config = yaml.safe_load(file)
+    OUTBOX_TABLE = config['database']['tables'].get('email_outbox', 'email_outbox')
+    outbox_config = config.get('email', {}).get('outbox', {})
+    OUTBOX_WORKERS = outbox_config.get('workers', 2)
+    OUTBOX_BATCH = outbox_config.get('batch_size', 20)
+    OUTBOX_POLL_SECONDS = outbox_config.get('poll_seconds', 2)
+    OUTBOX_LEASE_MARGIN = outbox_config.get('lease_margin_seconds', 60)
+    OUTBOX_MAX_ATTEMPTS = outbox_config.get('max_attempts', 8)
+    OUTBOX_BACKOFF_BASE = outbox_config.get('backoff_base_seconds', 30)
+    OUTBOX_BACKOFF_MAX = outbox_config.get('backoff_max_seconds', 3600)
+    OUTBOX_RATE_PER_SECOND = outbox_config.get('rate_per_second', 5)
+
+
+
+def is_permanent(error: Exception) -> bool:
+    """True for a failure a retry cannot fix, so the message is marked dead straight away.
+
+    Only 5xx replies count: the same exceptions carry 4xx codes (greylisting,
+    full mailbox, rate limits) that succeed later. A refused-recipients error
+    is permanent only when every recipient was refused with a 5xx code.
+    """
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        codes = [code for code, _ in error.recipients.values()]
+        return bool(codes) and all(code >= 500 for code in codes)
+    if isinstance(error, (smtplib.SMTPSenderRefused, smtplib.SMTPDataError)):
+        return error.smtp_code >= 500
+    return False
+
+
+def lease_seconds(batch_size: int, rate_per_second: float, socket_timeout: float = SMTP_TIMEOUT,
+                  acquire_timeout: float = SMTP_ACQUIRE_TIMEOUT, margin: float = OUTBOX_LEASE_MARGIN) -> int:
+    """A lease long enough for a whole batch to hit the SMTP socket timeout, one message after another."""
+    return int(acquire_timeout + batch_size * (socket_timeout + 1 / rate_per_second) + margin)
+
+
+def backoff_seconds(attempts: int, base: float = OUTBOX_BACKOFF_BASE, cap: float = OUTBOX_BACKOFF_MAX) -> float:
+    """Exponential backoff with full jitter for the ``attempts``-th failure (1-based)."""
+    return random.uniform(0, min(cap, base * 2 ** (attempts - 1)))
+
+
+class RateLimiter:
+    """Token bucket shared by all sender threads of a process."""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst or max(rate, 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class EmailOutbox:
+    """Durable queue of outgoing emails in MySQL (transactional outbox).
+
+    ``enqueue`` writes on the caller's cursor, so a message is stored only if
+    the event that triggered it (e.g. creating a user) commits. Sender
+    workers ``claim`` due rows by stamping them with a lease token. This lets
+    any number of threads and processes drain the table without sending a
+    row twice while the lease holds. A row whose sender died becomes
+    claimable again when its lease expires. ``complete`` only touches rows
+    still held by the same token, so a sender that outlived its lease cannot
+    overwrite the outcome of the worker that took the row over.
+    """
+
+    def __init__(self, db_config: Dict, max_attempts: int = OUTBOX_MAX_ATTEMPTS):
+        self.db_config = db_config
+        self.max_attempts = max_attempts
+        self.create_table()
+
+    def _connect(self):
+        return mysql.connector.connect(**self.db_config)
+
+    def create_table(self) -> None:
+        conn = None
+        cursor = None
+        try:
+            conn = self._connect()
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS {OUTBOX_TABLE} (
+                    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                    recipient VARCHAR(255) NOT NULL,
+                    subject VARCHAR(255) NOT NULL,
+                    body MEDIUMTEXT NOT NULL,
+                    html BOOLEAN NOT NULL DEFAULT FALSE,
+                    status VARCHAR(16) NOT NULL DEFAULT 'pending',
+                    attempts INT NOT NULL DEFAULT 0,
+                    next_attempt_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    locked_by CHAR(32) NULL,
+                    locked_until DATETIME NULL,
+                    last_error VARCHAR(512) NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    sent_at DATETIME NULL,
+                    INDEX idx_outbox_due (status, next_attempt_at),
+                    INDEX idx_outbox_locked_by (locked_by)
+                )
+            """)
+            conn.commit()
+        except mysql.connector.Error as e:
+            logger.error(f"Error creating {OUTBOX_TABLE} table: {e}")
+            raise RuntimeError(f"Error creating {OUTBOX_TABLE} table: {e}")
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                conn.close()
+
+    def enqueue(self, cursor, recipient: str, subject: str, body: str, html: bool = False) -> None:
+        """Queue a message on the caller's cursor (no commit)."""
+        cursor.execute(
+            f"INSERT INTO {OUTBOX_TABLE} (recipient, subject, body, html) VALUES (%s, %s, %s, %s)",
+            (recipient, subject, body, html)
+        )
+
+    def enqueue_now(self, recipient: str, subject: str, body: str, html: bool = False) -> None:
+        """Queue a message that is not tied to any other write, in its own short transaction."""
+        conn = None
+        cursor = None
+        try:
+            conn = self._connect()
+            cursor = conn.cursor()
+            self.enqueue(cursor, recipient, subject, body, html)
+            conn.commit()
+        except mysql.connector.Error as e:
+            logger.error(f"Error queueing email to {recipient}: {e}")
+            raise RuntimeError(f"Error queueing email to {recipient}: {e}")
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                conn.close()
+
+    def depth(self) -> Dict[str, int]:
+        """Queued (``pending``) and given-up (``dead``) row counts; an index range scan, sent rows are skipped."""
+        conn = None
+        cursor = None
+        try:
+            conn = self._connect()
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT status, COUNT(*) FROM {OUTBOX_TABLE} "
+                           f"WHERE status IN ('pending', 'dead') GROUP BY status")
+            counts = {'pending': 0, 'dead': 0}
+            counts.update({status: count for status, count in cursor.fetchall()})
+            return counts
+        except mysql.connector.Error as e:
+            logger.error(f"Error counting outbox messages: {e}")
+            raise RuntimeError(f"Error counting outbox messages: {e}")
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                conn.close()
+
+    def claim(self, limit: int, lease: int) -> Tuple[str, List[Dict]]:
+        """Lease up to ``limit`` due messages for ``lease`` seconds; returns the lease token and the messages."""
+        token = uuid.uuid4().hex
+        conn = None
+        cursor = None
+        try:
+            conn = self._connect()
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute(
+                f"UPDATE {OUTBOX_TABLE} SET locked_by = %s, locked_until = NOW() + INTERVAL %s SECOND "
+                f"WHERE status = 'pending' AND next_attempt_at <= NOW() "
+                f"AND (locked_until IS NULL OR locked_until < NOW()) ORDER BY id LIMIT %s",
+                (token, lease, limit)
+            )
+            conn.commit()
+            if not cursor.rowcount:
+                return token, []
+            cursor.execute(f"SELECT id, recipient, subject, body, html, attempts FROM {OUTBOX_TABLE} "
+                           f"WHERE locked_by = %s ORDER BY id", (token,))
+            return token, cursor.fetchall()
+        except mysql.connector.Error as e:
+            logger.error(f"Error claiming outbox messages: {e}")
+            raise RuntimeError(f"Error claiming outbox messages: {e}")
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                conn.close()
+
+    def complete(self, token: str, sent: List[int], failed: List[Dict]) -> None:
+        """Record a batch claimed with ``token``: ``sent`` ids, and ``failed`` dicts with id, attempts, error and permanent.
+
+        Rows whose lease was lost to another sender are left to that sender.
+        """
+        conn = None
+        cursor = None
+        try:
+            conn = self._connect()
+            cursor = conn.cursor()
+            if sent:
+                cursor.execute(
+                    f"UPDATE {OUTBOX_TABLE} SET status = 'sent', sent_at = NOW(), attempts = attempts + 1, "
+                    f"locked_by = NULL, locked_until = NULL WHERE id IN ({', '.join(['%s'] * len(sent))}) AND locked_by = %s",
+                    (*sent, token)
+                )
+                if cursor.rowcount < len(sent):
+                    logger.warning(f"Outbox lease {token} expired before {len(sent) - cursor.rowcount} sends were recorded")
+            for failure in failed:
+                attempts = failure['attempts'] + 1
+                dead = failure['permanent'] or attempts >= self.max_attempts
+                cursor.execute(
+                    f"UPDATE {OUTBOX_TABLE} SET status = %s, attempts = %s, last_error = %s, "
+                    f"next_attempt_at = NOW() + INTERVAL %s SECOND, locked_by = NULL, locked_until = NULL "
+                    f"WHERE id = %s AND locked_by = %s",
+                    ('dead' if dead else 'pending', attempts, failure['error'][:512],
+                     0 if dead else int(backoff_seconds(attempts)), failure['id'], token)
+                )
+                if dead and cursor.rowcount:
+                    logger.error(f"Giving up on outbox email {failure['id']} after {attempts} attempts: {failure['error']}")
+            conn.commit()
+        except mysql.connector.Error as e:
+            logger.error(f"Error updating outbox messages: {e}")
+            raise RuntimeError(f"Error updating outbox messages: {e}")
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                conn.close()
+
+
+class OutboxSender:
+    """Background threads that drain an ``EmailOutbox``.
+
+    Each worker gets a client from ``sender_factory`` (anything with
+    ``deliver(recipient, subject, body, html)``); ``EmailSender`` sends over
+    the shared SMTP connection pool. A token bucket caps the process-wide
+    send rate. An
+    empty outbox costs one indexed UPDATE per worker every ``poll_seconds``.
+    """
+
+    def __init__(self, outbox: EmailOutbox, sender_factory: Callable, workers: int = OUTBOX_WORKERS,
+                 batch_size: int = OUTBOX_BATCH, poll_seconds: float = OUTBOX_POLL_SECONDS,
+                 rate_per_second: float = OUTBOX_RATE_PER_SECOND):
+        self.outbox = outbox
+        self.sender_factory = sender_factory
+        self.workers = workers
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self.rate_limiter = RateLimiter(rate_per_second)
+        self.lease_seconds = lease_seconds(batch_size, rate_per_second)
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> None:
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker_loop, name=f"outbox-sender-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Started {self.workers} outbox sender threads")
+
+    def stop(self, timeout: float = 10) -> None:
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def drain_once(self, client=None) -> int:
+        """Claim and send one batch; returns the number of messages handled."""
+        client = client or self.sender_factory()
+        token, messages = self.outbox.claim(self.batch_size, self.lease_seconds)
+        sent, failed = [], []
+        for message in messages:
+            self.rate_limiter.acquire()
+            try:
+                client.deliver(message['recipient'], message['subject'], message['body'], bool(message['html']))
+                sent.append(message['id'])
+            except Exception as e:
+                failed.append({'id': message['id'], 'attempts': message['attempts'], 'error': str(e) or repr(e),
+                               'permanent': is_permanent(e)})
+        if messages:
+            self.outbox.complete(token, sent, failed)
+            EMAILS.labels('sent').inc(len(sent))
+            EMAILS.labels('failed').inc(len(failed))
+            logger.info(f"Outbox: sent {len(sent)}, failed {len(failed)}")
+        return len(messages)
+
+    def _worker_loop(self) -> None:
+        client = None
+        while not self._stop.is_set():
+            try:
+                client = client or self.sender_factory()
+                if self.drain_once(client) < self.batch_size:
+                    self._stop.wait(self.poll_seconds)
+            except Exception as e:
+                logger.error(f"Outbox sender error: {e}", exc_info=True)
+                client = None
+                self._stop.wait(self.poll_seconds)
@@ -1,69 +1,62 @@
-import smtplib
 import os
 from email.mime.text import MIMEText
 from dotenv import load_dotenv
-from datetime import datetime
+
+from loggers.custom_logger import get_logger
+from db_managers.smtp_pool import get_pool
+
+logger = get_logger(__name__)
 
 load_dotenv()
 
 class EmailSender:
+    """SMTP client for transactional mail.
+
+    Defaults to Gmail over implicit TLS. ``SMTP_SERVER``, ``SMTP_PORT`` and
+    ``SMTP_SSL`` point it elsewhere, e.g. a local ``aiosmtpd`` stand-in
+    (``SMTP_SSL=false``). Login is skipped when no password is set.
+
+    Senders are cheap: they all share one process-wide ``SmtpPool`` per
+    endpoint, so any number of threads can send concurrently, each on its own
+    pooled connection.
+    """
+
     def __init__(self):
         self.sender_email = os.getenv("GMAIL_ADDRESS")
         self.sender_password = os.getenv("GMAIL_PASSWORD")
-        self.smtp_server = 'smtp.gmail.com'
-        self.smtp_port = 465
-        self.server = None
-        self._connect_smtp()
-
-    def _connect_smtp(self):
-        """Connect to the Gmail SMTP server."""
-        try:
-            self.server = smtplib.SMTP_SSL(self.smtp_server, self.smtp_port)
-            self.server.login(self.sender_email, self.sender_password)
-            print(f"Connected to Gmail SMTP server: {self.smtp_server}:{self.smtp_port}")
-        except Exception as e:
-            print(f"Error connecting to Gmail SMTP server: {e}")
-            self.server = None
-
-    def _disconnect_smtp(self):
-        """Disconnect from the Gmail SMTP server."""
-        if self.server:
-            try:
-                self.server.quit()
-                print("Disconnected from Gmail SMTP server.")
-            except Exception as e:
-                print(f"Error disconnecting from Gmail SMTP server: {e}")
-            finally:
-                self.server = None
+        self.smtp_server = os.getenv("SMTP_SERVER") or 'smtp.gmail.com'
+        self.smtp_port = int(os.getenv("SMTP_PORT") or 465)
+        self.use_ssl = (os.getenv("SMTP_SSL") or 'true').lower() in ('1', 'true', 'yes')
+        self.pool = get_pool(self.smtp_server, self.smtp_port, self.use_ssl, self.sender_email, self.sender_password)
+
+    def build_message(self, recipients, subject, body, html=False):
+        msg = MIMEText(body, 'html' if html else 'plain')
+        msg['Subject'] = subject
+        msg['From'] = self.sender_email
+        msg['To'] = recipients if isinstance(recipients, str) else ', '.join(recipients)
+        return msg
+
+    def deliver(self, recipients, subject, body, html=False):
+        """Send one message to one or many recipients, raising on failure so callers can decide whether to retry."""
+        msg = self.build_message(recipients, subject, body, html)
+        refused = self.pool.sendmail(self.sender_email, recipients, msg.as_string())
+        if refused:
+            logger.warning(f"SMTP server refused {len(refused)} recipient(s) of '{subject}': {sorted(refused)}")
+        return refused
 
     def send_email(self, recipient_email, subject, body, html=False):
-        """Send an email using the initialized Gmail server."""
-        if not self.server:
-            print("Gmail SMTP server not connected. Attempting to reconnect...")
-            self._connect_smtp()
-            if not self.server:
-                print("Failed to connect to Gmail SMTP server. Cannot send email.")
-                return False
-
+        """Send an email, reporting success instead of raising."""
         try:
-            if html:
-                msg = MIMEText(body, 'html')
-            else:
-                msg = MIMEText(body, 'plain')
-
-            msg['Subject'] = subject
-            msg['From'] = self.sender_email
-            msg['To'] = recipient_email
-
-            self.server.sendmail(self.sender_email, recipient_email, msg.as_string())
-            print(f"Email sent successfully to {recipient_email}")
+            self.deliver(recipient_email, subject, body, html)
+            logger.info(f"Email sent successfully to {recipient_email}")
             return True
         except Exception as e:
-            print(f"Error sending email to {recipient_email}: {e}")
+            logger.warning(f"Error sending email to {recipient_email}: {e}", exc_info=True)
             return False
 
-    def send_welcome_email(self,recipient_email,username, email):
-        """Send a welcome email to the recipient."""
+    @staticmethod
+    def welcome_email(username, email):
+        """Subject and HTML body of the welcome email."""
         subject = "Welcome to Grocery Assistant App!"
         body = f"""
         <html>
@@ -91,59 +84,9 @@ class EmailSender:
             </body>
         </html>
         """
-        return self.send_email(recipient_email,subject, body, html=True)
+        return subject, body
 
-    def send_grocery_summary(self, app_context, recipient_email, low_stock_items=None, expiring_soon=None):
-        """Sends a daily grocery summary email."""
-        with app_context:  # Flask app context, if needed
-            email_sender = EmailSender()
-
-            now = datetime.now()
-            subject = f"Your Daily Smart Grocery Summary - {now.strftime('%Y-%m-%d')}"
-
-            body = f"""
-            <html>
-                <body>
-                    <p>Good morning!</p>
-
-                    <p>Here's your daily summary from <b>Smart Grocery</b> for {now.strftime('%Y-%m-%d')}:</p>
-
-                    <h3>Items Low in Stock:</h3>
-                    <ul>
-            """
-            if low_stock_items:
-                for item in low_stock_items:
-                    body += f"<li>{item}</li>"
-            else:
-                body += "<li>No items are currently low in stock.</li>"
-
-            body += """
-                    </ul>
-                    <h3>Items Expiring Soon:</h3>
-                    <ul>
-            """
-            if expiring_soon:
-                for item in expiring_soon:
-                    body += f"<li>{item}</li>"
-            else:
-                body += "<li>No items are expiring soon.</li>"
-
-            body += """
-                    </ul>
-
-                    <p>Stay smart with your groceries!</p>
-
-                    <p><b>The Smart Grocery Team</b></p>
-                </body>
-            </html>
-            """
-
-            try:
-                email_sender.send_email(recipient_email, subject, body, html=True)
-                print(f"Daily grocery summary email sent to {recipient_email} at {now.strftime('%H:%M:%S')}")
-            except Exception as e:
-                print(f"Error sending daily grocery summary email: {e}")
-
-    def __del__(self):
-        """Ensure the SMTP connection is closed when the object is destroyed."""
-        self._disconnect_smtp()
+    def send_welcome_email(self,recipient_email,username, email):
+        """Send a welcome email to the recipient."""
+        subject, body = self.welcome_email(username, email)
+        return self.send_email(recipient_email,subject, body, html=True)
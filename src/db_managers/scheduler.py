@@ -1,16 +1,377 @@
+import os
+import socket
+import threading
+import time
+import yaml
+import mysql.connector
+from datetime import datetime
+from typing import Callable, Dict, Optional, Set, Union
+from urllib.parse import quote_plus
+
+from apscheduler.events import (EVENT_JOB_ERROR, EVENT_JOB_EXECUTED, EVENT_JOB_MAX_INSTANCES, EVENT_JOB_MISSED,
+                                EVENT_JOB_SUBMITTED)
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.date import DateTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+from filelock import FileLock, Timeout
 from flask_apscheduler import APScheduler
 from flask import Flask
 
+from loggers.custom_logger import get_logger
+
+logger = get_logger(__name__)
+
+BASE_URL = os.path.join(os.path.dirname(__file__), '..')
+CONFIG_PATH = os.path.join(BASE_URL, 'constants', 'config.yaml')
+
+with open(CONFIG_PATH, 'r') as file:
+    config = yaml.safe_load(file)
+    scheduler_config = config.get('scheduler', {})
+    JOBSTORE_URL = os.getenv('SCHEDULER_JOBSTORE_URL') or scheduler_config.get('jobstore_url') or ''
+    SQLITE_PATH = os.path.join(BASE_URL, scheduler_config.get('sqlite_path', 'database/scheduler_jobs.sqlite'))
+    LEADER_LOCK = scheduler_config.get('leader_lock', 'auto')
+    LOCK_NAME = scheduler_config.get('lock_name', 'grocery_scheduler')
+    LEADER_CHECK_SECONDS = scheduler_config.get('leader_check_seconds', 15)
+    MISFIRE_GRACE_SECONDS = scheduler_config.get('misfire_grace_seconds', 300)
+    JOB_RUNS_TABLE = config['database']['tables'].get('job_runs', 'job_runs')
+
+TRIGGERS = {'cron': CronTrigger, 'interval': IntervalTrigger, 'date': DateTrigger}
+# add_job arguments that are not trigger fields
+JOB_OPTIONS = {'id', 'func', 'trigger', 'args', 'kwargs', 'name', 'misfire_grace_time', 'coalesce', 'max_instances',
+               'next_run_time', 'jobstore', 'executor', 'replace_existing'}
+
+
+def jobstore_url(db_config: Optional[Dict]) -> str:
+    """SQLAlchemy URL of the job store: explicit setting, else the app's MySQL database, else a local SQLite file."""
+    if JOBSTORE_URL:
+        return JOBSTORE_URL
+    if db_config and db_config.get('host'):
+        return (f"mysql+mysqlconnector://{quote_plus(db_config['user'] or '')}:"
+                f"{quote_plus(db_config['password'] or '')}@{db_config['host']}:{db_config.get('port', 3306)}/"
+                f"{db_config['database']}")
+    os.makedirs(os.path.dirname(SQLITE_PATH), exist_ok=True)
+    return f"sqlite:///{SQLITE_PATH}"
+
+
+class MySQLLeaderLock:
+    """Leadership through a named MySQL lock held by one dedicated connection.
+
+    ``GET_LOCK`` is released by the server when the holding connection dies,
+    so a crashed leader hands over without any lease bookkeeping.
+    """
+
+    def __init__(self, db_config: Dict, name: str = LOCK_NAME):
+        self.db_config = db_config
+        self.name = name
+        self.conn = None
+
+    def acquire(self) -> bool:
+        try:
+            if self.conn is None or not self.conn.is_connected():
+                self.conn = mysql.connector.connect(**self.db_config)
+            cursor = self.conn.cursor()
+            cursor.execute("SELECT GET_LOCK(%s, 0)", (self.name,))
+            acquired = cursor.fetchone()[0] == 1
+            cursor.close()
+            return acquired
+        except mysql.connector.Error as e:
+            logger.warning(f"Leader lock acquire failed: {e}")
+            self.conn = None
+            return False
+
+    def held(self) -> bool:
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("SELECT IS_USED_LOCK(%s) = CONNECTION_ID()", (self.name,))
+            held = cursor.fetchone()[0] == 1
+            cursor.close()
+            return held
+        except (mysql.connector.Error, AttributeError):
+            return False
+
+    def release(self) -> None:
+        if self.conn is not None:
+            try:
+                self.conn.close()
+            except mysql.connector.Error:
+                pass
+            self.conn = None
+
+
+class FileLeaderLock:
+    """Leadership through an OS file lock; covers every worker on one host (local development, single node)."""
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.lock = FileLock(path, timeout=0)
+
+    def acquire(self) -> bool:
+        try:
+            self.lock.acquire()
+            return True
+        except Timeout:
+            return False
+
+    def held(self) -> bool:
+        return self.lock.is_locked
+
+    def release(self) -> None:
+        if self.lock.is_locked:
+            self.lock.release(force=True)
+
+
+class JobMetrics:
+    """Run history of scheduled jobs, written by the leader to ``job_runs``.
+
+    Durations are measured from submission to completion. Misfires (runs
+    skipped because no leader was up within ``misfire_grace_time``) and runs
+    skipped because the previous one was still going are recorded too.
+    """
+
+    def __init__(self, db_config: Dict):
+        self.db_config = db_config
+        self.host = f"{socket.gethostname()}:{os.getpid()}"
+        self._submitted: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+        self.create_table()
+
+    def create_table(self) -> None:
+        conn = None
+        cursor = None
+        try:
+            conn = mysql.connector.connect(**self.db_config)
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS {JOB_RUNS_TABLE} (
+                    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                    job_id VARCHAR(191) NOT NULL,
+                    scheduled_at DATETIME NULL,
+                    finished_at DATETIME NOT NULL,
+                    duration_s DOUBLE NULL,
+                    status VARCHAR(16) NOT NULL,
+                    error VARCHAR(512) NULL,
+                    host VARCHAR(128) NOT NULL,
+                    INDEX idx_job_runs_job_finished (job_id, finished_at)
+                )
+            """)
+            conn.commit()
+        except mysql.connector.Error as e:
+            logger.error(f"Error creating {JOB_RUNS_TABLE} table: {e}")
+            raise RuntimeError(f"Error creating {JOB_RUNS_TABLE} table: {e}")
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                conn.close()
+
+    def _record(self, job_id: str, scheduled_at, status: str, duration: Optional[float] = None,
+                error: Optional[str] = None) -> None:
+        conn = None
+        cursor = None
+        try:
+            conn = mysql.connector.connect(**self.db_config)
+            cursor = conn.cursor()
+            cursor.execute(
+                f"INSERT INTO {JOB_RUNS_TABLE} (job_id, scheduled_at, finished_at, duration_s, status, error, host) "
+                f"VALUES (%s, %s, NOW(), %s, %s, %s, %s)",
+                (job_id, scheduled_at.replace(tzinfo=None) if scheduled_at else None,
+                 round(duration, 3) if duration is not None else None, status, (error or '')[:512] or None, self.host)
+            )
+            conn.commit()
+        except mysql.connector.Error as e:
+            logger.error(f"Error recording run of job {job_id}: {e}")
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                conn.close()
+
+    def listener(self, event) -> None:
+        key = (event.job_id, event.scheduled_run_time if hasattr(event, 'scheduled_run_time') else None)
+        if event.code == EVENT_JOB_SUBMITTED:
+            for run_time in event.scheduled_run_times:
+                with self._lock:
+                    self._submitted[(event.job_id, run_time)] = time.perf_counter()
+            return
+        if event.code == EVENT_JOB_MISSED:
+            logger.warning(f"Job {event.job_id} misfired (scheduled {event.scheduled_run_time})")
+            self._record(event.job_id, event.scheduled_run_time, 'missed')
+            return
+        if event.code == EVENT_JOB_MAX_INSTANCES:
+            for run_time in event.scheduled_run_times:
+                logger.warning(f"Job {event.job_id} skipped at {run_time}: previous run still in progress")
+                self._record(event.job_id, run_time, 'skipped')
+            return
+        with self._lock:
+            started = self._submitted.pop(key, None)
+        duration = time.perf_counter() - started if started is not None else None
+        if event.code == EVENT_JOB_ERROR:
+            logger.error(f"Job {event.job_id} failed after {duration or 0:.2f}s: {event.exception}")
+            self._record(event.job_id, event.scheduled_run_time, 'failed', duration, repr(event.exception))
+        else:
+            logger.info(f"Job {event.job_id} finished in {duration or 0:.2f}s")
+            self._record(event.job_id, event.scheduled_run_time, 'ok', duration)
+
+    def summary(self, days: int = 7) -> Dict[str, Dict]:
+        """Per-job run counts, failures, misfires and durations over the last ``days``."""
+        conn = None
+        cursor = None
+        try:
+            conn = mysql.connector.connect(**self.db_config)
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute(f"""
+                SELECT job_id,
+                       SUM(status = 'ok') AS ok, SUM(status = 'failed') AS failed,
+                       SUM(status = 'missed') AS missed, SUM(status = 'skipped') AS skipped,
+                       AVG(duration_s) AS avg_duration_s, MAX(duration_s) AS max_duration_s,
+                       MAX(finished_at) AS last_finished_at
+                FROM {JOB_RUNS_TABLE}
+                WHERE finished_at >= NOW() - INTERVAL %s DAY
+                GROUP BY job_id
+            """, (days,))
+            return {row.pop('job_id'): {
+                key: (float(value) if key.endswith('_s') and value is not None else
+                      int(value) if key in ('ok', 'failed', 'missed', 'skipped') else
+                      value.strftime('%Y-%m-%d %H:%M:%S') if value else None)
+                for key, value in row.items()
+            } for row in cursor.fetchall()}
+        except mysql.connector.Error as e:
+            logger.error(f"Error reading job run summary: {e}")
+            raise RuntimeError(f"Error reading job run summary: {e}")
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                conn.close()
+
+
 class Scheduler:
-    def __init__(self, app: Flask ):
-        self.scheduler = APScheduler()
+    """Cluster-wide job scheduler: every job runs once, on the elected leader.
+
+    Every process registers the same jobs with ``start`` and then calls
+    ``run``, but only the process holding the leader lock runs APScheduler. Jobs are stored in a
+    persistent SQLAlchemy job store (the app's MySQL database in production,
+    a SQLite file locally), so schedules and next run times survive
+    restarts and leader handovers. On election the store is synced with the
+    registered jobs: a stored job whose function and trigger are unchanged
+    keeps its next run time, a changed one is replaced (and rescheduled from
+    its new trigger), and stored jobs that are no longer registered are
+    removed. Runs missed during a leader handover are caught up within
+    ``misfire_grace_time``. A background thread retries the election, so a
+    follower takes over when the leader's lock goes away. A leader that
+    loses its lock pauses until it wins it back.
+
+    Jobs must be module-level functions (or ``"module:function"``
+    references) because the job store serialises them by reference.
+    """
+
+    def __init__(self, app: Flask, db_config: Optional[Dict] = None, leader_lock: str = LEADER_LOCK):
         self.app = app
-        self.trigger = 'cron'
-        self.hour = 0
-        self.minute = 0
-        self.second = 0
-    
-    def start(self, func, id, trigger='cron', **kwargs):
-        self.scheduler.init_app(self.app)
-        self.scheduler.add_job(id=id, func=func, trigger=trigger, **kwargs)
-        self.scheduler.start()
+        self.db_config = db_config
+        app.config.setdefault('SCHEDULER_JOBSTORES', {'default': SQLAlchemyJobStore(url=jobstore_url(db_config))})
+        app.config.setdefault('SCHEDULER_JOB_DEFAULTS', {
+            'coalesce': True, 'max_instances': 1, 'misfire_grace_time': MISFIRE_GRACE_SECONDS})
+        self.scheduler = APScheduler()
+        self.metrics = JobMetrics(db_config) if db_config else None
+        use_mysql = leader_lock == 'mysql' or (leader_lock == 'auto' and db_config and db_config.get('host'))
+        self.lock = (MySQLLeaderLock(db_config) if use_mysql
+                     else FileLeaderLock(os.path.join(os.path.dirname(SQLITE_PATH), f'{LOCK_NAME}.lock')))
+        self.jobs: Dict[str, Dict] = {}
+        self.run_on_election: Set[str] = set()
+        self.is_leader = False
+        self.started = False
+        self._state_lock = threading.Lock()
+        self._elector = None
+
+    def start(self, func: Union[str, Callable], id, trigger='cron', run_on_election: bool = False, **kwargs):
+        """Register a job; it is scheduled on whichever process is (or becomes) the leader.
+
+        ``run_on_election`` also runs the job as soon as a process becomes
+        leader, for jobs that build state held in the leader's memory.
+        """
+        spec = dict(id=id, func=func, trigger=trigger, **kwargs)
+        with self._state_lock:
+            self.jobs[id] = spec
+            if run_on_election:
+                self.run_on_election.add(id)
+            if self.is_leader:
+                self._schedule(id, spec)
+
+    def run(self) -> None:
+        """Start taking part in the leader election; call once all jobs are registered."""
+        if self._elector is None:
+            self._elector = threading.Thread(target=self._election_loop, name='scheduler-leader', daemon=True)
+            self._elector.start()
+
+    @staticmethod
+    def _unchanged(job, spec: Dict) -> bool:
+        trigger_class = TRIGGERS.get(spec['trigger'])
+        if trigger_class is None or not isinstance(spec['func'], str):
+            return False
+        trigger = trigger_class(**{key: value for key, value in spec.items() if key not in JOB_OPTIONS})
+        return job.func_ref == spec['func'] and str(job.trigger) == str(trigger)
+
+    def _schedule(self, job_id: str, spec: Dict) -> None:
+        # An unchanged stored job keeps its next run time; a new or changed one is (re)added
+        job = self.scheduler.get_job(job_id)
+        if job is None or not self._unchanged(job, spec):
+            self.scheduler.add_job(replace_existing=True, **spec)
+            if job is not None:
+                logger.info(f"Scheduled job {job_id} changed: {job.trigger} -> {self.scheduler.get_job(job_id).trigger}")
+        if job_id in self.run_on_election:
+            self.scheduler.modify_job(job_id, next_run_time=datetime.now())
+
+    def _become_leader(self) -> None:
+        with self._state_lock:
+            if not self.started:
+                self.scheduler.init_app(self.app)
+                if self.metrics:
+                    self.scheduler.add_listener(self.metrics.listener,
+                                                EVENT_JOB_SUBMITTED | EVENT_JOB_EXECUTED | EVENT_JOB_ERROR
+                                                | EVENT_JOB_MISSED | EVENT_JOB_MAX_INSTANCES)
+            if not self.started:
+                # Paused until the jobs are reconciled with the store, so nothing runs on stale state
+                self.scheduler.start(paused=True)
+                self.started = True
+            for job in self.scheduler.get_jobs():
+                if job.id not in self.jobs:
+                    self.scheduler.remove_job(job.id)
+                    logger.info(f"Removed scheduled job {job.id}: no longer registered")
+            for job_id, spec in self.jobs.items():
+                self._schedule(job_id, spec)
+            self.scheduler.resume()
+            self.is_leader = True
+        logger.info(f"Scheduler leader elected ({socket.gethostname()}:{os.getpid()}); running {len(self.jobs)} jobs")
+
+    def _step_down(self) -> None:
+        with self._state_lock:
+            if self.started:
+                self.scheduler.pause()
+            self.is_leader = False
+        self.lock.release()
+        logger.warning("Scheduler lost the leader lock; jobs paused on this process")
+
+    def _election_loop(self) -> None:
+        while True:
+            try:
+                if not self.is_leader and self.lock.acquire():
+                    self._become_leader()
+                elif self.is_leader and not self.lock.held():
+                    self._step_down()
+            except Exception as e:
+                logger.error(f"Scheduler election error: {e}", exc_info=True)
+            time.sleep(LEADER_CHECK_SECONDS)
+
+    def status(self) -> Dict:
+        """Leadership, registered jobs with their next run times (on the leader), and recent run metrics."""
+        jobs = {}
+        for job_id in self.jobs:
+            job = self.scheduler.get_job(job_id) if self.is_leader else None
+            jobs[job_id] = {'next_run_time': job.next_run_time.isoformat() if job and job.next_run_time else None}
+        return {
+            'leader': self.is_leader,
+            'host': f"{socket.gethostname()}:{os.getpid()}",
+            'jobs': jobs,
+            'runs': self.metrics.summary() if self.metrics else {},
+        }
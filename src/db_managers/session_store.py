@@ -0,0 +1,46 @@
+import os
+from datetime import timedelta
+from flask import Flask
+from flask_session import Session
+from cachelib import FileSystemCache
+
+from loggers.custom_logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def configure_session(app: Flask, session_config: dict, base_dir: str) -> Session:
+    """Move session data server-side so the cookie only carries the session id.
+
+    ``session_config`` is the ``session`` section of config.yaml. The local
+    backend is a cachelib FileSystemCache; setting ``backend: redis`` (or the
+    SESSION_REDIS_URL env var) uses any Redis-compatible server instead.
+    Flask-Session serializes payloads with msgspec/msgpack and expires them
+    after ``lifetime_seconds``.
+    """
+    lifetime = session_config.get('lifetime_seconds', 3600)
+    redis_url = os.getenv('SESSION_REDIS_URL') or session_config.get('redis_url')
+    backend = 'redis' if redis_url else session_config.get('backend', 'filesystem')
+
+    app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(seconds=lifetime)
+    app.config['SESSION_PERMANENT'] = True
+    app.config['SESSION_KEY_PREFIX'] = session_config.get('key_prefix', 'grocery:session:')
+    app.config['SESSION_SERIALIZATION_FORMAT'] = 'msgpack'
+
+    if backend == 'redis':
+        import redis
+        app.config['SESSION_TYPE'] = 'redis'
+        app.config['SESSION_REDIS'] = redis.from_url(redis_url)
+    elif backend == 'filesystem':
+        cache_dir = os.path.join(base_dir, session_config.get('directory', 'flask_session'))
+        app.config['SESSION_TYPE'] = 'cachelib'
+        app.config['SESSION_CACHELIB'] = FileSystemCache(
+            cache_dir=cache_dir,
+            threshold=session_config.get('max_sessions', 10000),
+            default_timeout=lifetime,
+        )
+    else:
+        raise ValueError(f"Unknown session backend: {backend}")
+
+    logger.info(f"Server-side sessions enabled ({backend}, ttl {lifetime}s)")
+    return Session(app)
@@ -0,0 +1,237 @@
+import os
+import time
+import atexit
+import smtplib
+import threading
+import yaml
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Optional, Sequence, Union
+
+from loggers.custom_logger import get_logger
+from loggers.metrics import RETRIES
+
+logger = get_logger(__name__)
+
+BASE_URL = os.path.join(os.path.dirname(__file__), '..')
+CONFIG_PATH = os.path.join(BASE_URL, 'constants', 'config.yaml')
+
+with open(CONFIG_PATH, 'r') as file:
+    config = yaml.safe_load(file)
+    smtp_config = config.get('email', {}).get('smtp', {})
+    SMTP_POOL_SIZE = smtp_config.get('pool_size', 6)
+    SMTP_IDLE_TIMEOUT = smtp_config.get('idle_timeout_seconds', 60)
+    SMTP_NOOP_AFTER = smtp_config.get('noop_after_seconds', 15)
+    SMTP_MAX_MESSAGES = smtp_config.get('max_messages_per_connection', 100)
+    SMTP_ACQUIRE_TIMEOUT = smtp_config.get('acquire_timeout_seconds', 30)
+    SMTP_TIMEOUT = smtp_config.get('socket_timeout_seconds', 30)
+
+RATE_WINDOW_SECONDS = 60
+
+
+class _Connection:
+    __slots__ = ('smtp', 'created_at', 'last_used', 'messages')
+
+    def __init__(self, smtp):
+        self.smtp = smtp
+        self.created_at = self.last_used = time.monotonic()
+        self.messages = 0
+
+
+class SmtpPool:
+    """Thread-safe pool of logged-in SMTP connections.
+
+    Idle connections are kept LIFO, so the busiest ones stay warm and the rest
+    age out. On checkout a connection idle longer than ``idle_timeout`` is
+    closed, and one idle longer than ``noop_after`` is health-checked with
+    NOOP first. Connections are retired after ``max_messages``, because
+    providers such as Gmail cap messages per session. A send that finds
+    the connection dropped is retried once on a fresh, re-logged-in one. At most
+    ``size`` connections exist; further callers wait up to ``acquire_timeout``.
+    """
+
+    def __init__(self, host: str, port: int, use_ssl: bool, username: Optional[str], password: Optional[str],
+                 size: int = SMTP_POOL_SIZE, idle_timeout: float = SMTP_IDLE_TIMEOUT,
+                 noop_after: float = SMTP_NOOP_AFTER, max_messages: int = SMTP_MAX_MESSAGES,
+                 acquire_timeout: float = SMTP_ACQUIRE_TIMEOUT, socket_timeout: float = SMTP_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.use_ssl = use_ssl
+        self.username = username
+        self.password = password
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.noop_after = noop_after
+        self.max_messages = max_messages
+        self.acquire_timeout = acquire_timeout
+        self.socket_timeout = socket_timeout
+        self._idle: deque = deque()
+        self._open = 0
+        self._cond = threading.Condition()
+        self._sent_at: deque = deque()
+        self._stats = {'sent': 0, 'failed': 0, 'opened': 0, 'closed': 0, 'reused': 0, 'noop_failures': 0}
+
+    # --- connection lifecycle ----------------------------------------------------
+
+    def _connect(self) -> _Connection:
+        smtp_class = smtplib.SMTP_SSL if self.use_ssl else smtplib.SMTP
+        smtp = smtp_class(self.host, self.port, timeout=self.socket_timeout)
+        try:
+            if self.password:
+                smtp.login(self.username, self.password)
+        except Exception:
+            smtp.close()
+            raise
+        with self._cond:
+            self._stats['opened'] += 1
+        logger.debug("Opened SMTP connection to %s:%s", self.host, self.port)
+        return _Connection(smtp)
+
+    def _close(self, conn: _Connection) -> None:
+        try:
+            conn.smtp.quit()
+        except Exception:
+            conn.smtp.close()
+        with self._cond:
+            self._open -= 1
+            self._stats['closed'] += 1
+            self._cond.notify()
+
+    def _healthy(self, conn: _Connection) -> bool:
+        try:
+            return conn.smtp.noop()[0] == 250
+        except smtplib.SMTPException:
+            return False
+        except OSError:
+            return False
+
+    def _checkout(self) -> _Connection:
+        deadline = time.monotonic() + self.acquire_timeout
+        while True:
+            stale = []
+            conn = None
+            with self._cond:
+                now = time.monotonic()
+                while self._idle:
+                    candidate = self._idle.pop()
+                    if now - candidate.last_used > self.idle_timeout:
+                        stale.append(candidate)
+                    else:
+                        conn = candidate
+                        break
+                create = conn is None and self._open - len(stale) < self.size
+                if create:
+                    self._open += 1
+                elif conn is None and not stale:
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        raise TimeoutError(f"No SMTP connection available within {self.acquire_timeout}s")
+                    self._cond.wait(remaining)
+                    continue
+            for old in stale:
+                self._close(old)
+            if conn is not None:
+                if time.monotonic() - conn.last_used > self.noop_after and not self._healthy(conn):
+                    with self._cond:
+                        self._stats['noop_failures'] += 1
+                    self._close(conn)
+                    continue
+                with self._cond:
+                    self._stats['reused'] += 1
+                return conn
+            if create:
+                try:
+                    return self._connect()
+                except Exception:
+                    with self._cond:
+                        self._open -= 1
+                        self._cond.notify()
+                    raise
+
+    def _checkin(self, conn: _Connection, broken: bool = False) -> None:
+        if broken or conn.messages >= self.max_messages:
+            self._close(conn)
+            return
+        conn.last_used = time.monotonic()
+        with self._cond:
+            self._idle.append(conn)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection; it is returned to the pool, or closed if the block hit a transport error."""
+        conn = self._checkout()
+        try:
+            yield conn
+        except BaseException as e:
+            # SMTP replies (refused recipient, etc.) leave the session usable; socket failures do not
+            broken = isinstance(e, smtplib.SMTPServerDisconnected) or (
+                isinstance(e, OSError) and not isinstance(e, smtplib.SMTPException))
+            self._checkin(conn, broken=broken)
+            raise
+        self._checkin(conn)
+
+    # --- sending -------------------------------------------------------------------
+
+    def _record(self, ok: bool, count: int = 1) -> None:
+        now = time.monotonic()
+        with self._cond:
+            self._stats['sent' if ok else 'failed'] += count
+            if ok:
+                self._sent_at.extend([now] * count)
+            while self._sent_at and now - self._sent_at[0] > RATE_WINDOW_SECONDS:
+                self._sent_at.popleft()
+
+    def sendmail(self, from_addr: str, recipients: Union[str, Sequence[str]], message: str) -> Dict:
+        """Send one message to one or many recipients in a single SMTP transaction.
+
+        Returns smtplib's dict of refused recipients. A dropped connection is
+        replaced and the send retried once.
+        """
+        recipients = [recipients] if isinstance(recipients, str) else list(recipients)
+        for attempt in (1, 2):
+            try:
+                with self.connection() as conn:
+                    refused = conn.smtp.sendmail(from_addr, recipients, message)
+                    conn.messages += 1
+                self._record(True, len(recipients) - len(refused))
+                return refused
+            except smtplib.SMTPServerDisconnected:
+                if attempt == 2:
+                    self._record(False, len(recipients))
+                    raise
+                RETRIES.labels('smtp_send').inc()
+                logger.info("SMTP connection dropped; retrying on a fresh connection")
+            except Exception:
+                self._record(False, len(recipients))
+                raise
+
+    def stats(self) -> Dict:
+        """Counters plus current pool occupancy and the send rate over the last minute."""
+        self._record(True, 0)
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update(open=self._open, idle=len(self._idle),
+                         sent_per_minute=len(self._sent_at) * 60 / RATE_WINDOW_SECONDS)
+        return stats
+
+    def close_all(self) -> None:
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+        for conn in idle:
+            self._close(conn)
+
+
+_pools: Dict[tuple, SmtpPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(host: str, port: int, use_ssl: bool, username: Optional[str], password: Optional[str]) -> SmtpPool:
+    """Process-wide pool per SMTP endpoint and account, closed at interpreter exit."""
+    key = (host, port, use_ssl, username)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = SmtpPool(host, port, use_ssl, username, password)
+            atexit.register(pool.close_all)
+        return pool
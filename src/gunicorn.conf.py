@@ -0,0 +1,37 @@
+"""Gunicorn settings: ``gunicorn -c gunicorn.conf.py main:app`` from src/ (the Procfile passes it explicitly).
+
+Workers share Prometheus metrics through files in PROMETHEUS_MULTIPROC_DIR.
+The directory is emptied when the master starts. A dead worker's live gauges
+are dropped when it exits. Workers log to stdout, which the platform
+collects and rotates; a shared rotating file would be rotated by every worker.
+"""
+import os
+import shutil
+import yaml
+
+BASE_URL = os.path.abspath(os.path.dirname(__file__))
+CONFIG_PATH = os.path.join(BASE_URL, 'constants', 'config.yaml')
+
+with open(CONFIG_PATH, 'r') as file:
+    config = yaml.safe_load(file)
+    MULTIPROC_DIR = config.get('metrics', {}).get('multiproc_dir', 'database/prometheus')
+
+# Must be set before any worker imports prometheus_client
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(BASE_URL, MULTIPROC_DIR))
+os.environ.setdefault('LOG_OUTPUT', 'stdout')
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.getenv('GUNICORN_WORKERS', 2))
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
+
+
+def on_starting(server):
+    multiproc_dir = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(multiproc_dir, ignore_errors=True)
+    os.makedirs(multiproc_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,38 @@
+"""Entry points of scheduled jobs.
+
+The scheduler's persistent job store saves jobs by reference ("jobs:<name>"),
+so jobs are plain module-level functions. They call the live components the
+app hands over through ``bind`` at start-up.
+"""
+from typing import Dict
+
+_components: Dict[str, object] = {}
+
+
+def bind(**components) -> None:
+    """Register the app's components (upload_gc, expiry_index, inventory_ledger, ...) for the jobs below."""
+    _components.update(components)
+
+
+def upload_gc():
+    return _components['upload_gc'].run()
+
+
+def expiry_reload():
+    return _components['expiry_index'].load()
+
+
+def expiry_poll():
+    return _components['expiry_index'].poll()
+
+
+def inventory_reconcile():
+    return _components['inventory_ledger'].reconcile()
+
+
+def restock_forecast():
+    return _components['restock_forecaster'].run()
+
+
+def daily_digest():
+    return _components['digest_pipeline'].run()
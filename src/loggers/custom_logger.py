@@ -1,33 +1,196 @@
-import logging
-import os
-from pathlib import Path
+"""Application logging: records are queued by the caller and written by one background thread.
+
+Modules get their logger with ``get_logger(__name__)``; all of them hang off
+the ``grocery_agent`` logger, so levels can be set per module in
+``config.yaml`` (``logging.levels``). Disabled levels cost one cached
+level check, and ``%``-style arguments are only formatted for records that
+are kept. High-volume DEBUG messages are sampled. File writes, rotation
+(by size and by time) and JSON encoding all happen on the listener thread.
 
+The rotating file is for a single process (``python main.py``). Processes
+that share a log directory would rotate the same file under each other, so
+with ``logging.output: stdout`` (set by ``gunicorn.conf.py``) the listener
+writes to stdout instead and rotation is left to the platform.
+"""
+import os
+import copy
+import json
+import time
+import queue
+import random
+import atexit
 import logging
-print(logging.__file__)
+import sys
+import threading
+import yaml
+from collections import defaultdict
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
+
+BASE_URL = os.path.join(os.path.dirname(__file__), '..')
+CONFIG_PATH = os.path.join(BASE_URL, 'constants', 'config.yaml')
+
+with open(CONFIG_PATH, 'r') as file:
+    config = yaml.safe_load(file)
+    logging_config = config.get('logging', {})
+    LOG_LEVEL = os.getenv('LOG_LEVEL') or logging_config.get('level', 'INFO')
+    LOG_FORMAT = os.getenv('LOG_FORMAT') or logging_config.get('format', 'text')
+    LOG_OUTPUT = os.getenv('LOG_OUTPUT') or logging_config.get('output', 'file')
+    LOG_FILE = os.path.join(BASE_URL, logging_config.get('file', 'loggers/logs/grocery_assistant.log'))
+    LOG_MAX_BYTES = logging_config.get('max_bytes', 20 * 1024 * 1024)
+    LOG_ROTATE_WHEN = logging_config.get('rotate_when', 'midnight')
+    LOG_BACKUP_COUNT = logging_config.get('backup_count', 14)
+    LOG_QUEUE_SIZE = logging_config.get('queue_size', 10000)
+    MODULE_LEVELS = logging_config.get('levels', {}) or {}
+    sampling_config = logging_config.get('sampling', {})
+    SAMPLE_BURST = sampling_config.get('burst', 20)
+    SAMPLE_WINDOW_SECONDS = sampling_config.get('window_seconds', 60)
+    SAMPLE_RATE = sampling_config.get('rate', 0.01)
+
+ROOT_LOGGER_NAME = "grocery_agent"
+TEXT_FORMAT = '[%(asctime)s: %(levelname)s] %(name)s: %(message)s'
+
+
+class SizeAndTimeRotatingFileHandler(TimedRotatingFileHandler):
+    """Rotates at the configured time boundary and whenever the file exceeds ``max_bytes``."""
+
+    def __init__(self, filename, max_bytes=0, **kwargs):
+        super().__init__(filename, **kwargs)
+        self.max_bytes = max_bytes
+
+    def shouldRollover(self, record):
+        if super().shouldRollover(record):
+            return True
+        if self.max_bytes and self.stream is not None:
+            return self.stream.tell() + len(self.format(record)) + 1 >= self.max_bytes
+        return False
+
+    def rotation_filename(self, default_name):
+        # A size rollover can happen several times per time period: keep each file, numbered
+        # past the highest existing suffix so name order stays age order for backup pruning
+        base = os.path.basename(default_name)
+        suffixes = [0 if name == base else int(name[len(base) + 1:])
+                    for name in os.listdir(os.path.dirname(default_name) or '.')
+                    if name == base or (name.startswith(base + '.') and name[len(base) + 1:].isdigit())]
+        if not suffixes:
+            return super().rotation_filename(default_name)
+        return super().rotation_filename(f"{default_name}.{max(suffixes) + 1:03d}")
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line."""
+
+    def format(self, record):
+        entry = {
+            'ts': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            'module': record.module,
+            'line': record.lineno,
+            'thread': record.threadName,
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class DebugSampler(logging.Filter):
+    """Keeps the first ``burst`` records of each DEBUG message template per window, then 1 in ``1/rate``.
 
+    Records at INFO and above always pass. Templates are keyed on the
+    unformatted ``%``-style message, so the check never formats anything.
+    """
 
-# Create a logs directory if it doesn't exist
-logging_dir = os.path.dirname(__file__)
-logging_dir = os.path.join(logging_dir, 'logs')
-os.makedirs(logging_dir, exist_ok=True)
+    def __init__(self, burst=SAMPLE_BURST, window=SAMPLE_WINDOW_SECONDS, rate=SAMPLE_RATE):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self.rate = rate
+        self._counts = defaultdict(int)
+        self._window_start = time.monotonic()
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG:
+            return True
+        key = (record.name, record.msg if isinstance(record.msg, str) else type(record.msg))
+        with self._lock:
+            now = time.monotonic()
+            if now - self._window_start >= self.window:
+                self._counts.clear()
+                self._window_start = now
+            self._counts[key] += 1
+            keep = self._counts[key] <= self.burst or random.random() < self.rate
+            if not keep:
+                self.dropped += 1
+        return keep
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Drops (and counts) records instead of blocking the request when the writer falls behind."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Format the message here (arguments may change after the call) but keep the
+        # traceback separate so the file formatter can place it (e.g. JSON "exc" field)
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _build_handler():
+    if LOG_OUTPUT == 'stdout':
+        handler = logging.StreamHandler(sys.stdout)
+    else:
+        os.makedirs(os.path.dirname(LOG_FILE), exist_ok=True)
+        handler = SizeAndTimeRotatingFileHandler(LOG_FILE, max_bytes=LOG_MAX_BYTES, when=LOG_ROTATE_WHEN,
+                                                 backupCount=LOG_BACKUP_COUNT, encoding='utf-8', delay=True)
+    handler.setFormatter(JsonFormatter() if LOG_FORMAT == 'json' else logging.Formatter(TEXT_FORMAT))
+    return handler
+
+
+def get_logger(name=None):
+    """Logger for a module, e.g. ``get_logger(__name__)``; levels come from ``logging.levels`` in config."""
+    if not name or name == ROOT_LOGGER_NAME:
+        return logging.getLogger(ROOT_LOGGER_NAME)
+    return logging.getLogger(f"{ROOT_LOGGER_NAME}.{name}")
 
-# Define the log file path
-log_file = os.path.join(logging_dir, 'grocery_assistant.log')
 
 # Initialize logger
-logger = logging.getLogger("grocery_agent")
-logger.setLevel(logging.DEBUG)  # Set logging level
-
-# Set up a file handler with a formatter
-handler = logging.FileHandler(log_file)
-handler.setFormatter(logging.Formatter(fmt='[%(asctime)s: %(levelname)s] %(message)s'))
-
-# Add the handler to the logger
-logger.addHandler(handler)
-
-# Log some messages
-logger.info("Logger initialized")
-logger.error("Error")
-logger.debug("Debug (won't appear unless logger level is set to DEBUG)")
-logger.warning("Warning")
-logger.critical("Critical")
+logger = logging.getLogger(ROOT_LOGGER_NAME)
+logger.setLevel(LOG_LEVEL.upper())
+logger.propagate = False
+for module_name, level in MODULE_LEVELS.items():
+    get_logger(module_name).setLevel(str(level).upper())
+
+_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+queue_handler = NonBlockingQueueHandler(_queue)
+queue_handler.addFilter(DebugSampler())
+logger.addHandler(queue_handler)
+
+listener = QueueListener(_queue, _build_handler(), respect_handler_level=True)
+listener.start()
+
+
+def _stop_listener():
+    if listener._thread is not None:
+        listener.stop()
+
+
+atexit.register(_stop_listener)
@@ -0,0 +1,139 @@
+"""Prometheus metrics, served from ``/metrics``.
+
+Under gunicorn every worker writes its samples to files in
+``PROMETHEUS_MULTIPROC_DIR`` (set up by ``gunicorn.conf.py``), and the worker
+that answers a scrape aggregates all of them. The variable must be set before
+this module is first imported. Without it, metrics are per process.
+
+Counters and histograms are updated where things happen. External call
+latency and errors come from the ``tracing`` spans. Gauges that describe state
+(pool occupancy, index sizes, outbox depth) are set by refresh callbacks that
+a background thread runs every ``metrics.refresh_seconds`` in each worker.
+"""
+import os
+import time
+import threading
+import yaml
+from typing import Callable, List
+
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest, multiprocess)
+
+from loggers.custom_logger import get_logger
+from loggers import tracing
+
+logger = get_logger(__name__)
+
+BASE_URL = os.path.join(os.path.dirname(__file__), '..')
+CONFIG_PATH = os.path.join(BASE_URL, 'constants', 'config.yaml')
+
+with open(CONFIG_PATH, 'r') as file:
+    config = yaml.safe_load(file)
+    metrics_config = config.get('metrics', {})
+    METRICS_ENABLED = metrics_config.get('enabled', True)
+    REFRESH_SECONDS = metrics_config.get('refresh_seconds', 15)
+    LATENCY_BUCKETS = tuple(metrics_config.get('latency_buckets',
+                                               [0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]))
+
+MULTIPROCESS = bool(os.getenv('PROMETHEUS_MULTIPROC_DIR'))
+
+REQUEST_LATENCY = Histogram('http_request_duration_seconds', 'Request latency by route',
+                            ['method', 'route', 'status'], buckets=LATENCY_BUCKETS)
+REQUEST_EXCEPTIONS = Counter('http_request_exceptions_total', 'Requests that raised an unhandled exception',
+                             ['route'])
+EXTERNAL_LATENCY = Histogram('external_call_duration_seconds', 'Latency of calls to external services (per attempt)',
+                             ['service'], buckets=LATENCY_BUCKETS)
+EXTERNAL_ERRORS = Counter('external_call_errors_total', 'Failed calls to external services', ['service'])
+RETRIES = Counter('retries_total', 'Operations retried after a transient failure', ['operation'])
+EMAILS = Counter('emails_total', 'Outbox deliveries by result', ['result'])
+EMBEDDING_BATCH = Histogram('embedding_batch_size', 'Texts per embedding call', ['source'],
+                            buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024))
+CACHE_LOOKUPS = Counter('cache_lookups_total', 'Cache lookups by result (hit ratio = hit / all)',
+                        ['cache', 'result'])
+POOL_IN_USE = Gauge('pool_connections_in_use', 'Checked-out connections', ['pool'], multiprocess_mode='livesum')
+POOL_SIZE = Gauge('pool_connections_max', 'Connection pool capacity', ['pool'], multiprocess_mode='livesum')
+FAISS_VECTORS = Gauge('faiss_index_vectors', 'Vectors in the per-user indexes held by this worker',
+                      multiprocess_mode='liveall')
+FAISS_USERS = Gauge('faiss_indexed_users', 'Users with an in-memory index in this worker',
+                    multiprocess_mode='liveall')
+OUTBOX_DEPTH = Gauge('email_outbox_messages', 'Outbox rows by status', ['status'], multiprocess_mode='livemax')
+
+_refreshers: List[Callable] = []
+_refresh_thread = None
+_refresh_lock = threading.Lock()
+
+
+def count_retry(operation: str) -> Callable:
+    """A tenacity ``before_sleep`` hook that counts the retry."""
+    def before_sleep(retry_state):
+        RETRIES.labels(operation).inc()
+    return before_sleep
+
+
+def _observe_span(name, kind, seconds, failed):
+    if kind != 'external':
+        return
+    EXTERNAL_LATENCY.labels(name).observe(seconds)
+    if failed:
+        EXTERNAL_ERRORS.labels(name).inc()
+
+
+def _refresh_loop():
+    while True:
+        for refresh in list(_refreshers):
+            try:
+                refresh()
+            except Exception as e:
+                logger.warning(f"Metrics refresh {getattr(refresh, '__name__', refresh)} failed: {e}")
+        time.sleep(REFRESH_SECONDS)
+
+
+def add_refresher(callback: Callable) -> None:
+    """Run ``callback()`` every ``refresh_seconds`` on this process's metrics thread (to set gauges)."""
+    global _refresh_thread
+    if not METRICS_ENABLED:
+        return
+    with _refresh_lock:
+        _refreshers.append(callback)
+        if _refresh_thread is None:
+            _refresh_thread = threading.Thread(target=_refresh_loop, name='metrics-refresh', daemon=True)
+            _refresh_thread.start()
+
+
+def render():
+    """The exposition body and content type, aggregated over all workers when running multiprocess."""
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def init_app(app) -> None:
+    """Record the latency of every request, labelled by route template (not raw path)."""
+    if not METRICS_ENABLED:
+        return
+    from flask import g, request
+
+    tracing.add_listener(_observe_span)
+
+    def route():
+        return request.url_rule.rule if request.url_rule else '<unmatched>'
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def _observe_request(response):
+        started = g.pop('metrics_started', None)
+        if started is not None:
+            REQUEST_LATENCY.labels(request.method, route(), response.status_code).observe(
+                time.perf_counter() - started)
+        return response
+
+    @app.teardown_request
+    def _count_exception(exc):
+        if exc is not None:
+            REQUEST_EXCEPTIONS.labels(route()).inc()
@@ -0,0 +1,227 @@
+"""On-demand profiling for admins, safe to leave deployed.
+
+Two entry points, both admin-only:
+
+* a single request: add ``?__profile=1`` to any URL. The response is replaced
+  by the request's profile. ``__profile=cprofile`` or ``__profile=pyinstrument``
+  use those profilers instead (pyinstrument only if installed);
+* a time window: ``/admin/profile?seconds=10`` samples every thread of the
+  worker for that long.
+
+The default profiler is a stack-sampling thread. It reads
+``sys._current_frames()`` at a fixed rate and does not hook the profiled code.
+The output uses the collapsed-stack format (one ``frame;frame;... count`` line
+per stack), which flamegraph.pl, speedscope and inferno read directly. The
+sampling rate comes from ``profiling.endpoints`` per Flask endpoint, with
+``profiling.default_hz`` as the fallback. Requests without ``__profile`` pay
+for one dict lookup.
+"""
+import os
+import sys
+import time
+import threading
+import yaml
+from collections import Counter
+from typing import Callable, Dict, Iterable, Optional
+
+from loggers.custom_logger import get_logger
+
+logger = get_logger(__name__)
+
+BASE_URL = os.path.join(os.path.dirname(__file__), '..')
+CONFIG_PATH = os.path.join(BASE_URL, 'constants', 'config.yaml')
+
+with open(CONFIG_PATH, 'r') as file:
+    config = yaml.safe_load(file)
+    profiling_config = config.get('profiling', {})
+    PROFILING_ENABLED = profiling_config.get('enabled', True)
+    DEFAULT_HZ = profiling_config.get('default_hz', 100)
+    MAX_HZ = profiling_config.get('max_hz', 1000)
+    MAX_WINDOW_SECONDS = profiling_config.get('max_window_seconds', 60)
+    ENDPOINT_HZ: Dict[str, int] = profiling_config.get('endpoints', {}) or {}
+
+PROFILE_PARAM = '__profile'
+COLLAPSED_MIMETYPE = 'text/plain; charset=utf-8'
+
+# One profile at a time per process keeps the cost bounded however many admins ask
+_busy = threading.Lock()
+
+
+class StackSampler:
+    """Counts the Python stacks of some threads, sampled ``hz`` times a second from a background thread."""
+
+    def __init__(self, hz: float = DEFAULT_HZ, thread_ids: Optional[Iterable[int]] = None, root: Optional[str] = None):
+        self.interval = 1.0 / max(1, min(hz, MAX_HZ))
+        self.thread_ids = set(thread_ids) if thread_ids is not None else None
+        self.root = root
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.started = self.stopped = None
+        self._labels: Dict[object, str] = {}
+        self._thread_names: Dict[int, str] = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = f"{os.path.basename(code.co_filename)}:{code.co_name}:{code.co_firstlineno}"
+        return label
+
+    def _thread_name(self, ident: int) -> str:
+        name = self._thread_names.get(ident)
+        if name is None:
+            self._thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+            name = self._thread_names.get(ident, str(ident))
+        return name
+
+    def _collapse(self, ident: int, frame) -> str:
+        frames = []
+        while frame is not None:
+            frames.append(self._label(frame.f_code))
+            frame = frame.f_back
+        frames.append(self.root or self._thread_name(ident).replace(' ', '_'))
+        return ';'.join(reversed(frames))
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own or (self.thread_ids is not None and ident not in self.thread_ids):
+                    continue
+                self.stacks[self._collapse(ident, frame)] += 1
+            self.samples += 1
+
+    def start(self) -> 'StackSampler':
+        self.started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.stopped = time.perf_counter()
+
+    def collapsed(self) -> str:
+        return '\n'.join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + '\n'
+
+    def headers(self) -> Dict[str, str]:
+        return {'X-Profile-Samples': str(self.samples), 'X-Profile-Hz': f"{1 / self.interval:.0f}",
+                'X-Profile-Seconds': f"{(self.stopped or time.perf_counter()) - self.started:.3f}"}
+
+
+def profile_window(seconds: float, hz: float = DEFAULT_HZ) -> Optional[StackSampler]:
+    """Sample every thread of this process for ``seconds``; None if another profile is running."""
+    if not _busy.acquire(blocking=False):
+        return None
+    try:
+        sampler = StackSampler(hz).start()
+        time.sleep(max(0.0, min(seconds, MAX_WINDOW_SECONDS)))
+        sampler.stop()
+        return sampler
+    finally:
+        _busy.release()
+
+
+class _RequestProfile:
+    """Profiles the current request thread with the sampler, cProfile or pyinstrument."""
+
+    def __init__(self, kind: str, hz: float, endpoint: str):
+        self.kind = kind
+        self.hz = hz
+        self.endpoint = endpoint
+        self.profiler = None
+
+    def start(self) -> None:
+        if self.kind == 'cprofile':
+            import cProfile
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        elif self.kind == 'pyinstrument':
+            from pyinstrument import Profiler
+            self.profiler = Profiler(interval=1.0 / self.hz)
+            self.profiler.start()
+        else:
+            self.profiler = StackSampler(self.hz, thread_ids=[threading.get_ident()], root=self.endpoint).start()
+
+    def finish(self):
+        """Stop profiling; returns ``(body, mimetype, headers)``."""
+        if self.kind == 'cprofile':
+            import io
+            import pstats
+            self.profiler.disable()
+            out = io.StringIO()
+            pstats.Stats(self.profiler, stream=out).sort_stats('cumulative').print_stats(80)
+            return out.getvalue(), COLLAPSED_MIMETYPE, {}
+        if self.kind == 'pyinstrument':
+            self.profiler.stop()
+            return self.profiler.output_html(), 'text/html; charset=utf-8', {}
+        self.profiler.stop()
+        return self.profiler.collapsed(), COLLAPSED_MIMETYPE, self.profiler.headers()
+
+
+def _profile_kind(value: str) -> str:
+    if value == 'pyinstrument':
+        try:
+            import pyinstrument  # noqa: F401
+            return 'pyinstrument'
+        except ImportError:
+            logger.warning("pyinstrument is not installed; using the stack sampler")
+    return 'cprofile' if value == 'cprofile' else 'sampler'
+
+
+def endpoint_hz(endpoint: Optional[str], requested: Optional[float] = None) -> float:
+    hz = requested or ENDPOINT_HZ.get(endpoint or '', DEFAULT_HZ)
+    return max(1, min(hz, MAX_HZ))
+
+
+def init_app(app, authorize: Callable[[], bool]) -> None:
+    """Let callers for whom ``authorize()`` is true profile a request with ``?__profile=<kind>``."""
+    if not PROFILING_ENABLED:
+        return
+    from flask import g, request
+
+    @app.before_request
+    def _start_profile():
+        value = request.args.get(PROFILE_PARAM)
+        if value is None or not authorize():
+            return
+        if not _busy.acquire(blocking=False):
+            logger.info(f"Profile of {request.path} skipped: another profile is running")
+            return
+        profile = _RequestProfile(_profile_kind(value), endpoint_hz(request.endpoint, request.args.get('hz', type=float)),
+                                  request.endpoint or 'unmatched')
+        try:
+            profile.start()
+        except Exception:
+            _busy.release()
+            raise
+        g.profile = profile
+
+    @app.after_request
+    def _return_profile(response):
+        profile = g.pop('profile', None)
+        if profile is None:
+            return response
+        try:
+            body, mimetype, headers = profile.finish()
+        finally:
+            _busy.release()
+        logger.info(f"Profiled {request.method} {request.path} ({profile.kind}) -> {response.status_code}")
+        profiled = app.response_class(body, content_type=mimetype)
+        profiled.headers.update(headers)
+        profiled.headers['X-Profiled-Status'] = str(response.status_code)
+        profiled.headers['Cache-Control'] = 'no-store'
+        return profiled
+
+    @app.teardown_request
+    def _abandon_profile(exc):
+        # after_request does not run when the view raised past the error handlers
+        profile = g.pop('profile', None)
+        if profile is not None:
+            try:
+                profile.finish()
+            finally:
+                _busy.release()
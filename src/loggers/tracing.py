@@ -0,0 +1,254 @@
+"""Per-request tracing: where the time of a request goes, phase by phase.
+
+``init_app`` opens a trace for every request. Code marks phases with the
+``span`` context manager or the ``traced`` decorator (knowledge-base build,
+embedding, FAISS search, DeepSeek/Gemini calls, ...). ``instrument_mysql``
+counts and times every MySQL query run while a trace is open. When the
+request ends, the totals go out in a ``Server-Timing`` header (visible in the
+browser's network panel), and slow requests are logged with their breakdown.
+Listeners added with ``add_listener`` (the Prometheus metrics) see every span.
+
+If ``tracing.otel.enabled`` is set and the OpenTelemetry SDK is installed,
+every span is also exported over OTLP, e.g. to the local Jaeger service in
+docker-compose.
+"""
+import os
+import time
+import functools
+import yaml
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional
+
+from loggers.custom_logger import get_logger
+
+logger = get_logger(__name__)
+
+BASE_URL = os.path.join(os.path.dirname(__file__), '..')
+CONFIG_PATH = os.path.join(BASE_URL, 'constants', 'config.yaml')
+
+with open(CONFIG_PATH, 'r') as file:
+    config = yaml.safe_load(file)
+    tracing_config = config.get('tracing', {})
+    TRACING_ENABLED = tracing_config.get('enabled', True)
+    SERVER_TIMING = tracing_config.get('server_timing', True)
+    SLOW_REQUEST_MS = tracing_config.get('slow_request_ms', 1500)
+    otel_config = tracing_config.get('otel', {})
+    OTEL_ENABLED = str(os.getenv('OTEL_ENABLED', otel_config.get('enabled', False))).lower() in ('1', 'true', 'yes')
+    OTEL_SERVICE_NAME = os.getenv('OTEL_SERVICE_NAME') or otel_config.get('service_name', 'grocery-assistant')
+    OTEL_ENDPOINT = os.getenv('OTEL_EXPORTER_OTLP_TRACES_ENDPOINT') or otel_config.get(
+        'endpoint', 'http://localhost:4318/v1/traces')
+
+_current: ContextVar[Optional['Trace']] = ContextVar('trace', default=None)
+_tracer = None
+_listeners: List[Callable] = []
+
+
+class Trace:
+    """Timings of one request, aggregated per phase name."""
+
+    __slots__ = ('name', 'started', 'phases', 'db_count', 'db_ms', '_db_depth', 'otel_span', 'otel_token')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.perf_counter()
+        self.phases: Dict[str, list] = {}
+        self.db_count = 0
+        self.db_ms = 0.0
+        self._db_depth = 0
+        self.otel_span = None
+        self.otel_token = None
+
+    def add(self, name: str, ms: float) -> None:
+        phase = self.phases.get(name)
+        if phase is None:
+            self.phases[name] = [1, ms]
+        else:
+            phase[0] += 1
+            phase[1] += ms
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def server_timing(self) -> str:
+        entries = [f'total;dur={self.elapsed_ms():.1f}',
+                   f'db;dur={self.db_ms:.1f};desc="{self.db_count} queries"']
+        for name, (count, ms) in self.phases.items():
+            entries.append(f'{name};dur={ms:.1f}' + (f';desc="{count} calls"' if count > 1 else ''))
+        return ', '.join(entries)
+
+    def summary(self) -> str:
+        phases = ', '.join(f"{name}={ms:.0f}ms" + (f" x{count}" if count > 1 else '')
+                           for name, (count, ms) in self.phases.items())
+        return f"db={self.db_ms:.0f}ms/{self.db_count}q" + (f", {phases}" if phases else '')
+
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+
+def add_listener(callback: Callable) -> None:
+    """Call ``callback(name, kind, seconds, failed)`` when any span ends, in or outside a request."""
+    _listeners.append(callback)
+
+
+@contextmanager
+def span(name: str, kind: str = 'internal', **attributes):
+    """Time a phase of the current request; ``kind='external'`` marks calls to other services."""
+    trace = _current.get()
+    if trace is None and _tracer is None and not _listeners:
+        yield
+        return
+    otel_cm = _tracer.start_as_current_span(name, attributes={'span.kind': kind, **attributes}) if _tracer else None
+    if otel_cm is not None:
+        otel_cm.__enter__()
+    start = time.perf_counter()
+    failed = True
+    try:
+        yield
+        failed = False
+    finally:
+        seconds = time.perf_counter() - start
+        if trace is not None:
+            trace.add(name, seconds * 1000)
+        for callback in _listeners:
+            callback(name, kind, seconds, failed)
+        if otel_cm is not None:
+            otel_cm.__exit__(None, None, None)
+
+
+def traced(name: str, kind: str = 'internal'):
+    """Decorator form of ``span``."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name, kind):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# --- MySQL ----------------------------------------------------------------------
+
+def _timed_execute(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        trace = _current.get()
+        if trace is None or trace._db_depth:
+            return method(self, *args, **kwargs)
+        trace._db_depth += 1
+        start = time.perf_counter()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            trace._db_depth -= 1
+            trace.db_count += 1
+            trace.db_ms += (time.perf_counter() - start) * 1000
+    wrapper._traced = True
+    return wrapper
+
+
+def instrument_mysql() -> None:
+    """Count and time ``execute``/``executemany`` on every mysql.connector cursor class (pure and C)."""
+    modules = []
+    try:
+        import mysql.connector.cursor as pure_cursors
+        modules.append(pure_cursors)
+    except ImportError:
+        return
+    try:
+        import mysql.connector.cursor_cext as c_cursors
+        modules.append(c_cursors)
+    except ImportError:
+        pass
+    for module in modules:
+        for cls in vars(module).values():
+            if not isinstance(cls, type) or 'Cursor' not in cls.__name__:
+                continue
+            for attr in ('execute', 'executemany'):
+                method = cls.__dict__.get(attr)
+                if callable(method) and not getattr(method, '_traced', False) \
+                        and not getattr(method, '__isabstractmethod__', False):
+                    setattr(cls, attr, _timed_execute(method))
+
+
+# --- OpenTelemetry ---------------------------------------------------------------
+
+def _init_otel() -> None:
+    global _tracer
+    try:
+        from opentelemetry import trace as otel_trace
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+    except ImportError:
+        logger.warning("tracing.otel is enabled but the OpenTelemetry SDK/OTLP exporter is not installed")
+        return
+    provider = TracerProvider(resource=Resource.create({'service.name': OTEL_SERVICE_NAME}))
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter(endpoint=OTEL_ENDPOINT)))
+    otel_trace.set_tracer_provider(provider)
+    _tracer = otel_trace.get_tracer(__name__)
+    logger.info(f"Exporting traces to {OTEL_ENDPOINT}")
+
+
+# --- Flask -------------------------------------------------------------------------
+
+def init_app(app) -> None:
+    """Open a trace per request and report it in ``Server-Timing`` and the slow-request log."""
+    if not TRACING_ENABLED:
+        return
+    from flask import g, request
+
+    instrument_mysql()
+    if OTEL_ENABLED:
+        _init_otel()
+
+    @app.before_request
+    def _start_trace():
+        rule = request.url_rule.rule if request.url_rule else request.path
+        trace = Trace(f"{request.method} {rule}")
+        g.trace_token = _current.set(trace)
+        if _tracer is not None:
+            from opentelemetry import context as otel_context, trace as otel_trace
+            trace.otel_span = _tracer.start_span(trace.name, kind=otel_trace.SpanKind.SERVER,
+                                                 attributes={'http.method': request.method, 'http.route': rule})
+            trace.otel_token = otel_context.attach(otel_trace.set_span_in_context(trace.otel_span))
+
+    @app.after_request
+    def _report_trace(response):
+        trace = _current.get()
+        if trace is None:
+            return response
+        if SERVER_TIMING:
+            response.headers['Server-Timing'] = trace.server_timing()
+        elapsed = trace.elapsed_ms()
+        if elapsed >= SLOW_REQUEST_MS:
+            logger.warning(f"Slow request {trace.name} -> {response.status_code}: {elapsed:.0f}ms ({trace.summary()})")
+        if trace.otel_span is not None:
+            trace.otel_span.set_attribute('http.status_code', response.status_code)
+            trace.otel_span.set_attribute('db.query_count', trace.db_count)
+        return response
+
+    @app.teardown_request
+    def _end_trace(exc):
+        # Always runs, even when the view or after_request raised: the worker thread is reused by
+        # the next request, which must not inherit this trace
+        token = g.pop('trace_token', None)
+        trace = _current.get()
+        try:
+            if trace is not None and trace.otel_span is not None:
+                from opentelemetry import context as otel_context
+                if exc is not None:
+                    trace.otel_span.record_exception(exc)
+                otel_context.detach(trace.otel_token)
+                trace.otel_span.end()
+        finally:
+            try:
+                if token is not None:
+                    _current.reset(token)
+                else:
+                    _current.set(None)
+            except ValueError:
+                # Token from another context (e.g. the request was handed to a copied context)
+                _current.set(None)
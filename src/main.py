@@ -12,14 +12,27 @@ if current_dir not in sys.path:
 from agents.grocery_agent import ReceiptProcessorAgent
 from agents.stock_agent import StockProcessorAgent
 from agents.grocery_analyzer import GroceryAnalyzer
-from loggers.custom_logger import logger
+from agents.expiry_index import ExpiryIndex
+from agents.restock_forecaster import RestockForecaster
+from loggers.custom_logger import get_logger
+from loggers import tracing
+from loggers.tracing import span
+from loggers import metrics
+from loggers import profiler
 from db_managers.db_manager import DBManager
 from db_managers.email_sender import EmailSender
+from db_managers.digest_pipeline import DigestPipeline
+from db_managers.email_outbox import OutboxSender
 from db_managers.scheduler import Scheduler
+from db_managers.session_store import configure_session
+from db_managers.chat_store import ChatStore
+from storage.image_store import ImageStore
+from storage.blob_store import build_blob_store
+from storage.upload_gc import UploadGarbageCollector
 import csv
 from io import StringIO
 
-from flask import Flask, render_template, url_for, redirect, flash, request, jsonify, send_from_directory, make_response, Response
+from flask import Flask, render_template, url_for, redirect, flash, request, jsonify, send_file, make_response, Response, abort
 from flask_wtf import FlaskForm, CSRFProtect
 from wtforms import FileField, SubmitField, StringField, PasswordField, BooleanField, IntegerField
 from wtforms.validators import DataRequired, NumberRange, Optional, Email, Length, EqualTo
@@ -29,14 +42,18 @@ import mysql.connector
 from werkzeug.utils import secure_filename
 from dotenv import load_dotenv
 import uuid
+import hmac
 import yaml
 import arrow
 from threading import Lock
 from collections import defaultdict
 from mysql.connector import pooling
-from datetime import datetime, timedelta
 from markdown import markdown
 import torch
+import jobs
+
+logger = get_logger(__name__)
+
 torch.set_num_threads(1)
 os.environ["OMP_NUM_THREADS"] = "1"
 os.environ["MKL_NUM_THREADS"] = "1"
@@ -57,6 +74,14 @@ try:
         DEEPSEEK_API_URL = config['deepseek']['api_url']
         ALLOWED_EXTENSIONS = set(config['upload']['allowed_extensions'])
         MAX_CONTENT_LENGTH = config['upload']['max_content_length']
+        IMAGE_CACHE_MAX_AGE = config['upload'].get('images', {}).get('cache_max_age', 31536000)
+        STORAGE_CONFIG = config.get('storage', {})
+        SESSION_CONFIG = config.get('session', {})
+        CHAT_PAGE_SIZE = config.get('chat', {}).get('page_size', 20)
+        INVENTORY_CONFIG = config.get('inventory', {})
+        EXPIRY_CONFIG = config.get('expiry', {})
+        FORECAST_CONFIG = config.get('forecast', {})
+        DIGEST_CONFIG = config.get('digest', {})
         DB_CONFIG = {
         "host": os.getenv("MYSQL_HOST"),
         "port": int(os.getenv("MYSQL_PORT", 3306)),
@@ -76,15 +101,21 @@ app = Flask(__name__)
 app.secret_key = os.getenv("APP_SECRET_KEY")
 app.config['UPLOAD_FOLDER'] = os.path.join(BASE_URL, 'uploads')
 app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
-app.permanent_session_lifetime = 3600
+configure_session(app, SESSION_CONFIG, BASE_URL)
 app.config['SESSION_COOKIE_SECURE'] = True  # Only send over HTTPS
 app.config['SESSION_COOKIE_HTTPONLY'] = True
 app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
+# Per-request phase timings and DB query counts, reported in the Server-Timing header
+tracing.init_app(app)
+# Prometheus request latency per route; served (aggregated across gunicorn workers) at /metrics
+metrics.init_app(app)
 chat_lock = Lock()
 app_context = app.app_context()
-scheduler = Scheduler(app = app)
+scheduler = Scheduler(app = app, db_config = DB_CONFIG)
 # Ensure upload folder exists
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+blob_store = build_blob_store(STORAGE_CONFIG, app.config['UPLOAD_FOLDER'])
+image_store = ImageStore(blob_store)
 
 # Initialize CSRF protection
 csrf = CSRFProtect(app)
@@ -94,16 +125,80 @@ db_pool = pooling.MySQLConnectionPool(pool_name="mypool", pool_size=5, **DB_CONF
 
 
 
-#email sender
-email_sender = EmailSender()
 
 
 db_manager = DBManager()
+# Transactional emails are queued in the outbox and sent by background threads, never in the request
+outbox_sender = OutboxSender(db_manager.outbox, sender_factory=EmailSender)
+outbox_sender.start()
 # Initialize agents and analyzer
 stock_agent = StockProcessorAgent(api_key=GEMINI_API_KEY)
 receipt_agent = ReceiptProcessorAgent(api_key=GEMINI_API_KEY)
 
 analyzer = GroceryAnalyzer(stock_agent=stock_agent, receipt_agent=receipt_agent,db_manager = db_manager)
+for agent in (receipt_agent, stock_agent):
+    agent.product_normalizer.use_catalog(analyzer.catalog)
+
+chat_store = ChatStore(receipt_agent.db_config)
+
+upload_gc = UploadGarbageCollector(image_store, receipt_agent.db_config)
+
+# Expiry index: per-user range lookups plus a heap of upcoming expirations on the scheduler leader
+expiry_index = ExpiryIndex(receipt_agent.db_config)
+expiry_index.subscribe(lambda event: logger.info(
+    f"Expiry event: user {event['user_id']} {event['source']} item '{event['name']}' expires {event['expires_at']:%Y-%m-%d}"))
+
+restock_forecaster = RestockForecaster(receipt_agent.db_config)
+digest_pipeline = DigestPipeline(receipt_agent.db_config, receipt_agent.inventory_ledger,
+                                 expiry_index, restock_forecaster)
+
+_kb_cache_seen = {'hit': 0, 'miss': 0}
+
+
+def refresh_metrics():
+    """Set this worker's state gauges: pool occupancy, in-memory indexes, cache counters, outbox depth."""
+    metrics.POOL_SIZE.labels('mysql').set(db_pool.pool_size)
+    # mysql.connector keeps idle pooled connections in a queue; it has no public accessor
+    metrics.POOL_IN_USE.labels('mysql').set(db_pool.pool_size - db_pool._cnx_queue.qsize())
+    smtp_pool = EmailSender().pool
+    smtp_stats = smtp_pool.stats()
+    metrics.POOL_SIZE.labels('smtp').set(smtp_pool.size)
+    metrics.POOL_IN_USE.labels('smtp').set(smtp_stats['open'] - smtp_stats['idle'])
+    index_stats = analyzer.index_stats()
+    metrics.FAISS_USERS.set(index_stats['users'])
+    metrics.FAISS_VECTORS.set(index_stats['vectors'])
+    kb_cache = GroceryAnalyzer.fetch_knowledge_base.cache_info()
+    for result, total in (('hit', kb_cache.hits), ('miss', kb_cache.misses)):
+        metrics.CACHE_LOOKUPS.labels('knowledge_base', result).inc(total - _kb_cache_seen[result])
+        _kb_cache_seen[result] = total
+    for status, count in db_manager.outbox.depth().items():
+        metrics.OUTBOX_DEPTH.labels(status).set(count)
+
+
+metrics.add_refresher(refresh_metrics)
+
+# Scheduled jobs run once across all workers and nodes, on the elected scheduler leader
+jobs.bind(upload_gc=upload_gc, expiry_index=expiry_index, inventory_ledger=receipt_agent.inventory_ledger,
+          restock_forecaster=restock_forecaster, digest_pipeline=digest_pipeline)
+# Remove uploaded images that no receipt/stock row references
+scheduler.start(func='jobs:upload_gc', id='upload_gc', trigger='interval',
+                hours=STORAGE_CONFIG.get('gc', {}).get('interval_hours', 6))
+# (Re)load the expiry heap as soon as this process leads, then periodically to pick up new uploads
+scheduler.start(func='jobs:expiry_reload', id='expiry_reload', trigger='interval',
+                minutes=EXPIRY_CONFIG.get('reload_minutes', 30), run_on_election=True)
+scheduler.start(func='jobs:expiry_poll', id='expiry_poll', trigger='interval',
+                minutes=EXPIRY_CONFIG.get('poll_minutes', 15))
+# Nightly rebuild of the inventory ledger from receipts and stock, repairing any drift
+scheduler.start(func='jobs:inventory_reconcile', id='inventory_reconcile', trigger='cron',
+                hour=INVENTORY_CONFIG.get('reconcile_hour', 3))
+# Nightly batched restock forecast for every user; requests only read the results table
+scheduler.start(func='jobs:restock_forecast', id='restock_forecast', trigger='cron',
+                hour=FORECAST_CONFIG.get('run_hour', 2))
+# Daily summary email for every user, after the nightly reconcile and forecast jobs
+scheduler.start(func='jobs:daily_digest', id='daily_digest', trigger='cron',
+                hour=DIGEST_CONFIG.get('hour', 7), minute=DIGEST_CONFIG.get('minute', 0))
+# Elect a leader only now, so it never prunes jobs that are still being registered
+scheduler.run()
 
 
 # Form for receipt upload
@@ -197,16 +292,14 @@ def signup():
                 vegan=form.vegan.data,
                 gluten_free=form.gluten_free.data,
                 allergies=form.allergies.data,
-                extra_info=form.extra_info.data
+                extra_info=form.extra_info.data,
+                welcome_email=EmailSender.welcome_email(form.username.data or 'user', form.email.data)
             )
 
             # Set session
             session['user_id'] = user_id
             session['username'] = form.username.data
             session['email'] = form.email.data
-            email_sender.send_welcome_email(recipient_email=session['email'],
-                                            username = session['username'] or 'user',
-                                            email = session['email'])
 
             # HTMX response
             if request.headers.get('HX-Request'):
@@ -283,9 +376,12 @@ def login():
                 session['allergies'] = user_details['allergies']
                 
                 logger.info("User logged in successfully")
-                email_sender.send_email(recipient_email=session['email'],
-                                        subject="Login Notification",
-                                        body=f"User {session['username']} logged in at {arrow.now().format('YYYY-MM-DD HH:mm:ss')}")
+                try:
+                    db_manager.outbox.enqueue_now(recipient=session['email'],
+                                                  subject="Login Notification",
+                                                  body=f"User {session['username']} logged in at {arrow.now().format('YYYY-MM-DD HH:mm:ss')}")
+                except RuntimeError as e:
+                    logger.error(f"Could not queue login notification: {e}")
                 if request.headers.get('HX-Request'):
                     response = make_response('<div class="text-green-500 font-semibold">Login successful! Redirecting...</div>')
                     response.headers['HX-Redirect'] = url_for('dashboard')
@@ -344,27 +440,22 @@ def dashboard():
         categories[item['category']] += float(item['price'])
     top_category = max(categories.items(), key=lambda x: x[1], default=('None', 0))[0] if categories else 'None'
     
-    # Expiring and low stock
-    expiring_soon = []
-    low_stock = []
-    seven_days_from_now = (datetime.now() + timedelta(days=7)).date()
-    for item in all_receipt_items:
-        if item['expiration_date']:
-            try:
-                exp_date = datetime.strptime(item['expiration_date'], '%Y-%m-%d').date()
-                if exp_date < seven_days_from_now:
-                    expiring_soon.append({
-                        'name': item['name'],
-                        'quantity': item['quantity'],
-                        'expiration_date': item['expiration_date']
-                    })
-            except ValueError:
-                pass
-        if item['quantity'] <= 2:
-            low_stock.append({
-                'name': item['name'],
-                'quantity': item['quantity']
-            })
+    # Expiring soon is an index range lookup; low stock comes from the inventory ledger
+    try:
+        expiring_soon = expiry_index.expiring_within(user_id, days=EXPIRY_CONFIG.get('dashboard_days', 7))
+    except RuntimeError as e:
+        logger.error(f"Expiring items lookup failed: {e}")
+        expiring_soon = []
+    try:
+        low_stock = receipt_agent.inventory_ledger.low_stock(user_id)
+    except RuntimeError as e:
+        logger.error(f"Low stock lookup failed: {e}")
+        low_stock = []
+    try:
+        restock_soon = restock_forecaster.restock_soon(user_id)
+    except RuntimeError as e:
+        logger.error(f"Restock forecast lookup failed: {e}")
+        restock_soon = []
     
     # Advanced analytics
     try:
@@ -391,19 +482,28 @@ def dashboard():
         """, (user_id,))
         receipts_by_month = [{'month': r['month'], 'count': r['count']} for r in cursor.fetchall()]
         
-        # Category diversity and most purchased
+        # Category diversity and most purchased (grouped on the canonical product id)
         cursor.execute("""
-            SELECT COUNT(DISTINCT category) as diversity,
-                   name, COUNT(*) as count
+            SELECT COUNT(DISTINCT category) as diversity
             FROM receipts
             WHERE user_id = %s
-            GROUP BY name
-            ORDER BY count DESC
-            LIMIT 1
         """, (user_id,))
         category_info = cursor.fetchone()
         category_diversity = category_info['diversity'] if category_info else 0
-        most_purchased = category_info['name'] if category_info else 'None'
+        cursor.execute("""
+            SELECT p.display_name as name, top.count
+            FROM (
+                SELECT product_id, COUNT(*) as count
+                FROM receipts
+                WHERE user_id = %s AND product_id IS NOT NULL
+                GROUP BY product_id
+                ORDER BY count DESC
+                LIMIT 1
+            ) top
+            JOIN products p ON p.id = top.product_id
+        """, (user_id,))
+        top_product = cursor.fetchone()
+        most_purchased = top_product['name'] if top_product else 'None'
         
         # Vegetarian items
         vegetarian_count = 0
@@ -427,18 +527,6 @@ def dashboard():
         cursor.close()
         conn.close()
 
-        #send grocery summary
-        if not scheduler:
-            logger.info('scheduler doeesnt exist reinitializing')
-            scheduler.start(func = lambda :email_sender.send_grocery_summary(app_context, session['email'], 
-                                                                             low_stock, 
-                                                                             expiring_soon),
-                                                                             id ='grocery_summary',
-                                                                             replace_existing = False,
-                                                                              misfire_grace_time=60,  # Grace period before marking a missed execution
-                                                                            max_instances=1,  
-                                                                            next_run_time=None)
-        
     except mysql.connector.Error as e:
         logger.error(f"Database error: {e}")
         monthly_spending = []
@@ -467,6 +555,7 @@ def dashboard():
         top_category=top_category,
         expiring_soon=expiring_soon,
         low_stock=low_stock,
+        restock_soon=restock_soon,
         monthly_spending=monthly_spending,
         receipts_by_month=receipts_by_month,  # Added
         category_diversity=category_diversity,
@@ -517,17 +606,17 @@ def upload_receipt():
         # Generate unique filename and save file
         unique_filename = f"{uuid.uuid4().hex}{file_ext}"
         print(f"unique_filename : {unique_filename}")
-        temp_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-        print(f"temp_path : {temp_path} ")
-        os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-        file.save(temp_path)
-        logger.debug(f"Saved file: {temp_path}, exists: {os.path.exists(temp_path)}")
+        image_key = image_store.save_upload(file, unique_filename)
+        logger.debug("Saved file: %s", image_key)
         
         try:
             # Process receipt and save data
-            receipt_items = receipt_agent.process_receipt(temp_path)
+            with image_store.local_original(unique_filename) as temp_path:
+                receipt_items = receipt_agent.process_receipt(temp_path)
             receipt_id = receipt_agent.save_data(receipt_items, user_id)
             receipt_agent.save_image(unique_filename, user_id, receipt_id)
+            image_store.generate_variants_async(unique_filename)
+            expiry_index.refresh_user(user_id)
             
             # Update session
             session['last_receipt_id'] = receipt_id
@@ -542,8 +631,7 @@ def upload_receipt():
         except (ValueError, IOError,Exception) as e:
             flash(f"Error processing receipt. Check if receipt is not empty or valid groceries. Please try again!", 'danger')
             logger.error(f"Error processing receipt: {str(e)}")
-            if os.path.exists(temp_path):
-                os.remove(temp_path)  # Clean up temporary file
+            image_store.delete(unique_filename)  # Clean up temporary file
             return render_template('receipt.html', filename=display_filename, receipt_items=receipt_items,form=form,delete_form = drf)
         
     return render_template('receipt.html', form=form, filename=display_filename, receipt_items=receipt_items,delete_form = drf)
@@ -616,7 +704,9 @@ def delete_receipt(receipt_id):
     
     user_id = session['user_id']
     try:
+        image_paths = receipt_agent.get_image_paths(user_id, receipt_id)
         receipt_agent.delete_receipt(receipt_id, user_id)
+        image_store.delete_many(image_paths)
         flash('Receipt deleted successfully.', 'success')
         if request.headers.get('HX-Request'):
             return '<div hx-swap-oob="true" id="receipts-table"></div>'
@@ -640,7 +730,9 @@ def delete_receipt_page():
         return redirect(url_for('dashboard'))
 
     try:
+        image_paths = receipt_agent.get_image_paths(user_id, receipt_id)
         receipt_agent.delete_receipt(receipt_id, user_id)
+        image_store.delete_many(image_paths)
         session.pop('last_receipt_id', None)
         session.pop('receipt_items', None)
         session.pop('last_receipt_file', None)
@@ -666,7 +758,9 @@ def reset_receipts():
         return redirect(url_for('dashboard'))
     
     try:
+        image_paths = receipt_agent.get_image_paths(user_id)
         receipt_agent.delete_all_receipt_items(user_id)
+        image_store.delete_many(image_paths)
         session.pop('all_receipt_items', None)
         session.pop('last_receipt_id', None)
         session.pop('receipt_items', None)
@@ -888,22 +982,10 @@ def dashboard_chat():
             {html_response}
         </div>
         '''
-        timestamp = arrow.now().format('MMM D, HH:mm')
-        
         # Append to chat history
-        if 'chat_history' not in session:
-            session['chat_history'] = []
-        session['chat_history'].append({
-            'text': query,
-            'is_user': True,
-            'timestamp': timestamp
-        })
-        session['chat_history'].append({
-            'text': styled_response,
-            'is_user': False,
-            'timestamp': timestamp
-        })
-        session.modified = True
+        conversation_id = current_conversation_id(user_id)
+        chat_store.append(user_id, conversation_id, query, is_user=True)
+        timestamp = chat_store.append(user_id, conversation_id, styled_response, is_user=False)['timestamp']
         
         return jsonify({'response': styled_response, 'timestamp': timestamp})
     except Exception as e:
@@ -917,8 +999,37 @@ def serve_image(filename):
     if not user_id:
         flash('Please log in to access the receipts page.', 'danger')
         return redirect(url_for('login_page'))
-    logger.info(f"Serving image: {filename}")
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    variant = request.args.get('size')
+    try:
+        key, served_variant = image_store.locate(filename, variant)
+    except ValueError:
+        abort(404)
+    if not key:
+        abort(404)
+    logger.info(f"Serving image: {filename} ({served_variant})")
+
+    presigned_url = blob_store.presigned_url(key)
+    if presigned_url:
+        # Object storage serves the bytes; only the short-lived redirect goes through us
+        response = redirect(presigned_url)
+        response.headers['Cache-Control'] = 'private, max-age=60'
+        return response
+
+    # Upload filenames are uuids and never rewritten, so name + variant identifies the bytes
+    etag = f"{os.path.splitext(filename)[0]}-{served_variant}"
+    path = blob_store.local_path(key)
+    if path:
+        response = send_file(path, etag=etag, conditional=True, max_age=IMAGE_CACHE_MAX_AGE)
+    else:
+        mimetype = 'image/jpeg' if served_variant != 'original' else None
+        response = send_file(blob_store.open_stream(key), mimetype=mimetype, download_name=key.rsplit('/', 1)[-1],
+                             etag=etag, conditional=True, max_age=IMAGE_CACHE_MAX_AGE)
+    if variant and served_variant != variant:
+        # Variant still rendering: don't let the browser pin the original to this URL
+        response.headers['Cache-Control'] = 'private, no-cache'
+    else:
+        response.headers['Cache-Control'] = f"private, max-age={IMAGE_CACHE_MAX_AGE}, immutable"
+    return response
 
 
 @app.route('/logout')
@@ -941,13 +1052,13 @@ def stock():
     dsf = DeleteStockForm()
     filename = stock_agent.get_latest_filename(user_id)  # Add for image display
     print(f"Filename: {filename}")
-    logger.debug(f"Stock: Rendering stock.html with filename={filename}")
+    logger.debug("Stock: Rendering stock.html with filename=%s", filename)
     return render_template('stock.html', stock_items=stock_items, form=form, dsf=dsf, filename=filename)
 
 @app.route('/upload/stock', methods=['GET', 'POST'])
 def upload_stock():
     user_id = session.get('user_id')
-    logger.debug(f"Stock: Received request for upload_stock, user_id={user_id}")
+    logger.debug("Stock: Received request for upload_stock, user_id=%s", user_id)
     stock_id = session.get('last_stock_id')
     print(f"Stock ID: {stock_id}")
 
@@ -975,19 +1086,16 @@ def upload_stock():
             # Generate unique filename
             unique_filename = f"{uuid.uuid4().hex}{file_ext}"
             print(f"unique_filename : {unique_filename}")
-            temp_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-            print(f"temp_path : {temp_path}")
-            os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-            file.save(temp_path)
-            
-            
-            logger.debug(f"Saved file: {temp_path}, exists: {os.path.exists(temp_path)}")
+            image_key = image_store.save_upload(file, unique_filename)
+            logger.debug("Saved file: %s", image_key)
 
             try:
-                 
-                stock_items = stock_agent.process_stock_image(temp_path) # process with long path
+                with image_store.local_original(unique_filename) as temp_path:
+                    stock_items = stock_agent.process_stock_image(temp_path) # process with long path
                 logger.info(f"processed {unique_filename} stock successfully")
                 stock_id = stock_agent.save_to_db(stock_items,user_id,unique_filename) #save to db with unique_filenmame
+                image_store.generate_variants_async(unique_filename)
+                expiry_index.refresh_user(user_id)
                 
                 session['last_stock_id'] = stock_id
                 session['lastest_stock_file'] = unique_filename #save unique file name to session
@@ -1009,7 +1117,7 @@ def upload_stock():
             flash('Invalid form submission')
     
     filename = session['lastest_stock_file'] or stock_agent.get_latest_filename(user_id)
-    logger.debug(f"GET: Rendering stock.html with filename={filename}")
+    logger.debug("GET: Rendering stock.html with filename=%s", filename)
     return render_template('stock.html', form=form, dsf=dsf, stock_items=stock_items, filename=unique_filename)
 
 #delete stock
@@ -1023,7 +1131,9 @@ def delete_stock():
         try:
             if dsf.validate_on_submit():
                     # Perform stock deletion logic
+                    image_paths = stock_agent.get_image_paths(user_id)
                     stock_agent.delete_all_stock(user_id)
+                    image_store.delete_many(image_paths)
                    
                     flash('All stock items deleted successfully!', 'success')
             else:
@@ -1037,6 +1147,15 @@ def delete_stock():
         return redirect(url_for('stock',dsf = dsf))
 
 
+def current_conversation_id(user_id):
+    """Conversation shown in the chat page: the session's, else the user's latest, else a new one."""
+    conversation_id = session.get('conversation_id')
+    if not conversation_id:
+        conversation_id = chat_store.latest_conversation(user_id) or ChatStore.new_conversation_id()
+        session['conversation_id'] = conversation_id
+    return conversation_id
+
+
 #chat_lock = Lock()
 @app.route('/chat', methods=['GET', 'POST'])
 def chat_page():
@@ -1047,26 +1166,26 @@ def chat_page():
             flash('Please login first', 'danger')
             return redirect(url_for('login_page'))
         
-        logger.debug(f"Session data: {session}")
         form = ChatForm(request.form)
-        chat_history = session.get('chat_history', [])
-        logger.debug(f"Chat history: {len(chat_history)} messages")
+        user_id = session['user_id']
+        conversation_id = current_conversation_id(user_id)
         
         if request.method == 'GET':
             logger.debug("Handling GET request")
+            chat_history = chat_store.fetch_messages(user_id, conversation_id, limit=CHAT_PAGE_SIZE)
+            logger.debug("Chat history: %s messages", len(chat_history))
             return render_template('chat.html', form=form, messages=chat_history)
         
         logger.debug("Handling POST request")
         if not form.validate():
-            logger.debug(f"Form validation failed: {form.errors}")
+            logger.debug("Form validation failed: %s", form.errors)
             if request.headers.get('HX-Request'):
                 return render_template('chat_errors.html', errors=form.errors)
             flash('Invalid message format', 'danger')
             return redirect(url_for('chat_page'))
         
-        user_id = session['user_id']
         query = form.query.data.strip()
-        logger.debug(f"User ID: {user_id}, Query: {query}")
+        logger.debug("User ID: %s, Query: %s", user_id, query)
         
         if not query or len(query) > 500:
             logger.debug("Query length validation failed")
@@ -1075,20 +1194,9 @@ def chat_page():
         
         try:
             logger.debug("Appending user message")
-            user_msg = {
-                'text': query,
-                'is_user': True,
-                'timestamp': arrow.now().format('MMM D, HH:mm'),
-                'status': 'delivered'
-            }
-            chat_history.append(user_msg)
-            if len(str(chat_history)) > 4000:
-                logger.warning("Chat history too large, truncating to 10 messages")
-                chat_history = chat_history[-10:]
-            else:
-                chat_history = chat_history[-20:]
-            session['chat_history'] = chat_history
-            session.modified = True
+            with span('memory'):
+                memory = chat_store.build_memory(user_id, conversation_id)
+            user_msg = chat_store.append(user_id, conversation_id, query, is_user=True)
             logger.debug("User message stored")
         except Exception as e:
             logger.error(f"Failed to store user message: {e}", exc_info=True)
@@ -1096,7 +1204,7 @@ def chat_page():
             return redirect(url_for('chat_page'))
         
         try:
-            logger.debug(f"Processing AI response for user {user_id}")
+            logger.debug("Processing AI response for user %s", user_id)
             logger.debug("Fetching knowledge base")
             try:
                 analyzer.fetch_knowledge_base(user_id)
@@ -1108,44 +1216,35 @@ def chat_page():
             logger.debug("Retrieving context")
             try:
                 context = analyzer.retrieve_context(user_id, query)
-                logger.debug(f"Context: {context}")
+                logger.debug("Context: %s", context)
             except Exception as e:
                 logger.error(f"Failed to retrieve context: {e}", exc_info=True)
                 context = []
             
             logger.debug("Generating AI response")
             try:
-                ai_response = analyzer.generate_response(user_id, query, context)
-                logger.debug(f"AI response: {ai_response}")
+                ai_response = analyzer.generate_response(user_id, query, context, memory=memory)
+                logger.debug("AI response: %s", ai_response)
             except Exception as e:
                 logger.error(f"Failed to generate AI response: {e}", exc_info=True)
                 flash("Error generating AI response", 'danger')
                 return redirect(url_for('chat_page'))
             
-            ai_msg = {
-                'text': ai_response,
-                'is_user': False,
-                'timestamp': arrow.now().format('MMM D, HH:mm'),
-                'status': 'delivered'
-            }
-            chat_history.append(ai_msg)
-            session['chat_history'] = chat_history[-20:]
-            session.modified = True
+            ai_msg = chat_store.append(user_id, conversation_id, ai_response, is_user=False)
             logger.debug("AI message stored")
             
             if request.headers.get('HX-Request'):
                 logger.debug("Rendering HTMX response")
                 new_messages = [user_msg, ai_msg]
-                return render_template('chat_messages.html', messages=new_messages)
+                with span('render'):
+                    return render_template('chat_messages.html', messages=new_messages)
             
             logger.debug("Redirecting to chat page")
             return redirect(url_for('chat_page'))
             
         except Exception as e:
             logger.error(f"Error in AI processing: {e}", exc_info=True)
-            chat_history[-1]['status'] = 'error'
-            session['chat_history'] = chat_history[-20:]
-            session.modified = True
+            chat_store.set_status(user_id, conversation_id, user_msg['seq'], 'error')
             if request.headers.get('HX-Request'):
                 return render_template('chat_errors.html', error=str(e))
             flash("An error occurred while processing your request", 'danger')
@@ -1162,8 +1261,8 @@ def clear_chat():
     try:
         form = DeleteChatForm(request.form)
         if form.validate():
-            session['chat_history'] = []
-            session.modified = True
+            # History stays in the database; the chat page just moves to a fresh conversation
+            session['conversation_id'] = ChatStore.new_conversation_id()
             logger.debug("Chat history cleared")
             if request.headers.get('HX-Request'):
                 return render_template('chat_messages.html', messages=[])
@@ -1178,11 +1277,23 @@ def clear_chat():
         return redirect(url_for('chat_page'))
 
 
+def render_chat_window():
+    """Render one keyset page of the current conversation (``?before=<seq>&limit=<n>``)."""
+    user_id = session['user_id']
+    before = request.args.get('before', type=int)
+    limit = min(request.args.get('limit', CHAT_PAGE_SIZE, type=int), 100)
+    messages = chat_store.fetch_messages(user_id, current_conversation_id(user_id), before_seq=before, limit=limit)
+    older_cursor = messages[0]['seq'] if len(messages) == limit else None
+    return render_template('chat_messages.html', messages=messages, older_cursor=older_cursor)
+
+
 @app.route('/chat/history')
 def chat_history():
     """Render chat history."""
+    if 'user_id' not in session:
+        return redirect(url_for('login_page'))
     try:
-        return render_template('chat_messages.html', messages=session.get('chat_history', []))
+        return render_chat_window()
     except Exception as e:
         logger.error(f"Error in chat_history for user {session.get('user_id', 'unknown')}: {e}", exc_info=True)
         flash("Error loading chat history.", 'danger')
@@ -1190,8 +1301,9 @@ def chat_history():
     
 @app.route('/chat/messages')
 def chat_messages():
-    return render_template('chat_messages.html',
-                         messages=session.get('chat_history', []))
+    if 'user_id' not in session:
+        return redirect(url_for('login_page'))
+    return render_chat_window()
 
 @app.route('/chat/update')
 def chat_update():
@@ -1199,5 +1311,45 @@ def chat_update():
         'HX-Trigger': 'chatUpdate'
     }
 
+def is_admin():
+    admins = {email.strip().lower() for email in os.getenv('ADMIN_EMAILS', '').split(',') if email.strip()}
+    return session.get('email', '').lower() in admins
+
+# Admins can profile any request with ?__profile=1 (collapsed stacks), =cprofile or =pyinstrument
+profiler.init_app(app, authorize=is_admin)
+
+@app.route('/admin/profile')
+def admin_profile():
+    """Sample every thread of this worker for ``?seconds=`` (default 10) and return collapsed stacks."""
+    if not is_admin():
+        abort(403)
+    seconds = request.args.get('seconds', 10, type=float)
+    sampler = profiler.profile_window(seconds, profiler.endpoint_hz(None, request.args.get('hz', type=float)))
+    if sampler is None:
+        return jsonify({'error': 'Another profile is running in this worker'}), 409
+    response = Response(sampler.collapsed(), content_type=profiler.COLLAPSED_MIMETYPE)
+    response.headers.update(sampler.headers())
+    return response
+
+@app.route('/metrics')
+def metrics_endpoint():
+    # Scrapers authenticate with METRICS_TOKEN as a bearer token; admins can also look from the browser
+    token = os.getenv('METRICS_TOKEN')
+    authorized = bool(token) and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+    if not authorized and not is_admin():
+        abort(403)
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
+
+@app.route('/admin/jobs')
+def admin_jobs():
+    if not is_admin():
+        abort(403)
+    try:
+        return jsonify(scheduler.status())
+    except RuntimeError as e:
+        logger.error(f"Error reading job status: {e}")
+        return jsonify({'error': 'Job status unavailable'}), 500
+
 if __name__ == '__main__':
     app.run(debug=True,port=5000)
\ No newline at end of file
@@ -0,0 +1,63 @@
+"""Fill ``stock.expires_at`` for rows stored before the column existed.
+
+Each row gets ``created_at + shelf_life`` days. Rows are updated in id order,
+one bounded batch per transaction, so the backfill never holds long locks on
+the stock table. Run once after deploying the expiry index.
+
+Usage:
+    python scripts/backfill_expires_at.py --batch-size 5000
+"""
+import os
+import sys
+import argparse
+
+import mysql.connector
+
+current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if current_dir not in sys.path:
+    sys.path.insert(0, current_dir)
+
+from agents.grocery_agent import DB_CONFIG
+from agents.expiry_index import STOCK_TABLE
+from loggers.custom_logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def backfill(batch_size):
+    conn = mysql.connector.connect(**DB_CONFIG)
+    cursor = conn.cursor()
+    last_id, updated = 0, 0
+    try:
+        while True:
+            cursor.execute(
+                f"SELECT id FROM {STOCK_TABLE} WHERE expires_at IS NULL AND id > %s ORDER BY id LIMIT %s",
+                (last_id, batch_size)
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+            if not ids:
+                break
+            cursor.execute(
+                f"UPDATE {STOCK_TABLE} SET expires_at = created_at + INTERVAL shelf_life DAY "
+                f"WHERE id IN ({', '.join(['%s'] * len(ids))}) AND expires_at IS NULL",
+                ids
+            )
+            conn.commit()
+            updated += cursor.rowcount
+            last_id = ids[-1]
+            logger.info(f"Backfilled expires_at for {updated} {STOCK_TABLE} rows (last id {last_id})")
+    finally:
+        cursor.close()
+        conn.close()
+    return updated
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--batch-size', type=int, default=5000)
+    args = parser.parse_args(argv)
+    print(f"{STOCK_TABLE}: {backfill(args.batch_size)} rows updated")
+
+
+if __name__ == '__main__':
+    main()
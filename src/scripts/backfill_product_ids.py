@@ -0,0 +1,71 @@
+"""Assign canonical product ids to receipt and stock rows ingested before product normalisation.
+
+Rows with a NULL ``product_id`` are read in id order (keyset pagination), resolved
+through the same ProductNormalizer used at ingest, and updated in one statement
+per batch.
+
+Usage:
+    python scripts/backfill_product_ids.py --batch-size 1000
+"""
+import os
+import sys
+import argparse
+
+import mysql.connector
+
+current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if current_dir not in sys.path:
+    sys.path.insert(0, current_dir)
+
+from agents.grocery_agent import DB_CONFIG, RECEIPTS_TABLE
+from agents.stock_agent import STOCK_TABLE
+from agents.product_normalizer import ProductNormalizer
+from loggers.custom_logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def backfill_table(normalizer, table, batch_size):
+    conn = mysql.connector.connect(**DB_CONFIG)
+    cursor = conn.cursor(dictionary=True)
+    last_id, updated = 0, 0
+    try:
+        while True:
+            cursor.execute(
+                f"SELECT id, name, category FROM {table} WHERE product_id IS NULL AND id > %s ORDER BY id LIMIT %s",
+                (last_id, batch_size)
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            product_ids = normalizer.resolve(rows)
+            cases = " ".join(["WHEN %s THEN %s"] * len(rows))
+            params = [value for row, product_id in zip(rows, product_ids) for value in (row['id'], product_id)]
+            ids = [row['id'] for row in rows]
+            cursor.execute(
+                f"UPDATE {table} SET product_id = CASE id {cases} END WHERE id IN ({', '.join(['%s'] * len(ids))})",
+                params + ids
+            )
+            conn.commit()
+            updated += len(rows)
+            last_id = rows[-1]['id']
+            logger.info(f"Backfilled {updated} {table} rows (last id {last_id})")
+    finally:
+        cursor.close()
+        conn.close()
+    return updated
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    normalizer = ProductNormalizer(DB_CONFIG)
+    for table in (RECEIPTS_TABLE, STOCK_TABLE):
+        normalizer.ensure_product_column(table)
+        print(f"{table}: {backfill_table(normalizer, table, args.batch_size)} rows updated")
+
+
+if __name__ == '__main__':
+    main()
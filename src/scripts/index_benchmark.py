@@ -0,0 +1,105 @@
+"""Benchmark recall@k and query latency of each FAISS index type on synthetic grocery corpora.
+
+Corpora are generated from grocery name templates ("Organic Whole Milk 1L").
+By default they are embedded with random clustered vectors, where each name
+family shares a centre, so large sizes stay fast. ``--encode`` embeds the
+names with the app's MiniLM model instead. Ground truth comes from exact Flat
+search.
+
+Usage:
+    python scripts/index_benchmark.py --sizes 1000 20000 100000 --k 10
+    python scripts/index_benchmark.py --sizes 5000 --encode --types flat hnsw
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+import numpy as np
+
+current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if current_dir not in sys.path:
+    sys.path.insert(0, current_dir)
+
+from agents.index_factory import IndexFactory, INDEX_TYPES
+
+BRANDS = ['Organic', 'Farm Fresh', 'Value', 'Premium', 'Store Brand', 'Local', 'Family Size']
+PRODUCTS = ['Whole Milk', 'Skim Milk', 'Greek Yogurt', 'Cheddar Cheese', 'Butter', 'Eggs', 'Bananas',
+            'Apples', 'Spinach', 'Carrots', 'Chicken Breast', 'Ground Beef', 'Salmon', 'Rice', 'Pasta',
+            'Bread', 'Oats', 'Orange Juice', 'Coffee', 'Tomatoes', 'Onions', 'Potatoes', 'Peanut Butter']
+SIZES = ['1L', '2L', '500g', '1kg', '6 pack', '12 pack', '250ml', 'Large', 'Small']
+
+
+def synthetic_names(n, seed):
+    rng = random.Random(seed)
+    return [f"{rng.choice(BRANDS)} {rng.choice(PRODUCTS)} {rng.choice(SIZES)}" for _ in range(n)]
+
+
+def synthetic_vectors(names, dim, seed):
+    """Clustered vectors: one centre per product family, plus per-name noise."""
+    rng = np.random.default_rng(seed)
+    centres = {product: rng.standard_normal(dim).astype(np.float32) for product in PRODUCTS}
+    vectors = np.empty((len(names), dim), dtype=np.float32)
+    for i, name in enumerate(names):
+        family = next(p for p in PRODUCTS if p in name)
+        vectors[i] = centres[family] + 0.6 * rng.standard_normal(dim).astype(np.float32)
+    return vectors
+
+
+def recall_at_k(truth, found, k):
+    hits = sum(len(set(t[:k]) & set(f[:k])) for t, f in zip(truth, found))
+    return hits / (len(truth) * k)
+
+
+def benchmark(factory, corpus, queries, kinds, k):
+    exact = factory.build(corpus, 'flat')
+    _, truth = exact.search(queries, k)
+    rows = []
+    for kind in kinds:
+        started = time.perf_counter()
+        index = factory.build(corpus, kind)
+        build_s = time.perf_counter() - started
+        started = time.perf_counter()
+        _, found = index.search(queries, k)
+        per_query_ms = (time.perf_counter() - started) * 1000 / len(queries)
+        rows.append((kind, recall_at_k(truth, found, k), per_query_ms, build_s))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 20000, 100000])
+    parser.add_argument('--types', nargs='+', choices=INDEX_TYPES, default=list(INDEX_TYPES))
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--dim', type=int, default=384)
+    parser.add_argument('--metric', choices=['cosine', 'l2'], default='cosine')
+    parser.add_argument('--encode', action='store_true', help='Embed names with all-MiniLM-L6-v2 instead of synthetic vectors')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args(argv)
+
+    embedder = None
+    if args.encode:
+        from sentence_transformers import SentenceTransformer
+        embedder = SentenceTransformer('all-MiniLM-L6-v2', device='cpu')
+        args.dim = embedder.get_sentence_embedding_dimension()
+    factory = IndexFactory(args.dim, metric=args.metric)
+
+    print(f"{'size':>8} {'index':>6} {'auto':>5} {'recall@' + str(args.k):>10} {'ms/query':>9} {'build s':>8}")
+    for size in args.sizes:
+        names = synthetic_names(size + args.queries, args.seed)
+        if embedder:
+            vectors = embedder.encode(names, batch_size=256, show_progress_bar=False)
+        else:
+            vectors = synthetic_vectors(names, args.dim, args.seed)
+        vectors = factory.prepare(vectors)
+        corpus, queries = vectors[:size], vectors[size:]
+        chosen = factory.choose(size)
+        for kind, recall, latency, build_s in benchmark(factory, corpus, queries, args.types, args.k):
+            marker = '*' if kind == chosen else ''
+            print(f"{size:>8} {kind:>6} {marker:>5} {recall:>10.3f} {latency:>9.3f} {build_s:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
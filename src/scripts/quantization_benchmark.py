@@ -0,0 +1,73 @@
+"""Accuracy-regression benchmark for compact embedding storage (float16, int8, PQ).
+
+For each precision a Flat index is built over a synthetic grocery corpus and
+compared against exact float32 search. The script reports recall@k, bytes per
+vector and memory per cached user. It exits non-zero if any precision falls
+below ``--min-recall``, so it can gate a change to ``deepseek.index.precision``.
+
+Usage:
+    python scripts/quantization_benchmark.py --size 20000 --k 10 --min-recall 0.9
+    python scripts/quantization_benchmark.py --encode --size 5000 --items-per-user 300
+"""
+import os
+import sys
+import time
+import argparse
+
+current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if current_dir not in sys.path:
+    sys.path.insert(0, current_dir)
+
+from agents.index_factory import IndexFactory, PRECISIONS, index_bytes
+from scripts.index_benchmark import synthetic_names, synthetic_vectors, recall_at_k
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=int, default=20000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--dim', type=int, default=384)
+    parser.add_argument('--precisions', nargs='+', choices=PRECISIONS, default=list(PRECISIONS))
+    parser.add_argument('--items-per-user', type=int, default=500, help='Knowledge items in a typical cached user index')
+    parser.add_argument('--min-recall', type=float, default=0.0)
+    parser.add_argument('--encode', action='store_true', help='Embed names with all-MiniLM-L6-v2 instead of synthetic vectors')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args(argv)
+
+    names = synthetic_names(args.size + args.queries, args.seed)
+    if args.encode:
+        from sentence_transformers import SentenceTransformer
+        embedder = SentenceTransformer('all-MiniLM-L6-v2', device='cpu')
+        args.dim = embedder.get_sentence_embedding_dimension()
+        vectors = embedder.encode(names, batch_size=256, show_progress_bar=False)
+    else:
+        vectors = synthetic_vectors(names, args.dim, args.seed)
+
+    exact = IndexFactory(args.dim, index_type='flat', precision='float32')
+    vectors = exact.prepare(vectors)
+    corpus, queries = vectors[:args.size], vectors[args.size:]
+    _, truth = exact.build(corpus).search(queries, args.k)
+
+    print(f"{'precision':>9} {'recall@' + str(args.k):>10} {'B/vector':>9} {'KiB/user':>9} {'ms/query':>9}")
+    failed = []
+    for precision in args.precisions:
+        factory = IndexFactory(args.dim, index_type='flat', precision=precision)
+        index = factory.build(corpus)
+        started = time.perf_counter()
+        _, found = index.search(queries, args.k)
+        latency = (time.perf_counter() - started) * 1000 / len(queries)
+        recall = recall_at_k(truth, found, args.k)
+        user_index = factory.build(corpus[:args.items_per_user])
+        print(f"{precision:>9} {recall:>10.3f} {index_bytes(index) / args.size:>9.1f} "
+              f"{index_bytes(user_index) / 1024:>9.1f} {latency:>9.3f}")
+        if recall < args.min_recall:
+            failed.append(precision)
+
+    if failed:
+        print(f"Recall below {args.min_recall} for: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
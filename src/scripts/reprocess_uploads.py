@@ -0,0 +1,88 @@
+"""Re-run extraction parsing for every image in the uploads folder from the extraction cache.
+
+No Gemini calls are made: each image is hashed, its cached raw model text is
+looked up and re-validated with the current parser, and the refreshed parsed
+items are written back to the cache (and optionally to a JSON-lines file for
+re-ingestion).
+
+Usage:
+    python scripts/reprocess_uploads.py --kind receipt --workers 8 --output receipts.jsonl
+"""
+import os
+import sys
+import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if current_dir not in sys.path:
+    sys.path.insert(0, current_dir)
+
+from agents.extraction_cache import ExtractionCache, hash_image_file
+from agents.grocery_agent import parse_receipt_response, RECEIPT_PROMPT_VERSION, GEMINI_MODEL
+from agents.stock_agent import parse_stock_response, STOCK_PROMPT_VERSION
+
+IMAGE_EXTENSIONS = ('.png', '.jpeg', '.jpg')
+PARSERS = {
+    'receipt': (parse_receipt_response, RECEIPT_PROMPT_VERSION),
+    'stock': (parse_stock_response, STOCK_PROMPT_VERSION),
+}
+
+
+def iter_images(uploads_dir):
+    for root, _, files in os.walk(uploads_dir):
+        for name in sorted(files):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                yield os.path.join(root, name)
+
+
+def reprocess_image(image_path, kind, model_name):
+    """Worker: re-parse one image from cache. Returns (status, filename, items or error)."""
+    parser, prompt_version = PARSERS[kind]
+    cache = ExtractionCache()
+    image_hash = hash_image_file(image_path)
+    cached = cache.get(image_hash, model_name, prompt_version)
+    filename = os.path.basename(image_path)
+    if not cached:
+        return 'miss', filename, None
+    try:
+        items = parser(cached['raw_text'])
+    except Exception as e:
+        cache.update_parsed(image_hash, model_name, prompt_version, None)
+        return 'invalid', filename, str(e)
+    cache.update_parsed(image_hash, model_name, prompt_version, items)
+    return 'ok', filename, items
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--kind', choices=sorted(PARSERS), required=True, help='Which extraction prompt the images were processed with')
+    parser.add_argument('--uploads-dir', default=os.path.join(current_dir, 'uploads'))
+    parser.add_argument('--model', default=GEMINI_MODEL, help='Model name the cached entries were produced by')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--output', help='Write re-validated items as JSON lines to this file')
+    args = parser.parse_args(argv)
+
+    counts = {'ok': 0, 'miss': 0, 'invalid': 0}
+    output = open(args.output, 'w') if args.output else None
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            futures = [executor.submit(reprocess_image, path, args.kind, args.model)
+                       for path in iter_images(args.uploads_dir)]
+            for future in as_completed(futures):
+                status, filename, result = future.result()
+                counts[status] += 1
+                if status == 'invalid':
+                    print(f"{filename}: validation failed: {result}", file=sys.stderr)
+                elif status == 'ok' and output:
+                    output.write(json.dumps({'filename': filename, 'kind': args.kind, 'items': result}) + '\n')
+    finally:
+        if output:
+            output.close()
+
+    print(f"Reprocessed {counts['ok']} images from cache, {counts['invalid']} failed validation, {counts['miss']} not cached.")
+    return 0 if counts['invalid'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,37 @@
+"""Run the orphaned-upload garbage collector once from the command line.
+
+Usage:
+    python scripts/upload_gc.py --dry-run
+"""
+import os
+import sys
+import argparse
+
+current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if current_dir not in sys.path:
+    sys.path.insert(0, current_dir)
+
+from agents.grocery_agent import DB_CONFIG, config
+from storage.blob_store import build_blob_store
+from storage.image_store import ImageStore
+from storage.upload_gc import UploadGarbageCollector, GC_GRACE_HOURS, GC_BATCH_SIZE
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--dry-run', action='store_true', help='Report orphans without deleting them')
+    parser.add_argument('--grace-hours', type=float, default=GC_GRACE_HOURS)
+    parser.add_argument('--batch-size', type=int, default=GC_BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    blob_store = build_blob_store(config.get('storage', {}), os.path.join(current_dir, 'uploads'))
+    collector = UploadGarbageCollector(ImageStore(blob_store), DB_CONFIG, grace_hours=args.grace_hours,
+                                       batch_size=args.batch_size, dry_run=args.dry_run)
+    stats = collector.run()
+    for key, value in stats.items():
+        print(f"{key}: {value}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
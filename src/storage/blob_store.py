@@ -0,0 +1,228 @@
+import os
+import shutil
+import tempfile
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Optional, Iterator, Tuple, IO
+
+from loggers.custom_logger import get_logger
+
+logger = get_logger(__name__)
+
+COPY_CHUNK_SIZE = 1 << 20
+
+
+def _utc(moment: datetime) -> datetime:
+    """Normalise an aware timestamp to naive UTC so backends compare consistently."""
+    return moment.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+class BlobStore(ABC):
+    """Key/value storage for uploaded files.
+
+    Keys are ``/``-separated relative paths. Implementations stream data in and
+    out rather than loading whole files in memory.
+    """
+
+    @abstractmethod
+    def put_stream(self, key: str, stream: IO[bytes], content_type: Optional[str] = None) -> None:
+        ...
+
+    @abstractmethod
+    def open_stream(self, key: str) -> IO[bytes]:
+        """Open ``key`` for reading; raises FileNotFoundError if it does not exist."""
+        ...
+
+    @abstractmethod
+    def stat(self, key: str) -> Optional[Tuple[int, datetime]]:
+        """Return ``(size_bytes, last_modified_utc)`` or None if the key does not exist."""
+        ...
+
+    @abstractmethod
+    def delete(self, key: str) -> int:
+        """Delete ``key`` and return the number of bytes freed (0 if it did not exist)."""
+        ...
+
+    @abstractmethod
+    def iter_keys(self, prefix: str = '') -> Iterator[Tuple[str, int, datetime]]:
+        """Yield ``(key, size_bytes, last_modified_utc)`` for every key under ``prefix``."""
+        ...
+
+    def exists(self, key: str) -> bool:
+        return self.stat(key) is not None
+
+    def local_path(self, key: str) -> Optional[str]:
+        """Filesystem path of ``key`` when the backend is local, otherwise None."""
+        return None
+
+    def presigned_url(self, key: str) -> Optional[str]:
+        """Time-limited direct download URL, or None when the backend cannot provide one."""
+        return None
+
+    @contextmanager
+    def local_copy(self, key: str):
+        """Yield a local filesystem path holding the contents of ``key``."""
+        path = self.local_path(key)
+        if path:
+            yield path
+            return
+        suffix = os.path.splitext(key)[1]
+        source = self.open_stream(key)
+        try:
+            with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
+                shutil.copyfileobj(source, tmp, COPY_CHUNK_SIZE)
+        finally:
+            source.close()
+        try:
+            yield tmp.name
+        finally:
+            os.remove(tmp.name)
+
+
+class LocalBlobStore(BlobStore):
+    """Blob store backed by a directory on the local filesystem."""
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        path = os.path.abspath(os.path.join(self.root, *key.split('/')))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"Invalid blob key: {key}")
+        return path
+
+    def put_stream(self, key, stream, content_type=None):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as target:
+            shutil.copyfileobj(stream, target, COPY_CHUNK_SIZE)
+        os.replace(tmp_path, path)
+
+    def open_stream(self, key):
+        return open(self._path(key), 'rb')
+
+    def stat(self, key):
+        try:
+            st = os.stat(self._path(key))
+        except FileNotFoundError:
+            return None
+        return st.st_size, _utc(datetime.fromtimestamp(st.st_mtime, timezone.utc))
+
+    def delete(self, key):
+        path = self._path(key)
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+            return size
+        except FileNotFoundError:
+            return 0
+
+    def iter_keys(self, prefix=''):
+        start = self._path(prefix) if prefix else self.root
+        for dirpath, _, files in os.walk(start):
+            for name in sorted(files):
+                if name.endswith('.tmp'):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                key = os.path.relpath(path, self.root).replace(os.sep, '/')
+                yield key, st.st_size, _utc(datetime.fromtimestamp(st.st_mtime, timezone.utc))
+
+    def local_path(self, key):
+        path = self._path(key)
+        return path if os.path.exists(path) else None
+
+
+class S3BlobStore(BlobStore):
+    """Blob store backed by an S3-compatible bucket (AWS S3, MinIO, ...)."""
+
+    def __init__(self, bucket: str, endpoint_url: Optional[str] = None, region: Optional[str] = None,
+                 access_key: Optional[str] = None, secret_key: Optional[str] = None,
+                 presign_expiry: int = 3600, redirect: bool = True):
+        try:
+            import boto3
+            from botocore.exceptions import ClientError
+        except ImportError as e:
+            raise RuntimeError("boto3 is required for the s3 storage backend") from e
+        self._client_error = ClientError
+        self.bucket = bucket
+        self.presign_expiry = presign_expiry
+        self.redirect = redirect
+        self.client = boto3.client(
+            's3',
+            endpoint_url=endpoint_url or None,
+            region_name=region or None,
+            aws_access_key_id=access_key,
+            aws_secret_access_key=secret_key,
+        )
+        logger.info(f"S3 blob store initialized for bucket {bucket} at {endpoint_url or 'AWS'}")
+
+    def _is_missing(self, error) -> bool:
+        return error.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound')
+
+    def put_stream(self, key, stream, content_type=None):
+        extra_args = {'ContentType': content_type} if content_type else None
+        # upload_fileobj switches to multipart uploads for large bodies
+        self.client.upload_fileobj(stream, self.bucket, key, ExtraArgs=extra_args)
+
+    def open_stream(self, key):
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=key)['Body']
+        except self._client_error as e:
+            if self._is_missing(e):
+                raise FileNotFoundError(key) from e
+            raise
+
+    def stat(self, key):
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=key)
+        except self._client_error as e:
+            if self._is_missing(e):
+                return None
+            raise
+        return head['ContentLength'], _utc(head['LastModified'])
+
+    def delete(self, key):
+        stat = self.stat(key)
+        if not stat:
+            return 0
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+        return stat[0]
+
+    def iter_keys(self, prefix=''):
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            for obj in page.get('Contents', []):
+                yield obj['Key'], obj['Size'], _utc(obj['LastModified'])
+
+    def presigned_url(self, key):
+        if not self.redirect:
+            return None
+        return self.client.generate_presigned_url(
+            'get_object', Params={'Bucket': self.bucket, 'Key': key}, ExpiresIn=self.presign_expiry
+        )
+
+
+def build_blob_store(storage_config: dict, local_root: str) -> BlobStore:
+    """Create the blob store selected by the ``storage`` section of config.yaml."""
+    backend = (os.getenv('STORAGE_BACKEND') or storage_config.get('backend', 'local')).lower()
+    if backend == 'local':
+        return LocalBlobStore(local_root)
+    if backend == 's3':
+        s3_config = storage_config.get('s3', {})
+        return S3BlobStore(
+            bucket=os.getenv('S3_BUCKET') or s3_config['bucket'],
+            endpoint_url=os.getenv('S3_ENDPOINT_URL') or s3_config.get('endpoint_url'),
+            region=s3_config.get('region'),
+            access_key=os.getenv('S3_ACCESS_KEY_ID'),
+            secret_key=os.getenv('S3_SECRET_ACCESS_KEY'),
+            presign_expiry=s3_config.get('presign_expiry', 3600),
+            redirect=s3_config.get('redirect', True),
+        )
+    raise ValueError(f"Unknown storage backend: {backend}")
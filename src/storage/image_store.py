@@ -0,0 +1,147 @@
+import os
+import io
+import yaml
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Optional, Dict, List, Tuple
+
+from PIL import Image, ImageOps
+from werkzeug.utils import secure_filename
+
+from loggers.custom_logger import get_logger
+from storage.blob_store import BlobStore
+
+logger = get_logger(__name__)
+
+BASE_URL = os.path.join(os.path.dirname(__file__), '..')
+CONFIG_PATH = os.path.join(BASE_URL, 'constants', 'config.yaml')
+
+with open(CONFIG_PATH, 'r') as file:
+    config = yaml.safe_load(file)
+    image_config = config['upload'].get('images', {})
+    VARIANT_SIZES: Dict[str, int] = image_config.get('variants', {'thumb': 256, 'display': 1280})
+    VARIANT_QUALITY = image_config.get('jpeg_quality', 82)
+    VARIANT_WORKERS = image_config.get('variant_workers', 2)
+
+
+class ImageStore:
+    """Upload storage with a sharded layout and pre-rendered resized variants.
+
+    Originals live at ``originals/<ab>/<cd>/<filename>`` and variants at
+    ``variants/<variant>/<ab>/<cd>/<stem>.jpg``, where ``ab``/``cd`` are the
+    first characters of the uuid filename. Files written before the sharded
+    layout existed are still found at the top level of the store.
+    """
+
+    def __init__(self, blob_store: BlobStore, variant_sizes: Dict[str, int] = VARIANT_SIZES):
+        self.blobs = blob_store
+        self.variant_sizes = variant_sizes
+        self._executor = ThreadPoolExecutor(max_workers=VARIANT_WORKERS, thread_name_prefix="image-variants")
+
+    @staticmethod
+    def _validate_filename(filename: str) -> str:
+        if not filename or secure_filename(filename) != filename:
+            raise ValueError(f"Invalid image filename: {filename}")
+        return filename
+
+    @staticmethod
+    def _shard(filename: str) -> List[str]:
+        stem = os.path.splitext(filename)[0]
+        return [stem[:2] or '_', stem[2:4] or '_']
+
+    @staticmethod
+    def filename_from_key(key: str) -> str:
+        """Map any original, variant or legacy key back to the upload filename stem."""
+        return os.path.splitext(key.rsplit('/', 1)[-1])[0]
+
+    def original_key(self, filename: str) -> str:
+        filename = self._validate_filename(filename)
+        return '/'.join(['originals', *self._shard(filename), filename])
+
+    def variant_key(self, filename: str, variant: str) -> str:
+        filename = self._validate_filename(filename)
+        if variant not in self.variant_sizes:
+            raise ValueError(f"Unknown image variant: {variant}")
+        stem = os.path.splitext(filename)[0]
+        return '/'.join(['variants', variant, *self._shard(filename), f"{stem}.jpg"])
+
+    def _legacy_key(self, filename: str) -> str:
+        return self._validate_filename(filename)
+
+    def save_upload(self, file_storage, filename: str) -> str:
+        """Stream an uploaded file to its sharded location and return its key."""
+        key = self.original_key(filename)
+        self.blobs.put_stream(key, file_storage.stream, file_storage.mimetype)
+        logger.debug("Saved original image %s to %s", filename, key)
+        return key
+
+    def locate(self, filename: str, variant: Optional[str] = None) -> Tuple[Optional[str], Optional[str]]:
+        """Return ``(key, served_variant)`` for ``filename``.
+
+        Falls back to the original (``served_variant == 'original'``) while a
+        requested variant is still being rendered.
+        """
+        if variant:
+            key = self.variant_key(filename, variant)
+            if self.blobs.exists(key):
+                return key, variant
+        for key in (self.original_key(filename), self._legacy_key(filename)):
+            if self.blobs.exists(key):
+                return key, 'original'
+        return None, None
+
+    @contextmanager
+    def local_original(self, filename: str):
+        """Yield a local path to the original image, e.g. for sending it to Gemini."""
+        key, _ = self.locate(filename)
+        if not key:
+            raise FileNotFoundError(f"Image not found: {filename}")
+        with self.blobs.local_copy(key) as path:
+            yield path
+
+    def generate_variants(self, filename: str) -> None:
+        """Render every configured variant of ``filename``."""
+        source_key, _ = self.locate(filename)
+        if not source_key:
+            logger.warning(f"Cannot render variants, original missing: {filename}")
+            return
+        try:
+            source = self.blobs.open_stream(source_key)
+            try:
+                data = io.BytesIO(source.read())
+            finally:
+                source.close()
+            with Image.open(data) as img:
+                img = ImageOps.exif_transpose(img).convert('RGB')
+                for variant, max_side in sorted(self.variant_sizes.items(), key=lambda kv: -kv[1]):
+                    resized = img.copy()
+                    resized.thumbnail((max_side, max_side), Image.LANCZOS)
+                    buffer = io.BytesIO()
+                    resized.save(buffer, format='JPEG', quality=VARIANT_QUALITY, optimize=True, progressive=True)
+                    buffer.seek(0)
+                    self.blobs.put_stream(self.variant_key(filename, variant), buffer, 'image/jpeg')
+            logger.info(f"Rendered variants {sorted(self.variant_sizes)} for {filename}")
+        except Exception as e:
+            logger.error(f"Failed to render variants for {filename}: {e}")
+
+    def generate_variants_async(self, filename: str):
+        """Render variants on the background pool so the upload request does not wait for them."""
+        return self._executor.submit(self.generate_variants, filename)
+
+    def delete(self, filename: str) -> int:
+        """Remove the original and all variants; returns the number of bytes freed."""
+        keys = [self.original_key(filename), self._legacy_key(filename)]
+        keys.extend(self.variant_key(filename, variant) for variant in self.variant_sizes)
+        freed = sum(self.blobs.delete(key) for key in keys)
+        if freed:
+            logger.info(f"Deleted image {filename} and its variants ({freed} bytes)")
+        return freed
+
+    def delete_many(self, filenames) -> int:
+        freed = 0
+        for filename in filenames:
+            try:
+                freed += self.delete(filename)
+            except Exception as e:
+                logger.error(f"Failed to delete image {filename}: {e}")
+        return freed
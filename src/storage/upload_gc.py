@@ -0,0 +1,109 @@
+import os
+import time
+import yaml
+import mysql.connector
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+
+from loggers.custom_logger import get_logger
+from storage.image_store import ImageStore
+
+logger = get_logger(__name__)
+
+BASE_URL = os.path.join(os.path.dirname(__file__), '..')
+CONFIG_PATH = os.path.join(BASE_URL, 'constants', 'config.yaml')
+
+with open(CONFIG_PATH, 'r') as file:
+    config = yaml.safe_load(file)
+    gc_config = config.get('storage', {}).get('gc', {})
+    GC_GRACE_HOURS = gc_config.get('grace_hours', 24)
+    GC_BATCH_SIZE = gc_config.get('batch_size', 500)
+    GC_DRY_RUN = gc_config.get('dry_run', False)
+    ALLOWED_EXTENSIONS = config['upload']['allowed_extensions']
+    STOCK_IMAGES_TABLE = config['database']['tables']['stockimages']
+    RECEIPT_IMAGES_TABLE = config['database']['tables']['receiptsimages']
+
+
+class UploadGarbageCollector:
+    """Deletes uploaded images (originals and variants) no longer referenced by any image row.
+
+    The store is listed in batches of ``batch_size`` keys and each batch is
+    checked against ``receiptimages``/``stockimages`` with one query, so memory
+    stays bounded however large the store grows. Files younger than the grace
+    period are never touched, which protects uploads whose rows are not yet
+    committed.
+    """
+
+    def __init__(self, image_store: ImageStore, db_config: Dict, grace_hours: float = GC_GRACE_HOURS,
+                 batch_size: int = GC_BATCH_SIZE, dry_run: bool = GC_DRY_RUN):
+        self.image_store = image_store
+        self.db_config = db_config
+        self.grace_period = timedelta(hours=grace_hours)
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+
+    def _referenced_stems(self, cursor, stems: List[str]) -> set:
+        candidates = [f"{stem}{ext}" for stem in stems for ext in ALLOWED_EXTENSIONS]
+        placeholders = ", ".join(["%s"] * len(candidates))
+        cursor.execute(
+            f"SELECT image_path FROM {RECEIPT_IMAGES_TABLE} WHERE image_path IN ({placeholders}) "
+            f"UNION SELECT image_path FROM {STOCK_IMAGES_TABLE} WHERE image_path IN ({placeholders})",
+            candidates + candidates
+        )
+        return {os.path.splitext(row[0])[0] for row in cursor.fetchall()}
+
+    def _collect_batch(self, cursor, batch: List[Tuple[str, int, datetime]], stats: Dict) -> None:
+        stems = sorted({ImageStore.filename_from_key(key) for key, _, _ in batch})
+        referenced = self._referenced_stems(cursor, stems)
+        cutoff = datetime.utcnow() - self.grace_period
+        for key, size, modified in batch:
+            if ImageStore.filename_from_key(key) in referenced:
+                continue
+            if modified > cutoff:
+                stats['skipped_recent'] += 1
+                continue
+            stats['orphans'] += 1
+            if self.dry_run:
+                logger.info(f"[dry-run] Would delete orphaned upload {key} ({size} bytes)")
+                stats['reclaimable_bytes'] += size
+            else:
+                stats['reclaimed_bytes'] += self.image_store.blobs.delete(key)
+
+    def run(self) -> Dict:
+        """Run one collection pass and return its statistics."""
+        started = time.perf_counter()
+        stats = {'scanned': 0, 'orphans': 0, 'skipped_recent': 0,
+                 'reclaimed_bytes': 0, 'reclaimable_bytes': 0, 'dry_run': self.dry_run}
+        conn = None
+        cursor = None
+        try:
+            conn = mysql.connector.connect(**self.db_config)
+            cursor = conn.cursor()
+            batch = []
+            for entry in self.image_store.blobs.iter_keys():
+                batch.append(entry)
+                if len(batch) >= self.batch_size:
+                    stats['scanned'] += len(batch)
+                    self._collect_batch(cursor, batch, stats)
+                    batch = []
+            if batch:
+                stats['scanned'] += len(batch)
+                self._collect_batch(cursor, batch, stats)
+        except mysql.connector.Error as e:
+            logger.error(f"Upload GC aborted by database error: {e}")
+            raise RuntimeError(f"Upload GC failed: {e}")
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                conn.close()
+
+        stats['duration_s'] = round(time.perf_counter() - started, 2)
+        logger.info(
+            f"Upload GC{' (dry run)' if self.dry_run else ''}: scanned {stats['scanned']} files, "
+            f"{stats['orphans']} orphans, {stats['skipped_recent']} within grace period, "
+            f"reclaimed {stats['reclaimed_bytes']} bytes"
+            + (f", {stats['reclaimable_bytes']} bytes reclaimable" if self.dry_run else "")
+            + f" in {stats['duration_s']}s"
+        )
+        return stats